@@ -1,3 +1,6 @@
+import time
+STARTED_AT = time.perf_counter()
+
 from talelle_setup import Path, TALELLE_DIR, config_log
 TALELLE_TOOL = Path(__file__).stem
 config_log(TALELLE_TOOL)
@@ -6,47 +9,357 @@ import sys
 import os
 import subprocess
 import json
+import math
+import multiprocessing
+from functools import cache
+from urllib.error import HTTPError, URLError
 
-import placement
+# the render engine (ffmpeg, numpy, the pipelines) is imported on first use, it is not needed to show the window
+import thumbnails
 import logging
 
+from collections import OrderedDict
+
 from PySide6.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel,
-                               QLineEdit, QFileDialog, QComboBox, QMessageBox, QProgressBar)
-from PySide6.QtCore import Qt, QThread, Signal
-from PySide6.QtGui import QPixmap
+                               QLineEdit, QFileDialog, QComboBox, QMessageBox, QProgressBar, QListView)
+from PySide6.QtCore import (Qt, QThread, Signal, QObject, QRunnable, QThreadPool, QAbstractListModel, QModelIndex,
+                            QSize, QTimer)
+from PySide6.QtGui import QPixmap, QImage, QColor
 
 logger = logging.getLogger(__name__)
 logger.info(f'{TALELLE_TOOL} started')
 
+# benchmarks/bench_startup.py sets this to a JSON file, the app writes its startup timing there and quits
+STARTUP_REPORT_ENV = 'TALELLE_STARTUP_REPORT'
+# none of these should be loaded before the first render
+ENGINE_MODULES = ('ffmpeg', 'numpy', 'placement', 'compositor', 'render_daemon', 'PIL')
+
 
 class MP4CreatorThread(QThread):
     creationStarted = Signal()
     progressUpdated = Signal(int, str)
+    telemetryUpdated = Signal(object)
     creationFinished = Signal()
+    creationCancelled = Signal()
+    creationFailed = Signal(str)
 
-    def __init__(self, image_directory, audio_file, slideshow_path):
+    def __init__(self, image_directory, audio_file, slideshow_path, render_options=None, daemon_url=None):
         super().__init__()
         self.image_directory = image_directory
         self.audio_file = audio_file
         self.slideshow_path = slideshow_path
+        self.render_options = render_options or {}
+        self.daemon_url = daemon_url
+        self.daemon_job_id = None
+        import render_control
+        self.control = render_control.RenderControl()
 
     def run(self):
+        import placement
+        import render_control
+
         self.creationStarted.emit()
-        placement.create_slideshow(self.image_directory, self.audio_file, self.slideshow_path, self.update_progress)
+        try:
+            if not (self.daemon_url and self.render_with_daemon()):
+                placement.create_slideshow(self.image_directory, self.audio_file, self.slideshow_path,
+                                           self.update_progress, event_callback=self.update_telemetry,
+                                           control=self.control, **self.render_options)
+        except render_control.RenderCancelled:
+            self.creationCancelled.emit()
+            return
+        except Exception as e:
+            logger.exception(f'Creating {self.slideshow_path} failed')
+            self.creationFailed.emit(str(e))
+            return
         self.creationFinished.emit()
 
+    def render_with_daemon(self):
+        import render_control
+        import render_daemon
+
+        client = render_daemon.RenderClient(self.daemon_url)
+        try:
+            self.daemon_job_id = client.submit(self.image_directory, self.audio_file, self.slideshow_path,
+                                               **self.render_options)
+        except HTTPError as e:
+            # the daemon answered and refused the job, a local render would hide why
+            raise RuntimeError(f'Render daemon at {self.daemon_url} refused the job: '
+                               f'{render_daemon.rejection_message(e)}') from e
+        except URLError as e:
+            logger.warning(f'Render daemon at {self.daemon_url} is not reachable, rendering locally: {e}')
+            return False
+        # once the daemon has the job, losing it is a failure, a local render would run alongside it
+        state = client.follow(self.daemon_job_id, self.update_progress, self.update_telemetry)
+        if state['status'] == render_daemon.STATUS_CANCELLED:
+            raise render_control.RenderCancelled()
+        if state['status'] != render_daemon.STATUS_RENDERED:
+            raise RuntimeError(f"Render of {self.slideshow_path} {state['status']}: {state['error']}")
+        return True
+
+    def cancel(self):
+        # ffmpeg is stopped right away, run() then reports the cancellation once the render has unwound
+        self.control.cancel()
+        if self.daemon_job_id is not None:
+            import render_daemon
+
+            try:
+                render_daemon.RenderClient(self.daemon_url).cancel(self.daemon_job_id)
+            except URLError as e:
+                logger.warning(f'Cancelling the daemon job {self.daemon_job_id} failed: {e}')
+
+    def update_progress(self, value, label=None):
+        self.progressUpdated.emit(value, label)
+
+    def update_telemetry(self, event):
+        self.telemetryUpdated.emit(event)
+
+
+class WatchThread(QThread):
+    statusChanged = Signal(str)
+    progressUpdated = Signal(int, str)
+    telemetryUpdated = Signal(object)
+
+    def __init__(self, job, daemon_url=None):
+        super().__init__()
+        self.daemon_url = daemon_url
+        self.daemon_job_id = None
+        self.control = None
+        import watch
+        self.watcher = watch.ProjectWatcher(job, self.render, status_callback=self.statusChanged.emit)
+
+    def run(self):
+        self.watcher.run()
+
+    def stop(self):
+        self.watcher.stop()
+        self.cancel_render()
+
+    def cancel_render(self):
+        # the watch goes on and renders again on the next change
+        if self.control is not None:
+            self.control.cancel()
+        # read once, the watch thread clears it when the daemon job ends
+        daemon_job_id = self.daemon_job_id
+        if daemon_job_id is not None:
+            import render_daemon
+
+            try:
+                render_daemon.RenderClient(self.daemon_url).cancel(daemon_job_id)
+            except URLError as e:
+                logger.warning(f'Cancelling the daemon job {daemon_job_id} failed: {e}')
+
+    def render(self, job):
+        import placement
+        import render_control
+        import render_daemon
+
+        self.control = render_control.RenderControl()
+        if self.daemon_url:
+            client = render_daemon.RenderClient(self.daemon_url)
+            try:
+                self.daemon_job_id = client.submit(job.images_dir, job.audio_path, job.output_path,
+                                                   **(job.options or {}))
+            except HTTPError as e:
+                raise RuntimeError(f'Render daemon at {self.daemon_url} refused the job: '
+                                   f'{render_daemon.rejection_message(e)}') from e
+            except URLError as e:
+                logger.warning(f'Render daemon at {self.daemon_url} is not reachable, rendering locally: {e}')
+            else:
+                try:
+                    state = client.follow(self.daemon_job_id, self.update_progress, self.telemetryUpdated.emit)
+                finally:
+                    self.daemon_job_id = None
+                if state['status'] == render_daemon.STATUS_CANCELLED:
+                    raise render_control.RenderCancelled()
+                if state['status'] != render_daemon.STATUS_RENDERED:
+                    raise RuntimeError(f"Render of {job.output_path} {state['status']}: {state['error']}")
+                return
+        placement.create_slideshow(job.images_dir, job.audio_path, job.output_path, self.update_progress,
+                                   event_callback=self.telemetryUpdated.emit, control=self.control,
+                                   **(job.options or {}))
+
     def update_progress(self, value, label=None):
         self.progressUpdated.emit(value, label)
 
 
+THUMBNAIL_THREADS = 4
+# decoded thumbnails kept in memory, the rest is reloaded from the disk cache when scrolled back into view
+THUMBNAIL_PIXMAPS = 600
+FOLDER_SCAN_DELAY_MS = 400
+
+
+class ThumbnailSignals(QObject):
+    folderScanned = Signal(int, str, object)
+    folderHashed = Signal(int, object)
+    thumbnailLoaded = Signal(int, int, QImage)
+
+
+class FolderScanTask(QRunnable):
+    def __init__(self, images_directory, generation, signals):
+        super().__init__()
+        self.images_directory = images_directory
+        self.generation = generation
+        self.signals = signals
+
+    def run(self):
+        import sqlite3
+
+        import image_index
+
+        if not os.path.isdir(self.images_directory):
+            self.signals.folderScanned.emit(self.generation, self.images_directory, [])
+            return
+        try:
+            with image_index.ImageIndex(self.images_directory) as index:
+                # the grid fills from the headers, the contents are hashed afterwards
+                index.scan(hash_contents=False)
+                self.signals.folderScanned.emit(self.generation, self.images_directory,
+                                                image_index.sort_images(index.images(valid_only=True)))
+                index.hash_contents()
+                self.signals.folderHashed.emit(self.generation,
+                                               image_index.sort_images(index.images(valid_only=True)))
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f'Scanning {self.images_directory} failed: {e}')
+            self.signals.folderScanned.emit(self.generation, self.images_directory, [])
+        thumbnails.thumbnail_cache().evict()
+
+
+class ThumbnailTask(QRunnable):
+    def __init__(self, image, row, generation, signals, cache):
+        super().__init__()
+        self.image = image
+        self.row = row
+        self.generation = generation
+        self.signals = signals
+        self.cache = cache
+
+    def run(self):
+        try:
+            # a row shown before its contents are hashed is keyed by its path
+            thumbnail_path = thumbnails.cached_thumbnail(self.image.path, self.image.content_hash or self.image.path,
+                                                         self.image.mtime_ns, self.cache)
+            thumbnail = QImage(thumbnail_path)
+        except Exception as e:
+            logger.debug(f'No thumbnail for {self.image.path}: {e}')
+            thumbnail = QImage()
+        self.signals.thumbnailLoaded.emit(self.generation, self.row, thumbnail)
+
+
+class ThumbnailModel(QAbstractListModel):
+    # the view only asks for the rows it shows, so thumbnails are requested as the user scrolls
+    folderLoaded = Signal(int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.images = []
+        self.images_directory = None
+        self.generation = 0
+        self.requests = 0
+        self.pixmaps = OrderedDict()
+        self.requested = set()
+        self.cache = thumbnails.thumbnail_cache()
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(THUMBNAIL_THREADS)
+        self.signals = ThumbnailSignals()
+        self.signals.folderScanned.connect(self.on_folder_scanned)
+        self.signals.folderHashed.connect(self.on_folder_hashed)
+        self.signals.thumbnailLoaded.connect(self.on_thumbnail_loaded)
+        self.placeholder = QPixmap(thumbnails.THUMBNAIL_SIZE, thumbnails.THUMBNAIL_SIZE)
+        self.placeholder.fill(QColor(Qt.GlobalColor.lightGray))
+
+    def shutdown(self):
+        self.generation += 1
+        self.pool.clear()
+        self.pool.waitForDone()
+
+    def load_folder(self, images_directory):
+        # results of an earlier folder still in flight are dropped by their generation
+        self.generation += 1
+        self.pool.clear()
+        self.beginResetModel()
+        self.images = []
+        self.images_directory = None
+        self.pixmaps.clear()
+        self.requested.clear()
+        self.endResetModel()
+        if images_directory:
+            self.pool.start(FolderScanTask(images_directory, self.generation, self.signals))
+
+    def folder_images_count(self, images_directory):
+        if self.images_directory is None or os.path.normpath(images_directory) != self.images_directory:
+            return None
+        return len(self.images)
+
+    def on_folder_scanned(self, generation, images_directory, images):
+        if generation != self.generation:
+            return
+        self.beginResetModel()
+        self.images = images
+        self.images_directory = os.path.normpath(images_directory)
+        self.endResetModel()
+        self.folderLoaded.emit(len(images))
+
+    def on_folder_hashed(self, generation, images):
+        if generation != self.generation:
+            return
+        if [image.path for image in images] == [image.path for image in self.images]:
+            self.images = images
+            return
+        # files changed while they were hashed
+        self.pixmaps.clear()
+        self.requested.clear()
+        self.on_folder_scanned(generation, self.images_directory, images)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.images)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.images):
+            return None
+        if role == Qt.ItemDataRole.DecorationRole:
+            row = index.row()
+            if row in self.pixmaps:
+                self.pixmaps.move_to_end(row)
+                return self.pixmaps[row]
+            self.request_thumbnail(row)
+            return self.placeholder
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return os.path.basename(self.images[index.row()].path)
+        return None
+
+    def request_thumbnail(self, row):
+        if row in self.requested:
+            return
+        self.requested.add(row)
+        self.requests += 1
+        # the latest request runs first, so the rows in view win over the ones scrolled past
+        self.pool.start(ThumbnailTask(self.images[row], row, self.generation, self.signals, self.cache),
+                        self.requests)
+
+    def on_thumbnail_loaded(self, generation, row, thumbnail):
+        if generation != self.generation:
+            return
+        self.pixmaps[row] = self.placeholder if thumbnail.isNull() else QPixmap.fromImage(thumbnail)
+        while len(self.pixmaps) > THUMBNAIL_PIXMAPS:
+            evicted_row, _ = self.pixmaps.popitem(last=False)
+            self.requested.discard(evicted_row)
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+
 class SlideshowCreator(QWidget):
+    firstPainted = Signal(float)
+
     def __init__(self):
         super().__init__()
+        self.first_paint_s = None
         settings = self.load_settings()
         self.current_language = self.get_language(settings)
         self.translations = self.load_translations(self.current_language)
         self.project_path, self.project_folder = self.get_project_path(settings)
         self.images_folder = self.get_images_folder(settings)
+        self.render_options = self.get_render_options(settings)
+        self.render_daemon_url = settings.get('renderDaemon')
 
         # declare QComponent groups
         self.locale_subjects = dict()
@@ -60,8 +373,16 @@ class SlideshowCreator(QWidget):
         self.audioFileLineEdit = None
         self.outputFileLineEdit = None
         self.processButton = None
+        self.draftButton = None
+        self.watchButton = None
+        self.cancelButton = None
+        self.mp4Thread = None
+        self.watchThread = None
+        self.draft = False
         self.progressStatus = None
         self.progressBar = None
+        self.imagesCountLabel = None
+        self.thumbnailModel = None
 
 
         self.setup_ui()
@@ -78,6 +399,8 @@ class SlideshowCreator(QWidget):
             'projectPath': self.project_path,
             'projectFolder': self.project_folder,
             'imagesFolder': self.images_folder,
+            'renderOptions': self.render_options,
+            'renderDaemon': self.render_daemon_url,
         }
         try:
             with open(self.get_settings_file(), 'w') as f:
@@ -106,6 +429,10 @@ class SlideshowCreator(QWidget):
     def get_images_folder(settings) -> str:
         return settings.get('imagesFolder', 'images')
 
+    @staticmethod
+    def get_render_options(settings) -> dict:
+        return settings.get('renderOptions', {})
+
     def apply_settings(self, settings):
         self.langComboBox.setCurrentText(self.current_language)
 
@@ -116,7 +443,9 @@ class SlideshowCreator(QWidget):
     def get_language(settings):
         return settings.get('language', 'English')
 
+    # the locale files are read once, switching languages back and forth reuses them
     @staticmethod
+    @cache
     def load_language_codes():
         path = 'locales/language_codes.json'
         with open(path, 'r', encoding='utf-8') as f:
@@ -128,6 +457,7 @@ class SlideshowCreator(QWidget):
         return list(language_codes.keys())
 
     @classmethod
+    @cache
     def load_translations(cls, language_name):
         language_codes = cls.load_language_codes()
         language_code = language_codes.get(language_name, "en")
@@ -186,6 +516,27 @@ class SlideshowCreator(QWidget):
         dirImagesLayout.addWidget(dirImagesButton)
         layout.addLayout(dirImagesLayout)
 
+        # Images preview, scanned and filled in the background
+        imagesCountLabel = QLabel('')
+        layout.addWidget(imagesCountLabel)
+        thumbnailModel = ThumbnailModel(self)
+        thumbnailModel.folderLoaded.connect(self.on_images_folder_loaded)
+        thumbnailView = QListView()
+        thumbnailView.setViewMode(QListView.ViewMode.IconMode)
+        thumbnailView.setIconSize(QSize(thumbnails.THUMBNAIL_SIZE, thumbnails.THUMBNAIL_SIZE))
+        thumbnailView.setGridSize(QSize(thumbnails.THUMBNAIL_SIZE + 8, thumbnails.THUMBNAIL_SIZE + 8))
+        thumbnailView.setUniformItemSizes(True)
+        thumbnailView.setResizeMode(QListView.ResizeMode.Adjust)
+        thumbnailView.setMovement(QListView.Movement.Static)
+        thumbnailView.setMinimumHeight(2 * thumbnails.THUMBNAIL_SIZE + 24)
+        thumbnailView.setModel(thumbnailModel)
+        layout.addWidget(thumbnailView)
+        folderScanTimer = QTimer(self)
+        folderScanTimer.setSingleShot(True)
+        folderScanTimer.setInterval(FOLDER_SCAN_DELAY_MS)
+        folderScanTimer.timeout.connect(self.load_images_preview)
+        dirImagesLineEdit.textChanged.connect(folderScanTimer.start)
+
         # Audio file selection
         audioFileLabel = QLabel()
         audioFileLineEdit = QLineEdit()
@@ -209,10 +560,23 @@ class SlideshowCreator(QWidget):
         outputFileLayout.addWidget(outputFileButton)
         layout.addLayout(outputFileLayout)
 
-        # Process button
+        # Process buttons
         processButton = QPushButton(self.translate_key('process_button'))
         processButton.clicked.connect(self.create_slideshow)
-        layout.addWidget(processButton)
+        draftButton = QPushButton(self.translate_key('draft_button'))
+        draftButton.clicked.connect(self.create_draft)
+        watchButton = QPushButton(self.translate_key('watch_button'))
+        watchButton.setCheckable(True)
+        watchButton.toggled.connect(self.toggle_watch)
+        processLayout = QHBoxLayout()
+        processLayout.addWidget(processButton, stretch=3)
+        processLayout.addWidget(draftButton, stretch=1)
+        processLayout.addWidget(watchButton, stretch=1)
+        cancelButton = QPushButton(self.translate_key('cancel_button'))
+        cancelButton.setEnabled(False)
+        cancelButton.clicked.connect(self.cancel_creation)
+        processLayout.addWidget(cancelButton, stretch=1)
+        layout.addLayout(processLayout)
 
         # Progress Bar
         progressLabel = QLabel('')
@@ -233,12 +597,16 @@ class SlideshowCreator(QWidget):
         self.locale_subjects['output_mp4_label'] = outputFileLabel
         self.locale_subjects['create_mp4_button'] = outputFileButton
         self.locale_subjects['process_button'] = processButton
+        self.locale_subjects['draft_button'] = draftButton
+        self.locale_subjects['watch_button'] = watchButton
+        self.locale_subjects['cancel_button'] = cancelButton
 
         self.direction_subjects.append(langLayout)
         self.direction_subjects.append(projLayout)
         self.direction_subjects.append(dirImagesLayout)
         self.direction_subjects.append(audioFileLayout)
         self.direction_subjects.append(outputFileLayout)
+        self.direction_subjects.append(processLayout)
 
         self.langComboBox = langComboBox
         self.projLabel = projLabel
@@ -247,9 +615,14 @@ class SlideshowCreator(QWidget):
         self.audioFileLineEdit = audioFileLineEdit
         self.outputFileLineEdit = outputFileLineEdit
         self.processButton = processButton
+        self.draftButton = draftButton
+        self.watchButton = watchButton
+        self.cancelButton = cancelButton
         self.progressLabel = progressLabel
         self.progressStatus = progressStatus
         self.progressBar = progressBar
+        self.imagesCountLabel = imagesCountLabel
+        self.thumbnailModel = thumbnailModel
 
 
 
@@ -258,24 +631,22 @@ class SlideshowCreator(QWidget):
     def reset_progress(self):
         self.set_progress_status('')
         self.progressBar.setValue(0)
+        self.progressBar.setFormat('%p%')
 
     def choose_project(self):
         proj_path = QFileDialog.getExistingDirectory(self,
                                                      self.translate_key('choose_project'),
                                                      dir=self.projLineEdit.text())
         if proj_path:
+            import slideshow_batch
+
             proj_path = os.path.normpath(proj_path)
             self.projLineEdit.setText(proj_path)
 
-            images_path = os.path.join(proj_path, self.images_folder)
+            images_path, audio_path, output_path = slideshow_batch.project_files(proj_path, self.images_folder)
             self.dirImagesLineEdit.setText(images_path)
-
-            proj_name = os.path.basename(proj_path)
-            proj_parent_name = os.path.basename(os.path.dirname(proj_path))
-            file_name = f'{proj_parent_name}_{proj_name}'
-            file_path = os.path.join(proj_path, file_name)
-            self.audioFileLineEdit.setText(f'{file_path}.mp3')
-            self.outputFileLineEdit.setText(f'{file_path}.mp4')
+            self.audioFileLineEdit.setText(audio_path)
+            self.outputFileLineEdit.setText(output_path)
 
         self.reset_progress()
 
@@ -330,6 +701,8 @@ class SlideshowCreator(QWidget):
 
         if self.progressStatus:
             self.progressLabel.setText(self.translate_key(self.progressStatus))
+        if self.thumbnailModel.images_directory is not None:
+            self.on_images_folder_loaded(len(self.thumbnailModel.images))
 
         for locale_key in self.locale_subjects:
             self.locale_subjects[locale_key].setText(self.translate_key(locale_key))
@@ -340,49 +713,139 @@ class SlideshowCreator(QWidget):
             direction_subject.setDirection(QHBoxLayout.Direction.RightToLeft if is_rtl else QHBoxLayout.Direction.LeftToRight)
 
     def create_slideshow(self):
+        self.start_creation(draft=False)
+
+    def create_draft(self):
+        self.start_creation(draft=True)
+
+    @staticmethod
+    def get_draft_path(slideshow_path):
+        return f'{os.path.splitext(slideshow_path)[0]}_draft.mp4'
+
+    def closeEvent(self, event):
+        if self.mp4Thread is not None and self.mp4Thread.isRunning():
+            self.mp4Thread.cancel()
+            self.mp4Thread.wait()
+        self.stop_watch(wait=True)
+        self.thumbnailModel.shutdown()
+        super().closeEvent(event)
+
+    def load_images_preview(self):
+        self.imagesCountLabel.setText('')
+        self.thumbnailModel.load_folder(self.dirImagesLineEdit.text())
+
+    def on_images_folder_loaded(self, images_count):
+        self.imagesCountLabel.setText(self.translate_key('images_count').format(count=images_count))
+
+    def validate_inputs(self):
         if not os.path.isdir(self.dirImagesLineEdit.text()):
             QMessageBox.warning(self, self.translate_key('error_title'), self.translate_key('directory_not_found'))
-            return
+            return False
 
-        images = [
-            filename for
-            filename in os.listdir(self.dirImagesLineEdit.text()) if
-            filename.lower().endswith(('png', 'jpg', 'jpeg', 'gif', 'bmp'))
-        ]
-        images_count = len(images)
-
-        if not images_count:
+        # a folder the preview has not listed yet is checked by the render itself, not scanned on the GUI thread
+        images_count = self.thumbnailModel.folder_images_count(self.dirImagesLineEdit.text())
+        if images_count == 0:
             QMessageBox.warning(self, self.translate_key('error_title'), self.translate_key('no_images_found'))
-            return
-
-        if images_count > 50:
-            QMessageBox.warning(self, self.translate_key('error_title'), self.translate_key('max_images_exceed'))
-            return
+            return False
 
         if not os.path.isfile(self.audioFileLineEdit.text()) or not self.audioFileLineEdit.text().endswith('mp3'):
             QMessageBox.warning(self, self.translate_key('error_title'), self.translate_key('audio_not_found'))
-            return
+            return False
 
         if not self.outputFileLineEdit.text() or not self.outputFileLineEdit.text().endswith('mp4'):
             QMessageBox.warning(self, self.translate_key('error_title'), self.translate_key('output_path_not_found'))
+            return False
+        return True
+
+    def start_creation(self, draft):
+        if not self.validate_inputs():
             return
 
         image_directory = self.dirImagesLineEdit.text()
         audio_file = self.audioFileLineEdit.text()
         slideshow_path = self.outputFileLineEdit.text()
+        render_options = self.render_options
+        self.draft = draft
+        if draft:
+            # the draft goes next to the output so it never overwrites a final render
+            slideshow_path = self.get_draft_path(slideshow_path)
+            render_options = {**render_options, 'draft': True}
 
         try:
-            self.mp4Thread = MP4CreatorThread(image_directory, audio_file, slideshow_path)
+            self.mp4Thread = MP4CreatorThread(image_directory, audio_file, slideshow_path, render_options,
+                                              self.render_daemon_url)
             self.mp4Thread.creationStarted.connect(self.on_slideshow_creation_started)
             self.mp4Thread.progressUpdated.connect(self.update_progress_bar)
+            self.mp4Thread.telemetryUpdated.connect(self.update_progress_telemetry)
             self.mp4Thread.creationFinished.connect(self.on_slideshow_creation_finished)
+            self.mp4Thread.creationCancelled.connect(self.on_slideshow_creation_cancelled)
+            self.mp4Thread.creationFailed.connect(self.on_slideshow_creation_failed)
             self.mp4Thread.start()
         except Exception as e:
             error_message = f"{self.translate_key('video_creation_failed')} {str(e)}"
             QMessageBox.warning(self, self.translate_key('error_title'), error_message)
 
+    def toggle_watch(self, checked):
+        if not checked:
+            self.stop_watch()
+            return
+        if not self.validate_inputs():
+            self.watchButton.setChecked(False)
+            return
+
+        import slideshow_batch
+
+        job = slideshow_batch.RenderJob(self.dirImagesLineEdit.text(), self.audioFileLineEdit.text(),
+                                        self.outputFileLineEdit.text(), self.render_options)
+        self.save_settings(self.current_language)
+        self.processButton.setEnabled(False)
+        self.draftButton.setEnabled(False)
+        self.watchThread = WatchThread(job, self.render_daemon_url)
+        self.watchThread.statusChanged.connect(self.on_watch_status)
+        self.watchThread.progressUpdated.connect(self.update_progress_bar)
+        self.watchThread.telemetryUpdated.connect(self.update_progress_telemetry)
+        self.watchThread.finished.connect(self.on_watch_finished)
+        self.watchThread.start()
+
+    def stop_watch(self, wait=False):
+        if self.watchThread is None:
+            return
+        self.watchThread.stop()
+        if wait:
+            self.watchThread.wait()
+
+    def on_watch_finished(self):
+        self.watchThread = None
+        self.watchButton.setChecked(False)
+        self.enable_creation()
+        self.reset_progress()
+
+    def on_watch_status(self, status):
+        # renders while watching report in the status line instead of a message box each time
+        if status == 'creation':
+            self.progressBar.setValue(0)
+        self.cancelButton.setEnabled(status == 'creation')
+        self.set_progress_status(status)
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.first_paint_s is None:
+            self.first_paint_s = time.perf_counter() - STARTED_AT
+            logger.info(f'First paint {self.first_paint_s * 1000:.0f} ms after start')
+            self.firstPainted.emit(self.first_paint_s)
+
+    def cancel_creation(self):
+        self.cancelButton.setEnabled(False)
+        if self.mp4Thread is not None and self.mp4Thread.isRunning():
+            self.mp4Thread.cancel()
+        elif self.watchThread is not None:
+            self.watchThread.cancel_render()
+
     def on_slideshow_creation_started(self):
         self.processButton.setEnabled(False)
+        self.draftButton.setEnabled(False)
+        self.watchButton.setEnabled(False)
+        self.cancelButton.setEnabled(True)
         self.save_settings(self.current_language)
         self.set_progress_status('creation')
 
@@ -395,13 +858,48 @@ class SlideshowCreator(QWidget):
             self.set_progress_status(label)
         self.progressBar.setValue(value)
 
+    def update_progress_telemetry(self, event):
+        if event.ended or event.speed is None or event.eta is None:
+            self.progressBar.setFormat('%p%')
+            return
+        self.progressBar.setFormat(
+            self.translate_key('progress_telemetry').format(speed=event.speed, eta=math.ceil(event.eta))
+        )
+
     def on_slideshow_creation_finished(self):
         self.set_progress_status('finished')
+        self.enable_creation()
+        message = self.translate_key('draft_success_message' if self.draft else 'success_message')
+        QMessageBox.information(self, self.translate_key('success_title'), message, QMessageBox.StandardButton.Ok)
+
+    def on_slideshow_creation_cancelled(self):
+        self.enable_creation()
+        self.reset_progress()
+        self.set_progress_status('cancelled')
+
+    def on_slideshow_creation_failed(self, error):
+        self.enable_creation()
+        self.reset_progress()
+        error_message = f"{self.translate_key('video_creation_failed')} {error}"
+        QMessageBox.warning(self, self.translate_key('error_title'), error_message)
+
+    def enable_creation(self):
         self.processButton.setEnabled(True)
-        QMessageBox.information(self, self.translate_key('success_title'), self.translate_key('success_message'),
-                                QMessageBox.StandardButton.Ok)
+        self.draftButton.setEnabled(True)
+        self.watchButton.setEnabled(True)
+        self.cancelButton.setEnabled(False)
+
+
+def write_startup_report(report_path, first_paint_s):
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({'first_paint_s': round(first_paint_s, 4), 'modules': len(sys.modules),
+                   'engine_modules': sorted(name for name in ENGINE_MODULES if name in sys.modules)}, f)
+    QTimer.singleShot(0, QApplication.quit)
+
 
 if __name__ == '__main__':
+    # the pre-normalization and compositor workers of a frozen build start this executable again, this runs them
+    multiprocessing.freeze_support()
     if hasattr(sys, '_MEIPASS'):
         os.chdir(sys._MEIPASS)
 
@@ -414,5 +912,7 @@ if __name__ == '__main__':
 
     app = QApplication(sys.argv)
     window = SlideshowCreator()
+    if startup_report_path := os.environ.get(STARTUP_REPORT_ENV):
+        window.firstPainted.connect(lambda first_paint_s: write_startup_report(startup_report_path, first_paint_s))
     window.show()
     sys.exit(app.exec())
@@ -0,0 +1,116 @@
+import contextlib
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+import ffmpeg
+
+import render_control
+from frame_cache import file_digest
+from talelle_setup import TALELLE_DIR
+
+logger = logging.getLogger(__name__)
+
+AUDIO_CACHE_DIR = os.path.join(TALELLE_DIR, 'audio_cache')
+AUDIO_CACHE_MAX_BYTES = 1024 ** 3
+# a transcode used this recently may be about to be muxed by another render, it is never evicted
+AUDIO_CACHE_RECENT_S = 3600
+TRANSCODE_EXT = '.m4a'
+PARTIAL_SUFFIX = '.partial' + TRANSCODE_EXT
+
+AUDIO_AAC = 'aac'
+AUDIO_COPY = 'copy'
+# codecs an mp4 container can carry as they are
+MP4_AUDIO_CODECS = ('aac', 'mp3', 'alac', 'opus')
+
+
+class AudioSource(NamedTuple):
+    path: str
+    duration: float
+    codec: str
+    content_hash: str
+
+
+def probe_audio(audio_path: str) -> AudioSource:
+    content_hash = file_digest(audio_path)
+    info_path = os.path.join(AUDIO_CACHE_DIR, f'{content_hash}.json')
+    try:
+        with open(info_path, 'r', encoding='utf-8') as f:
+            info = json.load(f)
+        logger.debug(f'Audio info of {audio_path} found in cache')
+    except (FileNotFoundError, json.JSONDecodeError):
+        probe_info = ffmpeg.probe(audio_path)
+        audio_stream = next(stream for stream in probe_info['streams'] if stream['codec_type'] == 'audio')
+        info = {'duration': float(probe_info['format']['duration']), 'codec': audio_stream['codec_name']}
+        os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+        with open(info_path, 'w', encoding='utf-8') as f:
+            json.dump(info, f)
+    return AudioSource(audio_path, info['duration'], info['codec'], content_hash)
+
+
+def evict_audio_cache(keep: str, max_bytes: int = AUDIO_CACHE_MAX_BYTES) -> int:
+    # the least recently used transcodes go first, partial files belong to transcodes still running
+    entries = []
+    for entry in os.scandir(AUDIO_CACHE_DIR):
+        if entry.name.endswith(TRANSCODE_EXT) and not entry.name.endswith(PARTIAL_SUFFIX):
+            with contextlib.suppress(FileNotFoundError):
+                entries.append((entry.stat().st_mtime, entry.stat().st_size, entry.path))
+    entries.sort()
+    total_bytes = sum(size for _, size, _ in entries)
+    recent = time.time() - AUDIO_CACHE_RECENT_S
+    evicted = 0
+    for mtime, size, path in entries:
+        if total_bytes <= max_bytes:
+            break
+        if path == keep or mtime > recent:
+            continue
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+        total_bytes -= size
+        evicted += 1
+    if evicted:
+        logger.info(f'Evicted {evicted} transcodes from {AUDIO_CACHE_DIR}, {total_bytes} bytes left')
+    return evicted
+
+
+def transcode_aac(source: AudioSource, control: Optional[render_control.RenderControl] = None) -> str:
+    aac_path = os.path.join(AUDIO_CACHE_DIR, f'{source.content_hash}{TRANSCODE_EXT}')
+    try:
+        # the modification time doubles as the LRU timestamp
+        os.utime(aac_path)
+        logger.debug(f'AAC transcode of {source.path} found in cache')
+        return aac_path
+    except FileNotFoundError:
+        pass
+
+    logger.info(f'Transcoding {source.path} to AAC')
+    os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+    # every transcode writes its own partial file, renders sharing a soundtrack may transcode it at the same time
+    fd, partial_path = tempfile.mkstemp(prefix=f'{source.content_hash}.', suffix=PARTIAL_SUFFIX, dir=AUDIO_CACHE_DIR)
+    os.close(fd)
+    try:
+        render_control.run(ffmpeg.input(source.path).audio.output(partial_path, **{'c:a': 'aac'}).overwrite_output(),
+                           control)
+        os.replace(partial_path, aac_path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(partial_path)
+        raise
+    evict_audio_cache(keep=aac_path)
+    return aac_path
+
+
+def prepare_audio(source: AudioSource, audio_mode: str, executor: ThreadPoolExecutor,
+                  control: Optional[render_control.RenderControl] = None) -> Future:
+    # resolves to the file whose audio stream is muxed into the slideshow with stream copy
+    if audio_mode == AUDIO_COPY and source.codec in MP4_AUDIO_CODECS:
+        future = Future()
+        future.set_result(source.path)
+        return future
+    if audio_mode == AUDIO_COPY:
+        logger.warning(f'{source.codec} audio cannot be copied into mp4, transcoding it to AAC')
+    return executor.submit(transcode_aac, source, control)
@@ -0,0 +1,83 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import placement
+from fixtures import ASPECT_MIXED, ImageSet, make_audio, make_image_set
+from metrics import max_rss_mb
+from regressions import isolated_env
+
+IMAGE_COUNTS = (10, 50, 500)
+PIPELINES = (placement.PIPELINE_FILTERGRAPH, placement.PIPELINE_CONCAT)
+
+
+def run_case(pipeline: str, images_dir: str, audio_path: str, output_path: str) -> dict:
+    import resource
+
+    start = time.perf_counter()
+    placement.create_slideshow(images_dir, audio_path, output_path, lambda *args: None, pipeline=pipeline)
+    wall_time = time.perf_counter() - start
+
+    return {
+        'wall_s': round(wall_time, 3),
+        'ffmpeg_peak_rss_mb': max_rss_mb(resource.RUSAGE_CHILDREN),
+        'python_peak_rss_mb': max_rss_mb(resource.RUSAGE_SELF),
+    }
+
+
+def run_isolated(pipeline: str, images_dir: str, audio_path: str, output_path: str, cache_home: str) -> dict:
+    # every case runs in a fresh interpreter so RUSAGE_CHILDREN only sees its own ffmpeg process, and with a
+    # private home so it neither reads nor fills the caches of the user
+    result = subprocess.run(
+        [sys.executable, __file__, '--case', pipeline, images_dir, audio_path, output_path],
+        check=True, capture_output=True, text=True, env=isolated_env(cache_home)
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the per-image filtergraph with the concat pipeline')
+    parser.add_argument('--counts', type=int, nargs='+', default=list(IMAGE_COUNTS))
+    parser.add_argument('--pipelines', nargs='+', default=list(PIPELINES))
+    parser.add_argument('--slide-duration', type=float, default=1.0)
+    parser.add_argument('--image-size', type=int, nargs=2, default=(4000, 3000), metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--work-dir', default=None)
+    parser.add_argument('--case', nargs=4, metavar=('PIPELINE', 'IMAGES', 'AUDIO', 'OUTPUT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(*args.case)))
+        return
+
+    with tempfile.TemporaryDirectory(prefix='bench_pipeline_', dir=args.work_dir) as work_dir:
+        results = []
+        for count in args.counts:
+            images_dir = os.path.join(work_dir, f'images_{count}')
+            audio_path = os.path.join(work_dir, f'audio_{count}.mp3')
+            make_image_set(images_dir, ImageSet(count, tuple(args.image_size), aspect=ASPECT_MIXED))
+            make_audio(audio_path, count * args.slide_duration)
+
+            for pipeline in args.pipelines:
+                output_path = os.path.join(work_dir, f'{pipeline}_{count}.mp4')
+                try:
+                    cache_home = tempfile.mkdtemp(prefix='home_', dir=work_dir)
+                    measurement = run_isolated(pipeline, images_dir, audio_path, output_path, cache_home)
+                except subprocess.CalledProcessError as e:
+                    measurement = {'error': e.stderr.strip().splitlines()[-1] if e.stderr else str(e)}
+                results.append({'pipeline': pipeline, 'images': count, **measurement})
+                print(json.dumps(results[-1]), flush=True)
+
+    print(f"\n{'images':>8} {'pipeline':>12} {'wall s':>10} {'ffmpeg MB':>10}")
+    for result in results:
+        print(f"{result['images']:>8} {result['pipeline']:>12} "
+              f"{result.get('wall_s', '-'):>10} {result.get('ffmpeg_peak_rss_mb', '-'):>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import placement
+from fixtures import ASPECT_MIXED, ImageSet, make_image_set
+from prenormalize import prenormalize_images
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure how Pillow pre-normalization scales with worker count')
+    parser.add_argument('--images', type=int, default=64)
+    parser.add_argument('--image-size', type=int, nargs=2, default=(6000, 4000), metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--work-dir', default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='bench_prenormalize_', dir=args.work_dir) as work_dir:
+        images_dir = os.path.join(work_dir, 'images')
+        make_image_set(images_dir, ImageSet(args.images, tuple(args.image_size), aspect=ASPECT_MIXED))
+        images_path_arr = sorted(os.path.join(images_dir, filename) for filename in os.listdir(images_dir))
+
+        baseline = None
+        print(f"{'workers':>8} {'wall s':>10} {'images/s':>10} {'speedup':>8}")
+        for workers in args.workers:
+            frames_dir = os.path.join(work_dir, f'frames_{workers}')
+            os.makedirs(frames_dir)
+            start = time.perf_counter()
+            prenormalize_images(images_path_arr, frames_dir, placement.FRAME_WIDTH, placement.FRAME_HEIGHT,
+                                workers=workers)
+            wall_time = time.perf_counter() - start
+            baseline = baseline or wall_time
+            print(f'{workers:>8} {wall_time:>10.2f} {args.images / wall_time:>10.1f} {baseline / wall_time:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import image_scan
+from fixtures import ASPECT_MIXED, ImageSet, make_image_set
+
+
+def make_junk(junk_dir: str, count: int):
+    for index in range(count):
+        with open(os.path.join(junk_dir, f'junk_{index:05d}.{("txt", "dat", "db", "")[index % 4]}'), 'wb') as f:
+            f.write(os.urandom(512))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure image folder scanning speed')
+    parser.add_argument('--images', type=int, default=4000)
+    parser.add_argument('--junk', type=int, default=1000)
+    parser.add_argument('--work-dir', default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='bench_scan_', dir=args.work_dir) as work_dir:
+        make_image_set(work_dir, ImageSet(args.images, (640, 480), aspect=ASPECT_MIXED))
+        make_junk(work_dir, args.junk)
+
+        start = time.perf_counter()
+        image_infos = image_scan.scan_images(work_dir)
+        wall_time = time.perf_counter() - start
+
+    valid = sum(image_info.valid for image_info in image_infos)
+    print(f'{len(image_infos)} files, {valid} valid images, {wall_time:.3f} s, '
+          f'{wall_time * 1000 / len(image_infos):.3f} ms per file')
+
+
+if __name__ == '__main__':
+    main()
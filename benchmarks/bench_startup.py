@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+from regressions import find_regressions, isolated_env, load_baseline, save_baseline
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_DIR, 'SlideshowMaker.py')
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_baseline.json')
+DEFAULT_TOLERANCE = 0.25
+TOP_IMPORTS = 15
+LAUNCH_TIMEOUT_S = 60
+# the app writes its timing to this file once the window has painted, then quits
+STARTUP_REPORT_ENV = 'TALELLE_STARTUP_REPORT'
+# -X importtime lines: "import time:       self [us] |  cumulative | imported package"
+IMPORT_TIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+# name -> True when a larger value is better
+COMPARED_METRICS = {
+    'import_s': False,
+    'first_paint_s': False,
+    'wall_s': False,
+}
+
+
+def app_env(home: str) -> dict:
+    env = isolated_env(home)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    return env
+
+
+def import_times(home: str) -> dict:
+    # runs the imports of the source tree under -X importtime, the frozen build has no interpreter to pass it to
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import SlideshowMaker'], cwd=REPO_DIR,
+                            env=app_env(home), capture_output=True, text=True, timeout=LAUNCH_TIMEOUT_S, check=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append({'name': name, 'depth': len(indent) // 2, 'self_s': int(self_us) / 1e6,
+                            'cumulative_s': int(cumulative_us) / 1e6})
+    total = next((entry for entry in imports if entry['name'] == 'SlideshowMaker'), None)
+    # what SlideshowMaker imports directly, the nested imports are included in their cumulative time
+    direct = [entry for entry in imports if entry['depth'] == 1] if total else []
+    return {
+        'import_s': round(total['cumulative_s'], 4) if total else None,
+        'modules_imported': len(imports),
+        'top_imports': [(entry['name'], round(entry['cumulative_s'], 4))
+                        for entry in sorted(direct, key=lambda entry: -entry['cumulative_s'])[:TOP_IMPORTS]],
+    }
+
+
+def launch(command: list[str], home: str) -> dict:
+    with tempfile.NamedTemporaryFile(suffix='.json', dir=home, delete=False) as f:
+        report_path = f.name
+    start = time.perf_counter()
+    subprocess.run(command, cwd=REPO_DIR, env={**app_env(home), STARTUP_REPORT_ENV: report_path},
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=LAUNCH_TIMEOUT_S, check=True)
+    wall_time = time.perf_counter() - start
+    with open(report_path, encoding='utf-8') as f:
+        report = json.load(f)
+    return {**report, 'wall_s': round(wall_time, 4)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the import time and time to first paint of the GUI and '
+                                                 'compare them with a stored baseline')
+    parser.add_argument('--command', nargs='+', default=None,
+                        help='launch this instead of the source tree, e.g. the PyInstaller executable')
+    parser.add_argument('--repeat', type=int, default=5, help='launches, the fastest one is kept')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='allowed relative regression before failing, 0.25 is 25%%')
+    args = parser.parse_args()
+
+    command = args.command or [sys.executable, APP_PATH]
+    case = 'frozen' if args.command else 'source'
+    with tempfile.TemporaryDirectory(prefix='bench_startup_') as home:
+        # the first launch copies the logging config into the fresh home, it is not measured
+        launch(command, home)
+        launches = [launch(command, home) for _ in range(args.repeat)]
+        result = min(launches, key=lambda report: report['wall_s'])
+        result['first_paint_s'] = min(report['first_paint_s'] for report in launches)
+        if not args.command:
+            imports = min((import_times(home) for _ in range(args.repeat)),
+                          key=lambda times: times['import_s'] or float('inf'))
+            result.update(imports)
+
+    print(f"{case}: first paint {result['first_paint_s'] * 1000:.0f} ms, process {result['wall_s'] * 1000:.0f} ms, "
+          f"{result['modules']} modules loaded")
+    if result.get('import_s') is not None:
+        print(f"import SlideshowMaker {result['import_s'] * 1000:.0f} ms over {result['modules_imported']} modules")
+        for name, cumulative_s in result['top_imports']:
+            print(f'{name:>32} {cumulative_s * 1000:8.1f} ms')
+
+    baseline = load_baseline(args.baseline)
+    if args.save_baseline:
+        baseline[case] = {metric: result[metric] for metric in COMPARED_METRICS if result.get(metric) is not None}
+        save_baseline(args.baseline, baseline)
+        print(f'\nBaseline saved to {args.baseline}')
+        return
+
+    regressions = [f'{name} is imported before the first render' for name in result.get('engine_modules', [])]
+    regressions += find_regressions({case: result}, baseline, args.tolerance, COMPARED_METRICS)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    if regressions:
+        sys.exit(1)
+    if case not in baseline:
+        print(f'\nNo {case} baseline at {args.baseline}, run with --save-baseline to create one')
+        return
+    print(f'\nNo regressions beyond {args.tolerance:.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fixtures import (ASPECT_MIXED, ASPECT_PORTRAIT, AUDIO_SILENCE, AUDIO_TONE, FORMAT_MIXED, ImageSet, make_audio,
+                      make_image_set)
+from regressions import find_regressions, isolated_env, load_baseline, save_baseline
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_TOLERANCE = 0.15
+SLIDE_DURATION = 1.0
+
+FIXTURES = {
+    'small_jpeg': (ImageSet(10, (1280, 720)), AUDIO_TONE),
+    'mixed_formats': (ImageSet(20, (1920, 1080), FORMAT_MIXED, ASPECT_MIXED), AUDIO_SILENCE),
+    'large_jpeg': (ImageSet(20, (4000, 3000)), AUDIO_TONE),
+    'portrait_png': (ImageSet(20, (1600, 1200), 'PNG', ASPECT_PORTRAIT), AUDIO_TONE),
+    'many_small': (ImageSet(200, (640, 480)), AUDIO_TONE),
+}
+
+CONFIGS = {
+    'concat': {'pipeline': 'concat'},
+    'filtergraph': {'pipeline': 'filtergraph'},
+    'still': {'encode_profile': 'balanced'},
+    'prenormalize': {'encode_profile': 'balanced', 'prenormalize': True, 'frame_cache': False},
+    'segmented': {'encode_profile': 'balanced', 'segments': 4},
+}
+DEFAULT_CONFIGS = ('concat', 'still', 'prenormalize')
+
+# name -> True when a larger value is better
+COMPARED_METRICS = {
+    'megapixels_per_s': True,
+    'output_s_per_wall_s': True,
+    'peak_rss_mb': False,
+    'ffmpeg_peak_rss_mb': False,
+}
+
+
+def run_case(images_dir: str, audio_path: str, output_path: str, config: dict) -> dict:
+    import placement
+
+    return placement.create_slideshow(images_dir, audio_path, output_path, lambda *args: None, **config)
+
+
+def run_isolated(images_dir: str, audio_path: str, output_path: str, config_name: str, cache_home: str) -> dict:
+    # a fresh interpreter per case keeps RUSAGE_CHILDREN to its own ffmpeg processes, and a private home keeps
+    # the caches from leaking between runs
+    result = subprocess.run(
+        [sys.executable, __file__, '--case', config_name, images_dir, audio_path, output_path],
+        check=True, capture_output=True, text=True, env=isolated_env(cache_home)
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(report: dict, image_set: ImageSet) -> dict:
+    total = report['total']
+    return {
+        'wall_s': total['wall_s'],
+        'megapixels_per_s': round(image_set.megapixels / total['wall_s'], 2),
+        'output_s_per_wall_s': round(report['slideshow_length'] / total['wall_s'], 2),
+        'peak_rss_mb': total['peak_rss_mb'],
+        'ffmpeg_peak_rss_mb': total['children_peak_rss_mb'],
+        'stages': {stage['name']: stage['wall_s'] for stage in report['stages']},
+    }
+
+
+def best_of(measurements: list[dict]) -> dict:
+    # the fastest run is the least disturbed by the rest of the machine
+    return min(measurements, key=lambda measurement: measurement['wall_s'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run create_slideshow over synthetic fixtures and compare '
+                                                 'the results with a stored baseline')
+    parser.add_argument('--fixtures', nargs='+', choices=list(FIXTURES), default=list(FIXTURES))
+    parser.add_argument('--configs', nargs='+', choices=list(CONFIGS), default=list(DEFAULT_CONFIGS))
+    parser.add_argument('--repeat', type=int, default=1, help='runs per case, the fastest one is kept')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='allowed relative regression before failing, 0.15 is 15%%')
+    parser.add_argument('--work-dir', default=None)
+    parser.add_argument('--case', nargs=4, metavar=('CONFIG', 'IMAGES', 'AUDIO', 'OUTPUT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        config_name, images_dir, audio_path, output_path = args.case
+        print(json.dumps(run_case(images_dir, audio_path, output_path, CONFIGS[config_name]), default=str))
+        return
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='bench_suite_', dir=args.work_dir) as work_dir:
+        for fixture_name in args.fixtures:
+            image_set, audio_kind = FIXTURES[fixture_name]
+            images_dir = os.path.join(work_dir, fixture_name)
+            audio_path = os.path.join(work_dir, f'{fixture_name}.mp3')
+            # Linux keeps the peak RSS of a process across exec, the cases would report the one of decoding the
+            # fixtures if they were made here
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                executor.submit(make_image_set, images_dir, image_set).result()
+            make_audio(audio_path, image_set.count * SLIDE_DURATION, audio_kind)
+
+            for config_name in args.configs:
+                case = f'{fixture_name}/{config_name}'
+                measurements = []
+                for run in range(args.repeat):
+                    cache_home = tempfile.mkdtemp(prefix='home_', dir=work_dir)
+                    output_path = os.path.join(work_dir, f'{fixture_name}_{config_name}_{run}.mp4')
+                    try:
+                        report = run_isolated(images_dir, audio_path, output_path, config_name, cache_home)
+                    except subprocess.CalledProcessError as e:
+                        measurements = [{'error': e.stderr.strip().splitlines()[-1] if e.stderr else str(e)}]
+                        break
+                    measurements.append(summarize(report, image_set))
+                results[case] = measurements[0] if 'error' in measurements[0] else best_of(measurements)
+                print(json.dumps({'case': case, **results[case]}), flush=True)
+
+    print(f"\n{'case':>28} {'wall s':>8} {'MP/s':>8} {'out s/s':>8} {'MB':>8} {'ffmpeg MB':>10}")
+    for case, result in results.items():
+        print(f"{case:>28} {result.get('wall_s', '-'):>8} {result.get('megapixels_per_s', '-'):>8} "
+              f"{result.get('output_s_per_wall_s', '-'):>8} {result.get('peak_rss_mb', '-'):>8} "
+              f"{result.get('ffmpeg_peak_rss_mb', '-'):>10}")
+
+    baseline = load_baseline(args.baseline)
+    if args.save_baseline:
+        baseline.update({case: result for case, result in results.items() if 'error' not in result})
+        save_baseline(args.baseline, baseline)
+        print(f'\nBaseline saved to {args.baseline}')
+        return
+
+    if not baseline:
+        print(f'\nNo baseline at {args.baseline}, run with --save-baseline to create one')
+        return
+    regressions = find_regressions(results, baseline, args.tolerance, COMPARED_METRICS)
+    failed = [case for case, result in results.items() if 'error' in result]
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    for case in failed:
+        print(f'FAILED {case}: {results[case]["error"]}')
+    if regressions or failed:
+        sys.exit(1)
+    print(f'\nNo regressions beyond {args.tolerance:.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import os
+from typing import NamedTuple
+
+import ffmpeg
+from PIL import Image
+
+FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp'}
+FORMAT_MIXED = 'mixed'
+ASPECT_LANDSCAPE = 'landscape'
+ASPECT_PORTRAIT = 'portrait'
+ASPECT_MIXED = 'mixed'
+AUDIO_TONE = 'tone'
+AUDIO_SILENCE = 'silence'
+
+
+class ImageSet(NamedTuple):
+    count: int
+    size: tuple[int, int]
+    format: str = 'JPEG'
+    aspect: str = ASPECT_LANDSCAPE
+
+    @property
+    def megapixels(self) -> float:
+        return self.count * self.size[0] * self.size[1] / 1_000_000
+
+
+def image_size(image_set: ImageSet, index: int) -> tuple[int, int]:
+    width, height = max(image_set.size), min(image_set.size)
+    portrait = image_set.aspect == ASPECT_PORTRAIT or (image_set.aspect == ASPECT_MIXED and index % 3 == 0)
+    return (height, width) if portrait else (width, height)
+
+
+def image_format(image_set: ImageSet, index: int) -> str:
+    if image_set.format == FORMAT_MIXED:
+        return list(FORMAT_EXTENSIONS)[index % len(FORMAT_EXTENSIONS)]
+    return image_set.format
+
+
+def make_image_set(images_dir: str, image_set: ImageSet):
+    # the content only depends on the index, so every run encodes the same pixels
+    os.makedirs(images_dir, exist_ok=True)
+    gradient = Image.linear_gradient('L')
+    for index in range(image_set.count):
+        width, height = image_size(image_set, index)
+        red = gradient.resize((width, height))
+        green = red.rotate(90 * (index % 4)).resize((width, height))
+        blue = Image.new('L', (width, height), (index * 37) % 256)
+        image_format_name = image_format(image_set, index)
+        Image.merge('RGB', (red, green, blue)).save(
+            os.path.join(images_dir, f'{index:05d}{FORMAT_EXTENSIONS[image_format_name]}'), image_format_name,
+            quality=90
+        )
+
+
+def make_audio(audio_path: str, duration: float, kind: str = AUDIO_TONE):
+    if kind == AUDIO_SILENCE:
+        source = ffmpeg.input('anullsrc=r=44100:cl=stereo', f='lavfi', t=duration)
+    else:
+        source = ffmpeg.input(f'sine=frequency=440:duration={duration}', f='lavfi')
+    source.output(audio_path, **{'c:a': 'libmp3lame'}).overwrite_output().run(quiet=True)
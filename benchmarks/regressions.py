@@ -0,0 +1,37 @@
+import json
+import os
+
+
+def isolated_env(home: str) -> dict:
+    # a private home keeps the settings and the frame, index and audio caches of the user out of a measurement
+    return {**os.environ, 'HOME': home, 'USERPROFILE': home}
+
+
+def load_baseline(baseline_path: str) -> dict:
+    if not os.path.exists(baseline_path):
+        return {}
+    with open(baseline_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(baseline_path: str, baseline: dict):
+    with open(baseline_path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float, compared_metrics: dict) -> list[str]:
+    # results and baseline map case -> {metric: value}, compared_metrics maps metric -> True when larger is better
+    regressions = []
+    for case, measurement in results.items():
+        expected = baseline.get(case)
+        if not expected or 'error' in measurement:
+            continue
+        for metric, higher_is_better in compared_metrics.items():
+            value, reference = measurement.get(metric), expected.get(metric)
+            if value is None or not reference:
+                continue
+            change = (value - reference) / reference
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f'{case} {metric}: {reference} -> {value} ({change:+.0%})')
+    return regressions
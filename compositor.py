@@ -0,0 +1,221 @@
+import collections
+import logging
+import math
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Callable, Iterator, NamedTuple, Optional
+
+import ffmpeg
+import numpy as np
+from PIL import Image
+
+import encode_profiles
+import render_control
+from progress import get_progress_listener
+
+logger = logging.getLogger(__name__)
+
+COMPOSITOR_FPS = 30
+TRANSITION_CUT = 'cut'
+TRANSITION_CROSSFADE = 'crossfade'
+TRANSITIONS = (TRANSITION_CUT, TRANSITION_CROSSFADE)
+DEFAULT_TRANSITION_DURATION = 1.0
+KEN_BURNS_ZOOM = 1.12
+# frames generated by a worker per task, and tasks in flight per worker: together they bound the frame memory
+CHUNK_FRAMES = 2
+CHUNKS_PER_WORKER = 2
+STDERR_TAIL_LINES = 20
+# (x from, x to, y from, y to) of the crop centre, one per slide in turn
+KEN_BURNS_PANS = ((0, 1, 0.5, 0.5), (0.5, 0.5, 0, 1), (1, 0, 0.5, 0.5), (0.5, 0.5, 1, 0))
+
+
+class Motion(NamedTuple):
+    transition: str = TRANSITION_CROSSFADE
+    transition_frames: int = 0
+    ken_burns: bool = True
+    zoom: float = KEN_BURNS_ZOOM
+
+
+class SlideTimeline(NamedTuple):
+    paths: list[str]
+    starts: list[int]
+    frame_counts: list[int]
+
+    @property
+    def total_frames(self) -> int:
+        return self.starts[-1] + self.frame_counts[-1]
+
+    def slide_at(self, frame: int) -> int:
+        # starts are sorted, a binary search keeps long slideshows cheap
+        low, high = 0, len(self.starts) - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.starts[middle] <= frame:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+
+def make_timeline(paths: list[str], frame_counts: list[int]) -> SlideTimeline:
+    slides = [(path, frames) for path, frames in zip(paths, frame_counts) if frames]
+    starts = [0]
+    for _, frames in slides[:-1]:
+        starts.append(starts[-1] + frames)
+    return SlideTimeline([path for path, _ in slides], starts, [frames for _, frames in slides])
+
+
+@lru_cache(maxsize=3)
+def load_slide(path: str) -> Image.Image:
+    # a worker only ever needs the slide on screen and the one fading in
+    with Image.open(path) as image:
+        return image.convert('RGB')
+
+
+def ken_burns_box(index: int, progress: float, width: int, height: int, zoom: float) -> tuple:
+    # even slides zoom in, odd ones zoom out, and the pan direction turns with every slide
+    scale = 1 + (zoom - 1) * (progress if index % 2 == 0 else 1 - progress)
+    box_width, box_height = width / scale, height / scale
+    x_from, x_to, y_from, y_to = KEN_BURNS_PANS[index % len(KEN_BURNS_PANS)]
+    left = (width - box_width) * (x_from + (x_to - x_from) * progress)
+    top = (height - box_height) * (y_from + (y_to - y_from) * progress)
+    return left, top, left + box_width, top + box_height
+
+
+def moved_slide(path: str, index: int, progress: float, motion: Motion) -> np.ndarray:
+    image = load_slide(path)
+    if not motion.ken_burns:
+        return np.asarray(image)
+    box = ken_burns_box(index, progress, image.width, image.height, motion.zoom)
+    return np.asarray(image.resize(image.size, Image.Resampling.BILINEAR, box=box))
+
+
+@lru_cache(maxsize=2)
+def held_slide(path: str, index: int, motion: Motion) -> np.ndarray:
+    # a slide fading in holds its first position, so it is only resampled once for the whole fade
+    return moved_slide(path, index, 0.0, motion)
+
+
+def slide_frame(timeline: SlideTimeline, index: int, frame: int, motion: Motion) -> np.ndarray:
+    # the motion runs over the whole slide
+    progress = min(1.0, max(0.0, (frame - timeline.starts[index]) / max(1, timeline.frame_counts[index] - 1)))
+    return moved_slide(timeline.paths[index], index, progress, motion)
+
+
+def crossfade(outgoing: np.ndarray, incoming: np.ndarray, alpha: float) -> np.ndarray:
+    weight = np.uint16(round(alpha * 256))
+    blended = outgoing.astype(np.uint16) * (256 - weight) + incoming.astype(np.uint16) * weight
+    return (blended >> 8).astype(np.uint8)
+
+
+def composite_frame(timeline: SlideTimeline, frame: int, motion: Motion) -> np.ndarray:
+    index = timeline.slide_at(frame)
+    current = slide_frame(timeline, index, frame, motion)
+    if motion.transition != TRANSITION_CROSSFADE or index + 1 >= len(timeline.paths):
+        return current
+    # the next slide fades in over the last frames of this one, so every slide still starts on its own boundary
+    fade_frames = min(motion.transition_frames, timeline.frame_counts[index] // 2,
+                      timeline.frame_counts[index + 1] // 2)
+    fade_start = timeline.starts[index + 1] - fade_frames
+    if fade_frames <= 0 or frame < fade_start:
+        return current
+    incoming = held_slide(timeline.paths[index + 1], index + 1, motion)
+    return crossfade(current, incoming, (frame - fade_start + 1) / (fade_frames + 1))
+
+
+def composite_range(timeline: SlideTimeline, start: int, end: int, motion: Motion) -> bytes:
+    return b''.join(composite_frame(timeline, frame, motion).tobytes() for frame in range(start, end))
+
+
+worker_job = dict()
+
+
+def init_worker(timeline: SlideTimeline, motion: Motion, niceness: int = 0):
+    # the timeline is sent once per worker instead of with every chunk
+    render_control.lower_priority(niceness)
+    worker_job.update(timeline=timeline, motion=motion)
+
+
+def composite_worker_range(start: int, end: int) -> bytes:
+    return composite_range(worker_job['timeline'], start, end, worker_job['motion'])
+
+
+def composited_chunks(timeline: SlideTimeline, motion: Motion, workers: int, niceness: int = 0) -> Iterator[bytes]:
+    chunks = ((start, min(start + CHUNK_FRAMES, timeline.total_frames))
+              for start in range(0, timeline.total_frames, CHUNK_FRAMES))
+    if workers <= 1:
+        for start, end in chunks:
+            yield composite_range(timeline, start, end, motion)
+        return
+
+    # chunks are handed out in order and consumed in order, with a bounded number in flight
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(timeline, motion, niceness)) as executor:
+        in_flight = collections.deque()
+        for start, end in chunks:
+            in_flight.append(executor.submit(composite_worker_range, start, end))
+            if len(in_flight) >= workers * CHUNKS_PER_WORKER:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def drain_stderr(stream, tail: collections.deque):
+    # ffmpeg blocks once the stderr pipe is full, so it is read while the frames are written
+    for line in stream:
+        tail.append(line)
+
+
+def render_composited(frames_path_arr: list[str], frame_counts: list[int], audio_path: str, output_mp4_path: str,
+                      settings: dict, motion: Motion, progress_callback: Callable,
+                      event_callback: Optional[Callable] = None, workers: Optional[int] = None,
+                      threads: Optional[int] = None,
+                      control: Optional[render_control.RenderControl] = None):
+    control = control or render_control.RenderControl()
+    timeline = make_timeline(frames_path_arr, frame_counts)
+    fps = settings['fps']
+    with Image.open(timeline.paths[0]) as first_frame:
+        width, height = first_frame.size
+    workers = workers or max(1, (os.cpu_count() or 1) // 2)
+    logger.info(f'Compositing {timeline.total_frames} frames at {width}x{height} with {workers} workers, {motion}')
+
+    video = ffmpeg.input('pipe:', format='rawvideo', pix_fmt='rgb24', s=f'{width}x{height}', r=fps)
+    # the slides move, so the still image tuning of the profile does not apply
+    output_args = {**encode_profiles.video_args(settings), 'frames:v': timeline.total_frames, 'c:a': 'copy'}
+    output_args.pop('tune', None)
+    if threads:
+        output_args['threads'] = threads
+
+    progress_state = dict()
+    stderr_tail = collections.deque(maxlen=STDERR_TAIL_LINES)
+    final_duration = timeline.total_frames / fps
+    with get_progress_listener(final_duration, progress_callback, progress_state, event_callback) as progress_socket:
+        process = control.run_async(ffmpeg.output(
+            video, ffmpeg.input(audio_path).audio, output_mp4_path, **output_args
+        ).overwrite_output().global_args('-progress', f'http://{progress_socket}'), pipe_stdin=True, pipe_stderr=True)
+        stderr_reader = threading.Thread(target=drain_stderr, args=(process.stderr, stderr_tail))
+        stderr_reader.start()
+        try:
+            for chunk in composited_chunks(timeline, motion, workers, control.niceness):
+                if control.cancelled.is_set():
+                    break
+                process.stdin.write(chunk)
+        except BrokenPipeError:
+            logger.warning('ffmpeg stopped reading frames')
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+            process.wait()
+            stderr_reader.join()
+            control.release(process)
+    control.check()
+    if process.returncode:
+        raise ffmpeg.Error('ffmpeg', None, b''.join(stderr_tail))
+
+
+def transition_frames(duration: float, fps: float) -> int:
+    return max(0, math.floor(duration * fps + 0.5))
@@ -0,0 +1,177 @@
+import argparse
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+import numpy as np
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+import image_index
+import ingest
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8
+# at most this many of the 64 dHash bits may differ between near duplicates
+DEFAULT_THRESHOLD = 6
+SHARPNESS_SIZE = 256
+# shots at least this sharp relative to the sharpest of their cluster count as equally sharp
+SHARPNESS_TOLERANCE = 0.8
+HASH_THREADS = 8
+# rows of the distance matrix compared at once, their XOR for 10,000 hashes is about 80 MB and the byte-wise
+# popcount of older numpy as much again
+BLOCK_ROWS = 1024
+# set bits of every byte value, for numpy without bitwise_count
+POPCOUNT_TABLE = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+class DuplicateCluster(NamedTuple):
+    best: str
+    paths: list[str]
+
+
+def image_fingerprint(file_path: str) -> Optional[tuple[int, float]]:
+    # returns the 64-bit dHash and a sharpness score, both from one small decode of the photo
+    try:
+        with ingest.open_source(file_path) as image:
+            image.draft('L', (SHARPNESS_SIZE, SHARPNESS_SIZE))
+            image = ImageOps.exif_transpose(image).convert('L')
+            image.thumbnail((SHARPNESS_SIZE, SHARPNESS_SIZE), Image.Resampling.BILINEAR)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        # HEIC and AVIF reach the render through ffmpeg, Pillow may not read them
+        logger.warning(f'{file_path} cannot be compared with the other images: {e}')
+        return None
+    pixels = np.asarray(image.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    dhash = int(np.packbits(bits).view('>u8')[0])
+
+    # the variance of the Laplacian is high for sharp shots and low for blurred ones
+    gray = np.asarray(image, dtype=np.float32)
+    laplacian = gray[1:-1, :-2] + gray[1:-1, 2:] + gray[:-2, 1:-1] + gray[2:, 1:-1] - 4 * gray[1:-1, 1:-1]
+    return dhash, float(laplacian.var()) if laplacian.size else 0.0
+
+
+def to_signed(value: int) -> int:
+    # SQLite integers are signed 64 bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def fingerprints(images_path_dir: str,
+                 images: list[image_index.IndexedImage]) -> list[Optional[tuple[int, float]]]:
+    with image_index.ImageIndex(images_path_dir) as index:
+        known = index.perceptual_hashes()
+        missing = list({image.content_hash: image for image in images if image.content_hash not in known}.values())
+        if missing:
+            logger.info(f'Hashing {len(missing)} of {len(images)} images')
+            with ThreadPoolExecutor(max_workers=HASH_THREADS) as executor:
+                computed = list(executor.map(lambda image: image_fingerprint(image.path), missing))
+            rows = [(image.content_hash, to_signed(fingerprint[0]), fingerprint[1])
+                    for image, fingerprint in zip(missing, computed) if fingerprint]
+            index.store_perceptual_hashes(rows)
+            known.update({content_hash: (dhash, sharpness) for content_hash, dhash, sharpness in rows})
+    return [known.get(image.content_hash) for image in images]
+
+
+def popcount(values: np.ndarray) -> np.ndarray:
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return POPCOUNT_TABLE[values.view(np.uint8)].reshape(*values.shape, 8).sum(axis=-1, dtype=np.uint8)
+
+
+def near_pairs(hashes: np.ndarray, threshold: int) -> list[tuple[int, int]]:
+    # Hamming distances of every pair, a block of rows at a time against all later hashes
+    pairs = []
+    for start in range(0, len(hashes), BLOCK_ROWS):
+        block = hashes[start:start + BLOCK_ROWS]
+        distances = popcount(block[:, None] ^ hashes[None, start:])
+        rows, columns = np.nonzero(distances <= threshold)
+        rows += start
+        columns += start
+        later = columns > rows
+        pairs.extend(zip(rows[later].tolist(), columns[later].tolist()))
+    return pairs
+
+
+def cluster_pairs(count: int, pairs: list[tuple[int, int]]) -> list[list[int]]:
+    # complete linkage: an image joins the earliest cluster whose every member it is near, so a chain of small
+    # differences A~B~C never puts A and C together when they are too far apart
+    neighbours = [set() for _ in range(count)]
+    for first, second in pairs:
+        neighbours[first].add(second)
+        neighbours[second].add(first)
+    clusters = []
+    cluster_of = [None] * count
+    for index in range(count):
+        for candidate in sorted({cluster_of[neighbour] for neighbour in neighbours[index] if neighbour < index}):
+            if neighbours[index].issuperset(clusters[candidate]):
+                cluster_of[index] = candidate
+                clusters[candidate].append(index)
+                break
+        else:
+            cluster_of[index] = len(clusters)
+            clusters.append([index])
+    return [members for members in clusters if len(members) > 1]
+
+
+def find_duplicates(images_path_dir: str, images: list[image_index.IndexedImage],
+                    threshold: int = DEFAULT_THRESHOLD) -> list[DuplicateCluster]:
+    if len(images) < 2:
+        return []
+    image_fingerprints = fingerprints(images_path_dir, images)
+    # images without a fingerprint keep their place in the slideshow, they never join a cluster
+    readable = [index for index, fingerprint in enumerate(image_fingerprints) if fingerprint]
+    hashes = np.array([to_signed(image_fingerprints[index][0]) for index in readable], dtype=np.int64).view(np.uint64)
+    clusters = []
+    for readable_members in cluster_pairs(len(readable), near_pairs(hashes, threshold)):
+        members = [readable[member] for member in readable_members]
+        # of the sharpest shots the one with the most pixels wins, recompressed copies score a little sharper
+        sharpest = max(image_fingerprints[index][1] for index in members)
+        candidates = [index for index in members if image_fingerprints[index][1] >= sharpest * SHARPNESS_TOLERANCE]
+        best = max(candidates, key=lambda index: ((images[index].width or 0) * (images[index].height or 0),
+                                                  image_fingerprints[index][1]))
+        clusters.append(DuplicateCluster(images[best].path, [images[index].path for index in members]))
+    logger.info(f'{len(clusters)} duplicate clusters holding {sum(len(cluster.paths) for cluster in clusters)} '
+                f'of {len(images)} images')
+    return clusters
+
+
+def drop_duplicates(images: list[image_index.IndexedImage],
+                    clusters: list[DuplicateCluster]) -> list[image_index.IndexedImage]:
+    # keeps the best shot of every cluster in the place of the cluster's first image
+    dropped = {path for cluster in clusters for path in cluster.paths}
+    position = {image.path: index for index, image in enumerate(images)}
+    best_at = {min(cluster.paths, key=position.__getitem__): cluster.best for cluster in clusters}
+    by_path = {image.path: image for image in images}
+    kept = []
+    for image in images:
+        if image.path in best_at:
+            kept.append(by_path[best_at[image.path]])
+        elif image.path not in dropped:
+            kept.append(image)
+    return kept
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report duplicate and near-duplicate photos of a folder')
+    parser.add_argument('images_dir')
+    parser.add_argument('--threshold', type=int, default=DEFAULT_THRESHOLD, help='most differing dHash bits')
+    parser.add_argument('--json', action='store_true', help='print the clusters as JSON')
+    args = parser.parse_args()
+
+    images = image_index.indexed_images(args.images_dir)
+    clusters = find_duplicates(args.images_dir, images, args.threshold)
+    if args.json:
+        print(json.dumps([cluster._asdict() for cluster in clusters], indent=2))
+        return
+    for cluster in clusters:
+        print(os.path.basename(cluster.best))
+        for path in cluster.paths:
+            if path != cluster.best:
+                print(f'  {os.path.basename(path)}')
+    print(f'{len(clusters)} clusters, {sum(len(cluster.paths) - 1 for cluster in clusters)} images to drop')
+
+
+if __name__ == '__main__':
+    main()
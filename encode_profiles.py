@@ -0,0 +1,67 @@
+from typing import Optional
+
+PROFILE_LEGACY = 'legacy'
+PROFILE_FAST = 'fast'
+PROFILE_BALANCED = 'balanced'
+PROFILE_SMALL = 'small'
+
+STILL_FPS = 5
+
+DRAFT_PRESET = 'ultrafast'
+DRAFT_CRF = 30
+
+# every profile but the legacy one encodes for still slides: a slide is one coded picture followed by skip frames
+ENCODE_PROFILES = {
+    PROFILE_LEGACY: {'fps': 1},
+    PROFILE_FAST: {'fps': STILL_FPS, 'preset': 'veryfast', 'crf': 23},
+    PROFILE_BALANCED: {'fps': STILL_FPS, 'preset': 'medium', 'crf': 20},
+    PROFILE_SMALL: {'fps': STILL_FPS, 'preset': 'slower', 'crf': 26},
+}
+
+
+def encode_settings(profile: str = PROFILE_LEGACY, crf: Optional[int] = None, preset: Optional[str] = None,
+                    fps: Optional[int] = None) -> dict:
+    if profile not in ENCODE_PROFILES:
+        raise ValueError(f'Unknown encode profile {profile}, expected one of {", ".join(ENCODE_PROFILES)}')
+    settings = {'profile': profile, **ENCODE_PROFILES[profile]}
+    if crf is not None:
+        settings['crf'] = crf
+    if preset is not None:
+        settings['preset'] = preset
+    if fps is not None:
+        settings['fps'] = fps
+    return settings
+
+
+def draft_settings(settings: dict) -> dict:
+    # keeps the fps of the final render, so the draft shares its slide timing frame for frame
+    return {**settings, 'preset': DRAFT_PRESET, 'crf': DRAFT_CRF}
+
+
+def is_still(settings: dict) -> bool:
+    return settings['profile'] != PROFILE_LEGACY
+
+
+def keyframe_expr(slide_duration: float, fps: float, first_slide: int = 0, first_frame: int = 0,
+                  fragment_s: Optional[float] = None) -> str:
+    # forces a key frame on the first frame of every slide, matching the rounding of slide_frame_counts
+    if fragment_s is None:
+        return (f'expr:gte(t+{first_frame / fps:.6f},'
+                f'(n_forced+{first_slide})*{slide_duration:.6f}-{0.5 / fps:.6f})')
+    # a fragmented output also needs a key frame at least every fragment, n_forced then counts those too, so the
+    # slide of a frame is found from its time instead
+    shift = (first_frame + 0.5) / fps
+    slide_of = f'floor(({{}}+{shift:.6f})/{slide_duration:.6f})'
+    return (f'expr:if(isnan(prev_forced_t),1,gte(t,prev_forced_t+{fragment_s - 0.5 / fps:.6f})'
+            f'+gt({slide_of.format("t")},{slide_of.format("prev_forced_t")}))')
+
+
+def video_args(settings: dict, keyframes: Optional[str] = None) -> dict:
+    args = {'c:v': 'libx264', 'pix_fmt': 'yuv420p', 'color_range': 'pc', 'r': settings['fps']}
+    if is_still(settings):
+        args['tune'] = 'stillimage'
+        if keyframes:
+            args['force_key_frames'] = keyframes
+    # the legacy profile keeps the encoder defaults unless asked otherwise
+    args.update({key: settings[key] for key in ('crf', 'preset') if key in settings})
+    return args
@@ -0,0 +1,134 @@
+import argparse
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+from typing import Optional
+
+from talelle_setup import TALELLE_DIR
+
+logger = logging.getLogger(__name__)
+
+FRAME_CACHE_DIR = os.path.join(TALELLE_DIR, 'frame_cache')
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+HASH_CHUNK_SIZE = 1024 * 1024
+# a concurrent render may still list frames it looked up this recently in its concat list, they are never evicted
+RECENT_USE_S = 6 * 3600
+
+
+def file_digest(file_path: str) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FrameCache:
+    def __init__(self, cache_dir: str = FRAME_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES, enabled: bool = True,
+                 recent_use_s: float = RECENT_USE_S):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.recent_use_s = recent_use_s
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(content_hash: str, width: int, height: int, color: str, frame_ext: str, variant: str = '') -> str:
+        variant = f':{variant}' if variant else ''
+        return hashlib.blake2b(
+            f'{content_hash}:{width}x{height}:{color}:{frame_ext}{variant}'.encode(), digest_size=20
+        ).hexdigest()
+
+    def entry_path(self, key: str, frame_ext: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f'{key}{frame_ext}')
+
+    def lookup(self, key: str, frame_ext: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        path = self.entry_path(key, frame_ext)
+        try:
+            # the modification time doubles as the LRU timestamp
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def new_entry_path(self, frame_ext: str) -> str:
+        # entries are written next to the cache so that store() renames them, the work dir may be on another device
+        os.makedirs(self.cache_dir, exist_ok=True)
+        handle, path = tempfile.mkstemp(suffix=frame_ext, dir=self.cache_dir)
+        os.close(handle)
+        return path
+
+    def store(self, key: str, frame_ext: str, frame_path: str) -> str:
+        path = self.entry_path(key, frame_ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(frame_path, path)
+        return path
+
+    def record(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def entries(self) -> list[os.DirEntry]:
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return [
+            entry
+            for bucket in os.scandir(self.cache_dir) if bucket.is_dir()
+            for entry in os.scandir(bucket.path) if entry.is_file()
+        ]
+
+    def evict(self, keep: Optional[set[str]] = None) -> int:
+        keep = keep or set()
+        entries = sorted(self.entries(), key=lambda entry: entry.stat().st_mtime)
+        total_bytes = sum(entry.stat().st_size for entry in entries)
+        recent = time.time() - self.recent_use_s
+        evicted = 0
+        for entry in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            if entry.path in keep or entry.stat().st_mtime > recent:
+                continue
+            total_bytes -= entry.stat().st_size
+            os.remove(entry.path)
+            evicted += 1
+        if evicted:
+            logger.info(f'Evicted {evicted} frames from {self.cache_dir}, {total_bytes} bytes left')
+        return evicted
+
+    def purge(self):
+        logger.info(f'Purging frame cache {self.cache_dir}')
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def stats(self) -> dict:
+        entries = self.entries()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(entries),
+            'bytes': sum(entry.stat().st_size for entry in entries),
+            'max_bytes': self.max_bytes,
+            'oldest_mtime': min((entry.stat().st_mtime for entry in entries), default=None),
+        }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inspect or purge the normalized frame cache')
+    parser.add_argument('--purge', action='store_true')
+    parser.add_argument('--max-mb', type=int, default=None, help='evict least recently used frames down to this size')
+    args = parser.parse_args()
+
+    frame_cache = FrameCache()
+    if args.purge:
+        frame_cache.purge()
+    elif args.max_mb is not None:
+        frame_cache.max_bytes = args.max_mb * 1024 ** 2
+        frame_cache.evict()
+    print(frame_cache.stats())
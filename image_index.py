@@ -0,0 +1,187 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from PIL import Image
+
+import image_scan
+from frame_cache import file_digest
+from metrics import RenderMetrics, measure
+from talelle_setup import TALELLE_DIR
+
+logger = logging.getLogger(__name__)
+
+IMAGE_INDEX_DIR = os.path.join(TALELLE_DIR, 'image_index')
+INDEX_THREADS = 8
+
+ORDER_FILENAME = 'filename'
+ORDER_CAPTURE_TIME = 'capture_time'
+
+EXIF_ORIENTATION = 0x0112
+EXIF_DATETIME = 0x0132
+EXIF_IFD = 0x8769
+EXIF_DATETIME_ORIGINAL = 0x9003
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS images (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    valid INTEGER NOT NULL,
+    format TEXT,
+    width INTEGER,
+    height INTEGER,
+    orientation INTEGER,
+    captured_at TEXT,
+    content_hash TEXT
+)
+'''
+
+# keyed by content, so renamed or copied photos are not hashed again
+PERCEPTUAL_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS perceptual_hashes (
+    content_hash TEXT PRIMARY KEY,
+    dhash INTEGER NOT NULL,
+    sharpness REAL NOT NULL
+)
+'''
+
+
+class IndexedImage(NamedTuple):
+    path: str
+    size: int
+    mtime_ns: int
+    valid: bool
+    format: Optional[str]
+    width: Optional[int]
+    height: Optional[int]
+    orientation: Optional[int]
+    captured_at: Optional[str]
+    content_hash: Optional[str]
+
+
+def index_path(images_path_dir: str) -> str:
+    folder_key = hashlib.blake2b(os.path.abspath(images_path_dir).encode(), digest_size=16).hexdigest()
+    return os.path.join(IMAGE_INDEX_DIR, f'{folder_key}.sqlite3')
+
+
+def read_exif(file_path: str) -> tuple[Optional[int], Optional[str]]:
+    try:
+        with Image.open(file_path) as image:
+            exif = image.getexif()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None, None
+    captured = exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+    try:
+        captured_at = datetime.strptime(str(captured).strip('\x00 '), '%Y:%m:%d %H:%M:%S').isoformat()
+    except ValueError:
+        captured_at = None
+    return exif.get(EXIF_ORIENTATION), captured_at
+
+
+def natural_key(name: str) -> list:
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name.casefold())]
+
+
+class ImageIndex:
+    def __init__(self, images_path_dir: str, db_path: Optional[str] = None):
+        self.images_path_dir = images_path_dir
+        self.db_path = db_path or index_path(images_path_dir)
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.connection = sqlite3.connect(self.db_path)
+        self.connection.execute(SCHEMA)
+        self.connection.execute(PERCEPTUAL_SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def inspect(entry: os.DirEntry, image_info: image_scan.ImageInfo) -> tuple:
+        # reads the headers only, the contents are hashed by hash_contents
+        orientation, captured_at = read_exif(entry.path) if image_info.valid else (None, None)
+        return (
+            entry.name, entry.stat().st_size, entry.stat().st_mtime_ns, image_info.valid, image_info.format,
+            image_info.width, image_info.height, orientation, captured_at, None
+        )
+
+    def scan(self, metrics: Optional[RenderMetrics] = None, hash_contents: bool = True) -> list[IndexedImage]:
+        with measure(metrics, 'directory_scan'):
+            known = {
+                name: (size, mtime_ns)
+                for name, size, mtime_ns in self.connection.execute('SELECT name, size, mtime_ns FROM images')
+            }
+            entries = [entry for entry in os.scandir(self.images_path_dir) if entry.is_file()]
+            changed = [
+                entry for entry in entries
+                if known.get(entry.name) != (entry.stat().st_size, entry.stat().st_mtime_ns)
+            ]
+        removed = known.keys() - {entry.name for entry in entries}
+        logger.info(f'Indexing {self.images_path_dir}: {len(entries)} files, '
+                    f'{len(changed)} changed, {len(removed)} removed')
+
+        with measure(metrics, 'image_validation'):
+            image_infos = image_scan.scan_files([entry.path for entry in changed]) if changed else []
+            with ThreadPoolExecutor(max_workers=INDEX_THREADS) as executor:
+                rows = list(executor.map(self.inspect, changed, image_infos))
+        with self.connection:
+            self.connection.executemany('DELETE FROM images WHERE name = ?', [(name,) for name in removed])
+            self.connection.executemany('INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        if hash_contents:
+            self.hash_contents(metrics)
+        return self.images()
+
+    def hash_contents(self, metrics: Optional[RenderMetrics] = None):
+        # reading every file through is the slow part of a scan, so a preview can list the images before it
+        with measure(metrics, 'content_hashing'):
+            names = [name for name, in self.connection.execute(
+                'SELECT name FROM images WHERE valid AND content_hash IS NULL'
+            )]
+            with ThreadPoolExecutor(max_workers=INDEX_THREADS) as executor:
+                digests = list(executor.map(
+                    lambda name: file_digest(os.path.join(self.images_path_dir, name)), names
+                ))
+        with self.connection:
+            self.connection.executemany('UPDATE images SET content_hash = ? WHERE name = ?', zip(digests, names))
+
+    def perceptual_hashes(self) -> dict[str, tuple[int, float]]:
+        return {
+            content_hash: (dhash, sharpness)
+            for content_hash, dhash, sharpness in self.connection.execute('SELECT * FROM perceptual_hashes')
+        }
+
+    def store_perceptual_hashes(self, rows: list[tuple[str, int, float]]):
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO perceptual_hashes VALUES (?, ?, ?)', rows)
+
+    def images(self, valid_only: bool = False) -> list[IndexedImage]:
+        query = 'SELECT * FROM images' + (' WHERE valid' if valid_only else '')
+        return [
+            IndexedImage(os.path.join(self.images_path_dir, row[0]), *row[1:3], bool(row[3]), *row[4:])
+            for row in self.connection.execute(query)
+        ]
+
+
+def sort_images(images: list[IndexedImage], order: str = ORDER_FILENAME) -> list[IndexedImage]:
+    by_name = sorted(images, key=lambda image: natural_key(os.path.basename(image.path)))
+    if order == ORDER_CAPTURE_TIME:
+        # images without a capture time keep their filename order after the dated ones
+        return sorted(by_name, key=lambda image: (image.captured_at is None, image.captured_at or ''))
+    return by_name
+
+
+def indexed_images(images_path_dir: str, order: str = ORDER_FILENAME,
+                   metrics: Optional[RenderMetrics] = None) -> list[IndexedImage]:
+    with ImageIndex(images_path_dir) as index:
+        index.scan(metrics)
+        return sort_images(index.images(valid_only=True), order)
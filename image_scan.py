@@ -0,0 +1,142 @@
+import logging
+import mimetypes
+import os
+import re
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+from PIL import Image, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+HEADER_SIZE = 32
+PROBE_BATCH_SIZE = 64
+SCAN_THREADS = 16
+
+MAGIC_FORMATS = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+    (b'BM', 'BMP'),
+    (b'II*\x00', 'TIFF'),
+    (b'MM\x00*', 'TIFF'),
+)
+# ISO-BMFF still image brands that ffmpeg can usually decode even when Pillow has no plugin for them
+FTYP_IMAGE_BRANDS = (b'heic', b'heix', b'hevc', b'mif1', b'msf1', b'avif', b'avis')
+
+PROBE_INPUT_RE = re.compile(r"^Input #(\d+), (.+), from '(.*)':$")
+PROBE_VIDEO_RE = re.compile(r'^\s*Stream #(\d+):\d+.*?: Video: (\w+).*?, (\d+)x(\d+)')
+
+
+class ImageInfo(NamedTuple):
+    path: str
+    valid: bool
+    format: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+
+
+def sniff_format(header: bytes) -> Optional[str]:
+    for magic, image_format in MAGIC_FORMATS:
+        if header.startswith(magic):
+            return image_format
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'WEBP'
+    if header[4:8] == b'ftyp' and header[8:12] in FTYP_IMAGE_BRANDS:
+        return header[8:12].decode().upper()
+    return None
+
+
+def open_header(file_path: str) -> Optional[ImageInfo]:
+    # Image.open only parses the header, the pixel data is never decoded here
+    try:
+        with Image.open(file_path) as image:
+            return ImageInfo(file_path, True, image.format, *image.size)
+    except (UnidentifiedImageError, OSError, ValueError):
+        return None
+
+
+def inspect_image(file_path: str) -> tuple[ImageInfo, bool]:
+    # the second value tells whether the file still needs the ffmpeg probe fallback
+    try:
+        with open(file_path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+    except OSError as e:
+        logger.warning(f'{file_path} cannot be read: {e}')
+        return ImageInfo(file_path, False), False
+
+    sniffed_format = sniff_format(header)
+    mime_type, _ = mimetypes.guess_type(file_path)
+    if not sniffed_format and not (mime_type and mime_type.startswith('image')):
+        return ImageInfo(file_path, False), False
+
+    try:
+        if image_info := open_header(file_path):
+            return image_info, False
+    except Image.DecompressionBombError:
+        # past Pillow's pixel limit, ffmpeg reads the size and ingest decodes the image reduced
+        return ImageInfo(file_path, False, sniffed_format), True
+    if sniffed_format in ('JPEG', 'PNG', 'GIF', 'BMP', 'TIFF', 'WEBP'):
+        logger.warning(f'{file_path} looks like {sniffed_format} but its header is broken')
+        return ImageInfo(file_path, False, sniffed_format), False
+    return ImageInfo(file_path, False, sniffed_format), True
+
+
+def probe_batch(file_paths: list[str]) -> list[ImageInfo]:
+    args = ['ffmpeg', '-hide_banner', '-nostdin']
+    for file_path in file_paths:
+        args += ['-i', file_path]
+    # without an output ffmpeg only prints the input headers, and it stops at the first unreadable input
+    result = subprocess.run(args, capture_output=True, text=True, errors='replace')
+
+    parsed = dict()
+    for line in result.stderr.splitlines():
+        if input_match := PROBE_INPUT_RE.match(line):
+            parsed[int(input_match[1])] = ImageInfo(file_paths[int(input_match[1])], False, input_match[2])
+        elif (video_match := PROBE_VIDEO_RE.match(line)) and int(video_match[1]) in parsed:
+            index = int(video_match[1])
+            if not parsed[index].valid:
+                parsed[index] = ImageInfo(
+                    file_paths[index], True, video_match[2], int(video_match[3]), int(video_match[4])
+                )
+
+    image_infos = [parsed[index] for index in range(len(file_paths)) if index in parsed]
+    if len(image_infos) < len(file_paths):
+        failed_path = file_paths[len(image_infos)]
+        image_infos.append(ImageInfo(failed_path, False))
+        image_infos += probe_batch(file_paths[len(image_infos):]) if len(image_infos) < len(file_paths) else []
+    return image_infos
+
+
+def probe_images(file_paths: list[str]) -> list[ImageInfo]:
+    image_infos = []
+    for start in range(0, len(file_paths), PROBE_BATCH_SIZE):
+        image_infos += probe_batch(file_paths[start:start + PROBE_BATCH_SIZE])
+    return image_infos
+
+
+def scan_files(file_paths: list[str]) -> list[ImageInfo]:
+    with ThreadPoolExecutor(max_workers=SCAN_THREADS) as executor:
+        inspected = list(executor.map(inspect_image, file_paths))
+
+    image_infos = {image_info.path: image_info for image_info, _ in inspected}
+    needs_probe = [image_info.path for image_info, probe in inspected if probe]
+    if needs_probe:
+        logger.debug(f'probing {len(needs_probe)} files with ffmpeg')
+        image_infos.update((image_info.path, image_info) for image_info in probe_images(needs_probe))
+
+    for image_info in image_infos.values():
+        if not image_info.valid:
+            logger.warning(f'{image_info.path} is not a valid image')
+    return [image_infos[file_path] for file_path in file_paths]
+
+
+def scan_images(images_path_dir: str) -> list[ImageInfo]:
+    file_paths = [entry.path for entry in os.scandir(images_path_dir) if entry.is_file()]
+    return scan_files(file_paths)
+
+
+def valid_images(images_path_dir: str) -> list[str]:
+    return [image_info.path for image_info in scan_images(images_path_dir) if image_info.valid]
@@ -0,0 +1,238 @@
+import contextlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
+
+from PIL import Image, UnidentifiedImageError
+
+import image_index
+import render_control
+from frame_cache import FrameCache, file_digest
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 ** 2
+# Pillow keeps every decoded pixel in 4 bytes, ffmpeg's scaler holds about as much
+BYTES_PER_PIXEL = 4
+# sources decoding to more than this are reduced before ffmpeg or a normalize worker opens them, 256 MB is 64 MP
+DEFAULT_IMAGE_BUDGET_MB = 256
+# what all ingest threads may decode at once
+DEFAULT_MEMORY_BUDGET_MB = 1024
+# rows of an uncompressed source decoded at a time
+BAND_BYTES = 16 * MB
+PROXY_EXT = '.jpg'
+PROXY_QUALITY = 95
+PROXY_VARIANT = 'ingest'
+# scans and panoramas far past Pillow's decompression bomb limit are expected here, they are decoded reduced
+MAX_SOURCE_PIXELS = 2 ** 31
+# EXIF orientations that swap width and height
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+ORIENTATION_TRANSPOSES = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+REDUCIBLE_MODES = ('L', 'LA', 'RGB', 'RGBA')
+# Pillow's pixel limit is process wide, it is raised only while ingest parses the header of a source
+PIXEL_LIMIT_LOCK = threading.Lock()
+
+
+class MemoryBudget:
+    # a semaphore counting bytes, a reservation larger than the whole budget waits until it can run alone
+    def __init__(self, total_bytes: int):
+        self.total_bytes = total_bytes
+        self.available = total_bytes
+        self.condition = threading.Condition()
+
+    @contextlib.contextmanager
+    def reserve(self, nbytes: int):
+        nbytes = min(nbytes, self.total_bytes)
+        with self.condition:
+            self.condition.wait_for(lambda: self.available >= nbytes)
+            self.available -= nbytes
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.available += nbytes
+                self.condition.notify_all()
+
+
+def decoded_bytes(width: int, height: int) -> int:
+    return width * height * BYTES_PER_PIXEL
+
+
+def is_oversized(image: image_index.IndexedImage, image_budget_mb: int) -> bool:
+    return bool(image.width and image.height) and decoded_bytes(image.width, image.height) > image_budget_mb * MB
+
+
+def reduction_factor(width: int, height: int, frame_width: int, frame_height: int) -> int:
+    # the largest reduction that still leaves the image at least as large as it is shown inside the frame
+    return max(1, width // frame_width, height // frame_height)
+
+
+def worker_limit(images: list[image_index.IndexedImage], image_budget_mb: int, memory_budget_mb: int) -> int:
+    # a normalize worker holds one decoded source at a time, and ingestion keeps each within the per-image budget
+    largest = max((min(decoded_bytes(image.width, image.height), image_budget_mb * MB)
+                   for image in images if image.width and image.height), default=MB)
+    return max(1, memory_budget_mb * MB // largest)
+
+
+def open_source(source_path: str) -> Image.Image:
+    with PIXEL_LIMIT_LOCK:
+        default_limit = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = MAX_SOURCE_PIXELS
+        try:
+            return Image.open(source_path)
+        finally:
+            Image.MAX_IMAGE_PIXELS = default_limit
+
+
+def raw_layout(image: Image.Image) -> Optional[tuple[int, str, int, int]]:
+    # uncompressed TIFF, BMP and PPM rows sit at fixed offsets, so a band of rows decodes on its own
+    if len(image.tile) != 1:
+        return None
+    decoder, extents, offset, args = image.tile[0]
+    if decoder != 'raw' or tuple(extents) != (0, 0, *image.size):
+        return None
+    rawmode, stride, orientation = (args, 0, 1) if isinstance(args, str) else (*args, 0, 1)[:3]
+    if not stride:
+        try:
+            stride = len(Image.new(image.mode, (image.width, 1)).tobytes('raw', rawmode))
+        except ValueError:
+            return None
+    return offset, rawmode, stride, orientation
+
+
+def band_height(stride: int, factor: int) -> int:
+    # whole multiples of the factor, so every band reduces exactly like the full image would
+    return max(factor, BAND_BYTES // stride // factor * factor)
+
+
+def reduce_image(image: Image.Image, factor: int) -> Image.Image:
+    if image.mode not in REDUCIBLE_MODES:
+        image = image.convert('RGB')
+    return image.reduce(factor) if factor > 1 else image.copy()
+
+
+def reduce_in_bands(source_path: str, image: Image.Image, layout: tuple[int, str, int, int],
+                    factor: int) -> Image.Image:
+    offset, rawmode, stride, orientation = layout
+    width, height = image.size
+    band_rows = band_height(stride, factor)
+    reduced = None
+    with open(source_path, 'rb') as f:
+        for top in range(0, height, band_rows):
+            rows = min(band_rows, height - top)
+            # a bottom-up file stores the last row of the band first
+            f.seek(offset + (top if orientation > 0 else height - top - rows) * stride)
+            band = Image.frombytes(image.mode, (width, rows), f.read(rows * stride), 'raw', rawmode, stride,
+                                   orientation)
+            band_reduced = reduce_image(band, factor)
+            if reduced is None:
+                reduced = Image.new(band_reduced.mode, (-(-width // factor), -(-height // factor)))
+            reduced.paste(band_reduced, (0, top // factor))
+    return reduced
+
+
+def open_reduced(source_path: str, width: int, height: int, budget: Optional[MemoryBudget] = None) -> Image.Image:
+    # decodes the source at the smallest size that still fills width x height, upright, within the budget
+    with open_source(source_path) as image:
+        orientation = image.getexif().get(image_index.EXIF_ORIENTATION)
+        if orientation in TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+        factor = reduction_factor(image.width, image.height, width, height)
+        layout = raw_layout(image) if factor > 1 else None
+        if layout:
+            band_rows = min(image.height, band_height(layout[2], factor))
+            cost = decoded_bytes(image.width, band_rows) + decoded_bytes(-(-image.width // factor),
+                                                                         -(-image.height // factor))
+        else:
+            # JPEGs decode straight at a DCT scale of 1/2, 1/4 or 1/8, every other codec at full size
+            image.draft('RGB', (image.width // factor, image.height // factor))
+            factor = reduction_factor(image.width, image.height, width, height)
+            cost = decoded_bytes(*image.size)
+        with budget.reserve(cost) if budget else contextlib.nullcontext():
+            if layout:
+                reduced = reduce_in_bands(source_path, image, layout, factor)
+            else:
+                reduced = reduce_image(image, factor)
+    if orientation in ORIENTATION_TRANSPOSES:
+        reduced = reduced.transpose(ORIENTATION_TRANSPOSES[orientation])
+    return reduced
+
+
+def make_proxy(source_path: str, target_path: str, width: int, height: int,
+               budget: Optional[MemoryBudget] = None) -> str:
+    open_reduced(source_path, width, height, budget).convert('RGB').save(target_path, quality=PROXY_QUALITY)
+    return target_path
+
+
+def proxy_cached(image: image_index.IndexedImage, target_path: str, width: int, height: int,
+                 budget: MemoryBudget, frame_cache: Optional[FrameCache],
+                 control: render_control.RenderControl) -> tuple[str, bool]:
+    control.check()
+    if not frame_cache or not frame_cache.enabled:
+        return make_proxy(image.path, target_path, width, height, budget), False
+
+    key = frame_cache.make_key(image.content_hash or file_digest(image.path), width, height, '', PROXY_EXT,
+                               PROXY_VARIANT)
+    if cached_path := frame_cache.lookup(key, PROXY_EXT):
+        return cached_path, True
+    entry_path = frame_cache.new_entry_path(PROXY_EXT)
+    try:
+        make_proxy(image.path, entry_path, width, height, budget)
+    except Exception:
+        os.remove(entry_path)
+        raise
+    return frame_cache.store(key, PROXY_EXT, entry_path), False
+
+
+def proxy_path(work_dir: str, index: int) -> str:
+    return os.path.join(work_dir, f'proxy_{index:06d}{PROXY_EXT}')
+
+
+def ingest_images(images: list[image_index.IndexedImage], work_dir: str, width: int, height: int,
+                  image_budget_mb: int = DEFAULT_IMAGE_BUDGET_MB,
+                  memory_budget_mb: int = DEFAULT_MEMORY_BUDGET_MB, workers: Optional[int] = None,
+                  frame_cache: Optional[FrameCache] = None,
+                  control: Optional[render_control.RenderControl] = None) -> list[str]:
+    # replaces every source that would decode to more than the per-image budget with a reduced copy
+    if image_budget_mb <= 0 or memory_budget_mb <= 0:
+        raise ValueError('The image and memory budgets must be positive')
+    images_path_arr = [image.path for image in images]
+    oversized = [index for index, image in enumerate(images) if is_oversized(image, image_budget_mb)]
+    if not oversized:
+        return images_path_arr
+
+    control = control or render_control.RenderControl()
+    budget = MemoryBudget(memory_budget_mb * MB)
+    workers = workers or os.cpu_count() or 1
+    logger.info(f'Reducing {len(oversized)} images above {image_budget_mb} MB decoded to {width}x{height}, '
+                f'{memory_budget_mb} MB at once')
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(proxy_cached, images[index], proxy_path(work_dir, index), width, height, budget,
+                            frame_cache, control): index
+            for index in oversized
+        }
+        for future in as_completed(futures):
+            if control.cancelled.is_set():
+                executor.shutdown(wait=False, cancel_futures=True)
+                control.check()
+            index = futures[future]
+            try:
+                images_path_arr[index], hit = future.result()
+            except (UnidentifiedImageError, OSError, ValueError) as e:
+                # ffmpeg may still read what Pillow cannot, at its full size
+                logger.warning(f'{images[index].path} cannot be reduced, using it as it is: {e}')
+                continue
+            if frame_cache:
+                frame_cache.record(hit)
+    return images_path_arr
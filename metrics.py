@@ -0,0 +1,101 @@
+import contextlib
+import json
+import logging
+import os
+import sys
+import time
+from typing import Callable, Optional
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, peak memory is then left out of the report
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+metrics_hooks: list[Callable[[dict], None]] = []
+
+
+def register_metrics_hook(hook: Callable[[dict], None]):
+    metrics_hooks.append(hook)
+
+
+def unregister_metrics_hook(hook: Callable[[dict], None]):
+    with contextlib.suppress(ValueError):
+        metrics_hooks.remove(hook)
+
+
+def max_rss_mb(who) -> Optional[float]:
+    if resource is None:
+        return None
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    return round(resource.getrusage(who).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def snapshot() -> dict:
+    times = os.times()
+    return {
+        'wall': time.perf_counter(),
+        'cpu': times.user + times.system,
+        'children_cpu': times.children_user + times.children_system,
+    }
+
+
+def measure(metrics: Optional['RenderMetrics'], name: str):
+    return metrics.stage(name) if metrics else contextlib.nullcontext()
+
+
+class RenderMetrics:
+    def __init__(self, **context):
+        self.context = context
+        self.stages = []
+        self.started = snapshot()
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        start = snapshot()
+        try:
+            yield
+        finally:
+            end = snapshot()
+            self.stages.append({
+                'name': name,
+                'wall_s': round(end['wall'] - start['wall'], 3),
+                'cpu_s': round(end['cpu'] - start['cpu'], 3),
+                'children_cpu_s': round(end['children_cpu'] - start['children_cpu'], 3),
+                # the kernel only keeps the peak of the whole process, so a stage reports the peak up to its end and
+                # a later stage never shows less than an earlier one
+                'peak_rss_so_far_mb': max_rss_mb(resource.RUSAGE_SELF) if resource else None,
+                # the largest finished child so far, ffmpeg is by far the largest one
+                'children_peak_rss_so_far_mb': max_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+            })
+
+    def report(self) -> dict:
+        end = snapshot()
+        return {
+            'event': 'render_metrics',
+            **self.context,
+            'stages': self.stages,
+            'total': {
+                'wall_s': round(end['wall'] - self.started['wall'], 3),
+                'cpu_s': round(end['cpu'] - self.started['cpu'], 3),
+                'children_cpu_s': round(end['children_cpu'] - self.started['children_cpu'], 3),
+                'peak_rss_mb': max_rss_mb(resource.RUSAGE_SELF) if resource else None,
+                'children_peak_rss_mb': max_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+            },
+        }
+
+    def publish(self, metrics_file: Optional[str] = None) -> dict:
+        report = self.report()
+        report_line = json.dumps(report, default=str)
+        logger.info(report_line)
+        if metrics_file:
+            with open(metrics_file, 'a', encoding='utf-8') as f:
+                f.write(report_line + '\n')
+        for hook in list(metrics_hooks):
+            try:
+                hook(report)
+            except Exception:
+                logger.exception(f'Metrics hook {hook} failed')
+        return report
@@ -1,166 +1,686 @@
 import logging
 import mimetypes
 import os
-import time
 from typing import Callable, Optional
 
 import math
-import socket
 
-import contextlib
+import tempfile
 
 import threading
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import ffmpeg
 
+import audio
+import compositor
+import duplicates
+import encode_profiles
+import image_index
+import image_scan
+import ingest
+import progressive
+import render_control
+import render_manifest
+from frame_cache import FrameCache
+from metrics import RenderMetrics, measure
+from prenormalize import prenormalize_images
+from render_control import RenderCancelled, RenderControl
+from progress import default_progress_callback, get_progress_listener, progress_parser, update_progress
+
 logger = logging.getLogger(__name__)
 
 
-def progress_parser(sock: socket.socket, final_duration: float, progress_callback: Callable):
-    sock.settimeout(10)
-    try:
-        connection, client_address = sock.accept()
-    except socket.timeout:
-        logger.error("Timeout occurred while waiting for a connection")
-        return
+def is_valid_image(file_path):
+    logger.debug(f'checking {file_path}')
+    return image_scan.scan_files([file_path])[0].valid
 
-    data = b''
-    try:
-        while True:
-            more_data = connection.recv(16)
-            if not more_data:
-                break
-            data += more_data
-            bin_lines = data.split(b'\n')
-            for bin_line in bin_lines[:-1]:
-                line = bin_line.decode()
-                parts = line.split('=')
-                key = parts[0] if len(parts) > 0 else None
-                value = parts[1] if len(parts) > 1 else None
-                if key == 'out_time_ms':
-                    duration = int(value) / 1000000 if value.isdigit() else 0
-                    update_progress(duration, final_duration, progress_callback)
-            data = bin_lines[-1]
-    finally:
-        connection.close()
-
-
-
-
-@contextlib.contextmanager
-def get_progress_listener(final_duration: float, progress_callback: Callable):
-    sock = type("Closable", (object,), {"close": lambda self: "closed"})
-    listener = type("Joinable", (object,), {"join": lambda self: "joined"})
-
-    try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.bind(('localhost', 0))
-        listen_on = '{}:{:d}'.format(*sock.getsockname())
-        sock.listen(1)
-        listener = threading.Thread(target=progress_parser, args=(sock, final_duration, progress_callback))
-        listener.start()
-        yield listen_on
-    finally:
-        with contextlib.suppress(Exception):
-            listener.join()
-        with contextlib.suppress(Exception):
-            sock.close()
-
-
-
-def default_progress_callback(value: int, label: Optional[str]=None):
-    if label:
-        logger.debug(f'START REPORTING ON {label}')
-    for _ in range(value):
-        print('+', end = '')
-    for _ in range(value, 100):
-        print('-', end = '')
-    print()
-
-
-def update_progress(done: float, total: float, progress_callback: Callable) -> int:
-    calculated_progress = min(100, math.ceil((done / total)*100))
-    logger.debug(f'CALCULATION IS DONE for {calculated_progress}%: {done} of {total}')
-    progress_callback(calculated_progress)
-    return calculated_progress
 
+PIPELINE_CONCAT = 'concat'
+PIPELINE_FILTERGRAPH = 'filtergraph'
+PIPELINE_COMPOSITOR = 'compositor'
 
-def is_valid_image(file_path):
-    logger.debug(f'checking {file_path}')
-    mime_type, _ = mimetypes.guess_type(file_path)
-    if mime_type and mime_type.startswith('image'):
-        logger.debug(f'{file_path} is a valid image by mimetype')
-        return True
-    # If mimetype didn't recognize, try probing with ffmpeg
-    try:
-        probe_info = ffmpeg.probe(file_path)
-        if probe_info['streams'][0]['codec_type'] == 'video':
-            logger.debug(f'{file_path} is a valid image by probe_info')
-            return True
-    except ffmpeg.Error:
-        pass
-    logger.warning(f'{file_path} is not a valid image')
-    return False
+FRAME_WIDTH = 1920
+FRAME_HEIGHT = 1080
 
+OUTPUT_AUDIO_ARGS = {'c:a': 'aac'}
 
-def create_slideshow(images_path_dir: str, audio_path: str, output_mp4_path: str,
-                         progress_callback: Callable = default_progress_callback):
-    start_time = time.time()
+INCREMENTAL_SEGMENT_SLIDES = 10
 
-    images_path_arr = [
-        filepath for filename in os.listdir(images_path_dir) if
-        is_valid_image(filepath := os.path.join(images_path_dir, filename))
-    ]
+DRAFT_WIDTH = 640
+DRAFT_HEIGHT = 360
 
-    images_count = len(images_path_arr)
-    audio_length = float(ffmpeg.probe(audio_path)['format']['duration'])
-    image_rate = images_count / audio_length
-    image_fps = image_rate*10
+POSTER_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+# formats the concat demuxer can keep one decoder for, with the extension ffmpeg picks their encoder by
+CONCAT_FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'BMP': '.bmp', 'TIFF': '.tif'}
+# Pillow and ffmpeg names of the same codecs
+FORMAT_ALIASES = {'MPO': 'JPEG', 'MJPEG': 'JPEG'}
+
+
+def list_images(images_path_dir: str, order: str = image_index.ORDER_FILENAME) -> list[str]:
+    return [image.path for image in image_index.indexed_images(images_path_dir, order)]
 
-    logger.info(f'Audio length: {audio_length}, Images count: {images_count}')
-    logger.debug(f'Image rate: {image_rate}, Image fps: {image_fps}')
 
-    my_audio = ffmpeg.input(audio_path)
+def fit_frame(stream, width: int, height: int, per_frame: bool = False):
+    # per_frame lets a single input carry slides of different sizes without a filtergraph re-init
+    eval_mode = {'eval': 'frame'} if per_frame else {}
+    return stream.filter(
+        'scale', size=f'{width}x{height}', force_original_aspect_ratio='decrease', **eval_mode
+    ).filter(
+        'pad', width=width, height=height, x='(ow-iw)/2', y='(oh-ih)/2', color='black', **eval_mode
+    ).filter(
+        'setsar', ratio=1
+    )
 
+
+def normalize_frames(stream, image_fps: float, per_frame: bool = False):
+    return fit_frame(stream, FRAME_WIDTH, FRAME_HEIGHT, per_frame).filter('fps', fps = image_fps)
+
+
+def image_format_key(file_path: str, known_format: Optional[str] = None) -> str:
+    # the format of the content, a WebP named .jpg must not reach the JPEG decoder of the concat demuxer
+    if not known_format:
+        try:
+            with open(file_path, 'rb') as f:
+                known_format = image_scan.sniff_format(f.read(image_scan.HEADER_SIZE))
+        except OSError:
+            known_format = None
+    if known_format:
+        known_format = known_format.upper()
+        return FORMAT_ALIASES.get(known_format, known_format)
+    mime_type, _ = mimetypes.guess_type(file_path)
+    return mime_type or os.path.splitext(file_path)[1].lower()
+
+
+def unify_image_formats(images_path_arr: list[str], work_dir: str, control: Optional[RenderControl] = None,
+                        image_formats: Optional[list[Optional[str]]] = None) -> list[str]:
+    # the concat demuxer keeps the decoder of the first file, so every slide must share one codec
+    image_formats = image_formats or [None] * len(images_path_arr)
+    formats = [image_format_key(filepath, known) for filepath, known in zip(images_path_arr, image_formats)]
+    format_counts = Counter(formats)
+    # ties go to the format met first, so a render and its incremental re-renders pick the same one
+    dominant_format = max(format_counts, key=format_counts.get)
+    if dominant_format not in CONCAT_FORMAT_EXTENSIONS:
+        dominant_format = 'PNG'
+    target_ext = CONCAT_FORMAT_EXTENSIONS[dominant_format]
+
+    unified_path_arr = []
+    for index, (filepath, file_format) in enumerate(zip(images_path_arr, formats)):
+        if file_format == dominant_format:
+            unified_path_arr.append(filepath)
+            continue
+        converted_path = os.path.join(work_dir, f'{index:06d}{target_ext}')
+        logger.debug(f'converting {filepath} to {converted_path}')
+        render_control.run(ffmpeg.input(filepath).output(converted_path, vframes=1).overwrite_output(), control)
+        unified_path_arr.append(converted_path)
+    return unified_path_arr
+
+
+def quote_concat_path(file_path: str) -> str:
+    return "'{}'".format(os.path.abspath(file_path).replace("'", "'\\''"))
+
+
+def write_concat_list(images_path_arr: list[str], slide_durations: list[float], list_path: str):
+    with open(list_path, 'w', encoding='utf-8') as f:
+        f.write('ffconcat version 1.0\n')
+        for filepath, slide_duration in zip(images_path_arr, slide_durations):
+            f.write(f'file {quote_concat_path(filepath)}\n')
+            f.write(f'duration {slide_duration:.6f}\n')
+        # the last entry is repeated, otherwise the demuxer drops the duration of the final slide
+        f.write(f'file {quote_concat_path(images_path_arr[-1])}\n')
+
+
+def write_join_list(segments_path_arr: list[str], list_path: str):
+    with open(list_path, 'w', encoding='utf-8') as f:
+        f.write('ffconcat version 1.0\n')
+        for filepath in segments_path_arr:
+            f.write(f'file {quote_concat_path(filepath)}\n')
+
+
+def build_filtergraph_video(images_path_arr: list[str], image_rate: float, image_fps: float):
     images_stream_arr = [
-        ffmpeg.input(
-            filename, r = image_rate
-        ).filter(
-            'scale', size='1920x1080', force_original_aspect_ratio='decrease'
-        ).filter(
-            'pad', width=1920, height=1080, x='(ow-iw)/2', y='(oh-ih)/2', color='black'
-        ).filter(
-            'setsar', ratio=1
-        ).filter(
-            'fps', fps = image_fps
-        ) for filename in images_path_arr
+        normalize_frames(ffmpeg.input(filename, r = image_rate), image_fps) for filename in images_path_arr
     ]
+    return ffmpeg.concat(*images_stream_arr)
+
+
+def build_concat_video(images_path_arr: list[str], slide_duration: float, image_fps: float, work_dir: str,
+                       normalized: bool = False, image_formats: Optional[list[Optional[str]]] = None):
+    concat_list_path = os.path.join(work_dir, 'slides.ffconcat')
+    slide_durations = [slide_duration] * len(images_path_arr)
+    if normalized:
+        write_concat_list(images_path_arr, slide_durations, concat_list_path)
+        slides = ffmpeg.input(concat_list_path, f='concat', safe=0)
+        return slides.filter('setsar', ratio=1).filter('fps', fps = image_fps)
+
+    write_concat_list(unify_image_formats(images_path_arr, work_dir, image_formats=image_formats), slide_durations,
+                      concat_list_path)
+    slides = ffmpeg.input(concat_list_path, f='concat', safe=0, reinit_filter=0)
+    return normalize_frames(slides, image_fps, per_frame=True)
+
+
+def run_with_progress(output_stream, final_duration: float, progress_callback: Callable,
+                      event_callback: Optional[Callable] = None, source: Optional[str] = None,
+                      progress_state: Optional[dict] = None,
+                      control: Optional[RenderControl] = None):
+    progress_state = dict() if progress_state is None else progress_state
+    if control:
+        # a cancelled render does not open another listener just to wait for an ffmpeg that never starts
+        control.check()
+    with get_progress_listener(final_duration, progress_callback, progress_state,
+                               event_callback, source) as progress_socket:
+        render_control.run(output_stream.overwrite_output().global_args(
+            '-progress', 'http://{}'.format(progress_socket)
+        ), control)
+
+
+def run_streamed(output_stream, stream: progressive.StreamOutput, final_duration: float, progress_callback: Callable,
+                 event_callback: Optional[Callable] = None, control: Optional[RenderControl] = None):
+    progress_state = dict()
+    with progressive.FragmentMonitor(stream, progress_state, event_callback):
+        run_with_progress(output_stream, final_duration, progress_callback, event_callback,
+                                 source=os.path.basename(stream.target), progress_state=progress_state,
+                                 control=control)
+
+
+def mux_audio(video, audio_path: str, output_mp4_path: str, final_duration: float,
+              control: Optional[RenderControl] = None):
+    muxed = ffmpeg.output(video, ffmpeg.input(audio_path).audio, output_mp4_path, c='copy')
+    run_with_progress(muxed, final_duration, lambda *args: None, control=control)
+
+
+def slide_frame_counts(images_count: int, slide_duration: float, fps: float) -> list[int]:
+    # boundaries are rounded on the global timeline, so segments never drift from the audio
+    boundaries = [math.floor(index * slide_duration * fps + 0.5) for index in range(images_count + 1)]
+    return [end - start for start, end in zip(boundaries, boundaries[1:])]
+
+
+def split_segments(images_count: int, segments: int) -> list[tuple[int, int]]:
+    segments = max(1, min(segments, images_count))
+    bounds = [images_count * index // segments for index in range(segments + 1)]
+    return list(zip(bounds, bounds[1:]))
+
+
+class SegmentProgress:
+    def __init__(self, total_duration: float, progress_callback: Callable):
+        self.total_duration = total_duration
+        self.progress_callback = progress_callback
+        self.done = dict()
+        self.lock = threading.Lock()
+
+    def segment_callback(self, index: int, segment_duration: float) -> Callable:
+        def callback(value: int, label: Optional[str] = None):
+            with self.lock:
+                self.done[index] = segment_duration * value / 100
+                done = sum(self.done.values())
+            update_progress(done, self.total_duration, self.progress_callback)
+        return callback
+
+
+def encoder_settings(settings: dict, normalized: bool) -> dict:
+    return {
+        'video': encode_profiles.video_args(settings), 'size': [FRAME_WIDTH, FRAME_HEIGHT], 'normalized': normalized
+    }
+
+
+def slides_video(images_path_arr: list[str], frame_counts: list[int], list_path: str, normalized: bool,
+                 fps: float) -> tuple:
+    # returns the slides as one stream together with its frame count
+    slides = [(filepath, frames) for filepath, frames in zip(images_path_arr, frame_counts) if frames]
+    write_concat_list([filepath for filepath, _ in slides], [frames / fps for _, frames in slides], list_path)
+
+    if normalized:
+        video = ffmpeg.input(list_path, f='concat', safe=0).filter('setsar', ratio=1).filter('fps', fps=fps)
+    else:
+        video = normalize_frames(ffmpeg.input(list_path, f='concat', safe=0, reinit_filter=0), fps, per_frame=True)
+    return video, sum(frames for _, frames in slides)
+
+
+def encode_slides(images_path_arr: list[str], frame_counts: list[int], list_path: str, output_path: str,
+                  normalized: bool, settings: dict, progress_callback: Callable, keyframes: Optional[str] = None,
+                  encoder_threads: Optional[int] = None, event_callback: Optional[Callable] = None,
+                  stream: Optional[progressive.StreamOutput] = None, audio_path: Optional[str] = None,
+                  control: Optional[RenderControl] = None):
+    fps = settings['fps']
+    video, total_frames = slides_video(images_path_arr, frame_counts, list_path, normalized, fps)
+    output_args = {**encode_profiles.video_args(settings, keyframes), 'frames:v': total_frames}
+    if encoder_threads:
+        output_args['threads'] = encoder_threads
+    if stream:
+        # the progressive output carries the audio too, so it plays while the encode goes on
+        # the still profiles put the fragment key frames into their own expression, see render_still
+        output = ffmpeg.output(video, ffmpeg.input(audio_path).audio, stream.target,
+                               **{**progressive.stream_output_args(stream), **output_args})
+        run_streamed(output, stream, total_frames / fps, progress_callback, event_callback, control)
+        return
+    run_with_progress(ffmpeg.output(video, output_path, **output_args), total_frames / fps, progress_callback,
+                      event_callback, source=os.path.basename(output_path), control=control)
+
+
+def encode_segment(images_path_arr: list[str], frame_counts: list[int], list_path: str, segment_path: str,
+                   normalized: bool, settings: dict, keyframes: Optional[str], encoder_threads: int,
+                   progress_callback: Callable, event_callback: Optional[Callable] = None,
+                   control: Optional[RenderControl] = None):
+    # a segment only gets its final name once it is complete, so an interrupted render is never reused
+    partial_path = f'{os.path.splitext(segment_path)[0]}.partial.mp4'
+    with render_control.removed_on_cancel([partial_path]):
+        encode_slides(images_path_arr, frame_counts, list_path, partial_path, normalized, settings,
+                      progress_callback, keyframes=keyframes, encoder_threads=encoder_threads,
+                      event_callback=event_callback, control=control)
+    os.replace(partial_path, segment_path)
+    return segment_path
+
+
+def render_still(images_path_arr: list[str], video_path: str, audio_length: float,
+                 work_dir: str, normalized: bool, settings: dict, progress_callback: Callable,
+                 event_callback: Optional[Callable] = None, threads: Optional[int] = None,
+                 stream: Optional[progressive.StreamOutput] = None, audio_path: Optional[str] = None,
+                 control: Optional[RenderControl] = None,
+                 image_formats: Optional[list[Optional[str]]] = None):
+    if not normalized:
+        images_path_arr = unify_image_formats(images_path_arr, work_dir, control, image_formats)
+
+    slide_duration = audio_length / len(images_path_arr)
+    frame_counts = slide_frame_counts(len(images_path_arr), slide_duration, settings['fps'])
+    encode_slides(images_path_arr, frame_counts, os.path.join(work_dir, 'slides.ffconcat'), video_path,
+                  normalized, settings, progress_callback,
+                  keyframes=encode_profiles.keyframe_expr(slide_duration, settings['fps'],
+                                                          fragment_s=stream.fragment_s if stream else None),
+                  encoder_threads=threads, event_callback=event_callback, stream=stream,
+                  audio_path=audio_path, control=control)
+
+
+def is_poster(rendition: dict) -> bool:
+    return os.path.splitext(rendition['output'])[1].lower() in POSTER_EXTENSIONS
+
+
+def fit_rendition(video, rendition: dict):
+    width, height = rendition.get('width', FRAME_WIDTH), rendition.get('height', FRAME_HEIGHT)
+    return video if (width, height) == (FRAME_WIDTH, FRAME_HEIGHT) else fit_frame(video, width, height)
+
+
+def rendition_output(video, audio_stream, rendition: dict, settings: dict, keyframes: Optional[str],
+                     total_frames: int, encoder_threads: Optional[int]):
+    # a rendition is {'output': path, 'width': ..., 'height': ..., 'crf': ..., 'preset': ..., 'format': ...}
+    video = fit_rendition(video, rendition)
+    rendition_settings = {**settings, **{key: rendition[key] for key in ('crf', 'preset') if key in rendition}}
+    output_args = {**encode_profiles.video_args(rendition_settings, keyframes), 'frames:v': total_frames, 'c:a': 'copy'}
+    if encoder_threads:
+        output_args['threads'] = encoder_threads
+    if 'format' in rendition:
+        output_args['f'] = rendition['format']
+    return ffmpeg.output(video, audio_stream, rendition['output'], **output_args)
+
+
+def render_renditions(images_path_arr: list[str], renditions: list[dict], audio_future: Future, audio_length: float,
+                      work_dir: str, normalized: bool, settings: dict, progress_callback: Callable,
+                      event_callback: Optional[Callable] = None, threads: Optional[int] = None,
+                      control: Optional[RenderControl] = None,
+                      image_formats: Optional[list[Optional[str]]] = None):
+    # the slides are decoded and normalized once, then split between the encoders of every rendition
+    if not normalized:
+        images_path_arr = unify_image_formats(images_path_arr, work_dir, control, image_formats)
+
+    fps = settings['fps']
+    slide_duration = audio_length / len(images_path_arr)
+    frame_counts = slide_frame_counts(len(images_path_arr), slide_duration, fps)
+    video, total_frames = slides_video(images_path_arr, frame_counts, os.path.join(work_dir, 'slides.ffconcat'),
+                                       normalized, fps)
+    keyframes = encode_profiles.keyframe_expr(slide_duration, fps) if encode_profiles.is_still(settings) else None
+
+    videos = [rendition for rendition in renditions if not is_poster(rendition)]
+    branches = video.split()
+    audio_stream = ffmpeg.input(audio_future.result()).audio
+    encoder_threads = max(1, threads // len(videos)) if threads else None
+    outputs = [
+        rendition_output(branches[index], audio_stream, rendition, settings, keyframes, total_frames, encoder_threads)
+        for index, rendition in enumerate(videos)
+    ]
+    logger.info(f'Encoding {len(outputs)} renditions in one pass')
+    run_with_progress(ffmpeg.merge_outputs(*outputs), audio_length, progress_callback, event_callback,
+                      control=control)
 
-    images_concat = ffmpeg.concat(*images_stream_arr)
-    images_audio = ffmpeg.concat(images_concat, my_audio, v=1, a=1)
+    # posters are taken from the first rendition, an output that stops after one frame would end the progress report
+    for rendition in renditions:
+        if is_poster(rendition):
+            poster = fit_rendition(ffmpeg.input(videos[0]['output']).video, rendition)
+            render_control.run(poster.output(rendition['output'], **{'frames:v': 1}).overwrite_output(), control)
 
-    video_output = ffmpeg.output(
-        images_audio, output_mp4_path,
-        **{'c:v': 'libx264', 'pix_fmt': 'yuv420p', 'color_range': 'pc', 'c:a': 'aac', 'r': 1}
-    ).overwrite_output()
 
-    with get_progress_listener(audio_length, progress_callback) as progress_socket:
-        video_output.global_args(
-            '-progress', 'http://{}'.format(progress_socket)
-        ).run(
-            quiet=True
-        )
+def render_segmented(images_path_arr: list[str], audio_future: Future, output_mp4_path: str, audio_length: float,
+                     segments: int, work_dir: str, normalized: bool, settings: dict, progress_callback: Callable,
+                     source_hashes: Optional[list[str]] = None, event_callback: Optional[Callable] = None,
+                     threads: Optional[int] = None, control: Optional[RenderControl] = None,
+                     image_formats: Optional[list[Optional[str]]] = None):
+    if not normalized:
+        images_path_arr = unify_image_formats(images_path_arr, work_dir, control, image_formats)
 
+    images_count = len(images_path_arr)
+    fps = settings['fps']
+    slide_duration = audio_length / images_count
+    frame_counts = slide_frame_counts(images_count, slide_duration, fps)
+    segment_ranges = [
+        (start, end) for start, end in split_segments(images_count, segments) if sum(frame_counts[start:end])
+    ]
 
-    slideshow_length = float(ffmpeg.probe(output_mp4_path)['format']['duration'])
-    logger.info(f'Created slideshow length: {slideshow_length}')
-    update_progress(slideshow_length, audio_length, progress_callback)
+    segment_settings = encoder_settings(settings, normalized)
+    if source_hashes is None:
+        segment_dir = work_dir
+        fingerprints = [f'{index:04d}' for index in range(len(segment_ranges))]
+        reusable = set()
+    else:
+        segment_dir = render_manifest.segments_dir(output_mp4_path)
+        os.makedirs(segment_dir, exist_ok=True)
+        fingerprints = [
+            render_manifest.segment_fingerprint(source_hashes[start:end], frame_counts[start:end], segment_settings)
+            for start, end in segment_ranges
+        ]
+        manifest = render_manifest.load_manifest(output_mp4_path)
+        if manifest and render_manifest.timeline_changed(manifest, images_count, audio_length):
+            logger.info('Slide timeline changed since the last render, re-encoding every segment')
+            render_manifest.remove_stale_segments(output_mp4_path, [])
+        reusable = render_manifest.reusable_segments(output_mp4_path, fingerprints)
+
+    segments_path_arr = [
+        os.path.join(segment_dir, render_manifest.segment_file_name(fingerprint)) for fingerprint in fingerprints
+    ]
+    segment_progress = SegmentProgress(audio_length, progress_callback)
+    segment_callbacks = [
+        segment_progress.segment_callback(index, sum(frame_counts[start:end]) / fps)
+        for index, (start, end) in enumerate(segment_ranges)
+    ]
+    dirty = dict()
+    for index, fingerprint in enumerate(fingerprints):
+        if fingerprint in reusable:
+            segment_callbacks[index](100)
+        else:
+            dirty[fingerprint] = index
+
+    logger.info(f'Encoding {len(dirty)} of {len(segment_ranges)} segments')
+    if dirty:
+        # the thread budget is shared by the concurrent encoders
+        threads = threads or os.cpu_count() or 1
+        encode_workers = min(len(dirty), threads)
+        encoder_threads = max(1, threads // encode_workers)
+        logger.debug(f'{encode_workers} concurrent encoders with {encoder_threads} threads each')
+        with ThreadPoolExecutor(max_workers=encode_workers) as executor:
+            futures = [
+                executor.submit(
+                    encode_segment, images_path_arr[start:end], frame_counts[start:end],
+                    os.path.join(work_dir, f'segment_{index:04d}.ffconcat'), segments_path_arr[index],
+                    normalized, settings,
+                    encode_profiles.keyframe_expr(slide_duration, fps, start, sum(frame_counts[:start])),
+                    encoder_threads, segment_callbacks[index], event_callback, control
+                ) for index in dirty.values() for start, end in [segment_ranges[index]]
+            ]
+            for future in futures:
+                future.result()
+
+    join_list_path = os.path.join(work_dir, 'segments.ffconcat')
+    write_join_list(segments_path_arr, join_list_path)
+    joined = ffmpeg.input(join_list_path, f='concat', safe=0)
+    mux_audio(joined.video, audio_future.result(), output_mp4_path, audio_length, control)
+
+    if source_hashes is not None:
+        render_manifest.save_manifest(output_mp4_path, {
+            'images_count': images_count,
+            'audio_length': audio_length,
+            'encoder': segment_settings,
+            'segments': [
+                {'start': start, 'end': end, 'fingerprint': fingerprint}
+                for (start, end), fingerprint in zip(segment_ranges, fingerprints)
+            ],
+        })
+        render_manifest.remove_stale_segments(output_mp4_path, fingerprints)
+
+
+def render_filtergraph(images_path_arr: list[str], audio_path: str, output_mp4_path: str, audio_length: float,
+                       settings: dict, progress_callback: Callable, event_callback: Optional[Callable] = None,
+                       threads: Optional[int] = None, control: Optional[RenderControl] = None,
+                       metrics: Optional[RenderMetrics] = None):
+    image_rate = len(images_path_arr) / audio_length
+    with measure(metrics, 'graph_construction'):
+        images_concat = build_filtergraph_video(images_path_arr, image_rate, image_rate * 10)
+        video_output = ffmpeg.output(
+            ffmpeg.concat(images_concat, ffmpeg.input(audio_path), v=1, a=1), output_mp4_path,
+            **encode_profiles.video_args(settings), **OUTPUT_AUDIO_ARGS, **({'threads': threads} if threads else {})
+        )
+    with measure(metrics, 'encode'):
+        run_with_progress(video_output, audio_length, progress_callback, event_callback, control=control)
+
+
+def render_compositor(images_path_arr: list[str], audio_future: Future, output_mp4_path: str, audio_length: float,
+                      settings: dict, motion: compositor.Motion, progress_callback: Callable,
+                      event_callback: Optional[Callable] = None, workers: Optional[int] = None,
+                      threads: Optional[int] = None, control: Optional[RenderControl] = None):
+    frame_counts = slide_frame_counts(len(images_path_arr), audio_length / len(images_path_arr), settings['fps'])
+    compositor.render_composited(
+        images_path_arr, frame_counts, audio_future.result(), output_mp4_path, settings, motion, progress_callback,
+        event_callback=event_callback, workers=workers, threads=threads, control=control
+    )
+
+
+def render_concat(images_path_arr: list[str], video_path: str, audio_length: float, work_dir: str, normalized: bool,
+                  settings: dict, progress_callback: Callable, event_callback: Optional[Callable] = None,
+                  threads: Optional[int] = None, stream: Optional[progressive.StreamOutput] = None,
+                  audio_path: Optional[str] = None, control: Optional[RenderControl] = None,
+                  image_formats: Optional[list[Optional[str]]] = None,
+                  metrics: Optional[RenderMetrics] = None):
+    # the legacy timing: one concat graph resampled from ten times the slide rate to the output rate
+    image_fps = len(images_path_arr) / audio_length * 10
+    logger.debug(f'Image fps: {image_fps}')
+    # caps the encoder threads, ffmpeg otherwise sizes its pools to every core
+    output_args = {**encode_profiles.video_args(settings), **({'threads': threads} if threads else {})}
+    with measure(metrics, 'graph_construction'):
+        images_concat = build_concat_video(images_path_arr, audio_length / len(images_path_arr), image_fps, work_dir,
+                                           normalized=normalized, image_formats=image_formats)
+        if stream:
+            video_output = ffmpeg.output(images_concat, ffmpeg.input(audio_path).audio, stream.target,
+                                         **{**output_args, **progressive.stream_output_args(stream)})
+        else:
+            video_output = ffmpeg.output(images_concat, video_path, **output_args)
+    with measure(metrics, 'encode'):
+        if stream:
+            run_streamed(video_output, stream, audio_length, progress_callback, event_callback, control)
+        else:
+            run_with_progress(video_output, audio_length, progress_callback, event_callback, control=control)
+
+
+def render_single(images_path_arr: list[str], audio_future: Future, output_mp4_path: str, audio_length: float,
+                  work_dir: str, normalized: bool, settings: dict, frame_counted: bool, progress_callback: Callable,
+                  event_callback: Optional[Callable] = None, threads: Optional[int] = None,
+                  stream: Optional[progressive.StreamOutput] = None, control: Optional[RenderControl] = None,
+                  image_formats: Optional[list[Optional[str]]] = None,
+                  metrics: Optional[RenderMetrics] = None):
+    # a progressive output is encoded together with the audio and remuxed into the output afterwards, otherwise
+    # the video is muxed with the audio once both are ready
+    video_path = os.path.join(work_dir, 'video.mp4')
+    stream_audio_path = audio_future.result() if stream else None
+    if frame_counted:
+        with measure(metrics, 'encode'):
+            render_still(
+                images_path_arr, video_path, audio_length, work_dir, normalized=normalized, settings=settings,
+                progress_callback=progress_callback, event_callback=event_callback, threads=threads, stream=stream,
+                audio_path=stream_audio_path, control=control, image_formats=image_formats
+            )
+    else:
+        render_concat(
+            images_path_arr, video_path, audio_length, work_dir, normalized, settings, progress_callback,
+            event_callback=event_callback, threads=threads, stream=stream, audio_path=stream_audio_path,
+            control=control, image_formats=image_formats, metrics=metrics
+        )
+    if stream:
+        logger.info(f'Progressive output {stream.target} is complete, remuxing it')
+        with measure(metrics, 'remux'):
+            progressive.remux_faststart(stream.target, output_mp4_path, control)
+        progressive.remove_remuxed(stream)
+        return
+    with measure(metrics, 'audio_mux'):
+        mux_audio(ffmpeg.input(video_path).video, audio_future.result(), output_mp4_path, audio_length, control)
 
-    end_time = time.time()
-    execution_time = end_time - start_time
 
-    print(f'Execution time: {execution_time} seconds')
+def create_slideshow(images_path_dir: str, audio_path: str, output_mp4_path: str,
+                         progress_callback: Callable = default_progress_callback,
+                         pipeline: str = PIPELINE_CONCAT, prenormalize: bool = False,
+                         workers: Optional[int] = None, frame_cache: bool = True, segments: int = 1,
+                         incremental: bool = False, order: str = image_index.ORDER_FILENAME,
+                         encode_profile: str = encode_profiles.PROFILE_LEGACY, crf: Optional[int] = None,
+                         preset: Optional[str] = None, audio_mode: str = audio.AUDIO_AAC,
+                         event_callback: Optional[Callable] = None, metrics_file: Optional[str] = None,
+                         threads: Optional[int] = None, renditions: Optional[list[dict]] = None,
+                         draft: bool = False, transition: str = compositor.TRANSITION_CROSSFADE,
+                         transition_duration: float = compositor.DEFAULT_TRANSITION_DURATION, ken_burns: bool = True,
+                         dedupe: bool = False, duplicate_threshold: int = duplicates.DEFAULT_THRESHOLD,
+                         stream: Optional[str] = None, fragment_s: float = progressive.FRAGMENT_SECONDS,
+                         niceness: int = 0, filter_threads: Optional[int] = None,
+                         image_budget_mb: int = ingest.DEFAULT_IMAGE_BUDGET_MB,
+                         memory_budget_mb: int = ingest.DEFAULT_MEMORY_BUDGET_MB,
+                         control: Optional[RenderControl] = None):
+    # the control cancels the render from another thread and holds its priority and filter thread limits
+    control = control or RenderControl()
+    control.set_limits(niceness, filter_threads)
+    render_metrics = RenderMetrics(output=output_mp4_path, pipeline=pipeline, prenormalize=prenormalize,
+                                   segments=segments, encode_profile=encode_profile, draft=draft, dedupe=dedupe)
+
+    indexed_images = image_index.indexed_images(images_path_dir, order, render_metrics)
+    if dedupe:
+        # bursts and copies collapse to their sharpest shot, which keeps the place of the first one
+        with render_metrics.stage('dedupe'):
+            clusters = duplicates.find_duplicates(images_path_dir, indexed_images, duplicate_threshold)
+            indexed_images = duplicates.drop_duplicates(indexed_images, clusters)
+    images_path_arr = [image.path for image in indexed_images]
+    content_hashes = [image.content_hash for image in indexed_images]
+
+    images_count = len(images_path_arr)
+    if not images_count:
+        # every later stage divides by the image count
+        raise ValueError(f'No images to render in {images_path_dir}')
+    with render_metrics.stage('audio_probe'):
+        audio_source = audio.probe_audio(audio_path)
+    audio_length = audio_source.duration
+    if audio_length <= 0:
+        raise ValueError(f'{audio_path} has no audio to time the slides by')
+    settings = encode_profiles.encode_settings(encode_profile, crf, preset)
+    # the still profiles count the frames of each slide, the legacy one resamples a concat graph
+    frame_counted = encode_profiles.is_still(settings)
+    if draft:
+        # a quick look at the slide order and timing: small frames decoded at reduced size, one fast pass
+        logger.info('Draft render, ignoring the pipeline, segment and rendition options')
+        settings = encode_profiles.draft_settings(settings)
+        # a draft times its slides like the final render would, segments and renditions count frames too
+        frame_counted = (frame_counted or bool(renditions) or segments > 1
+                         or incremental and images_count > INCREMENTAL_SEGMENT_SLIDES)
+        pipeline, segments, incremental, renditions = PIPELINE_CONCAT, 1, False, None
+    if pipeline == PIPELINE_COMPOSITOR:
+        if segments > 1 or incremental:
+            raise ValueError('The compositor renders in a single pass, without segments')
+        if transition not in compositor.TRANSITIONS:
+            raise ValueError(f'Unknown transition {transition}, expected one of {", ".join(compositor.TRANSITIONS)}')
+        settings = {**settings, 'fps': compositor.COMPOSITOR_FPS}
+    # the compositor works on the cached pre-scaled slides
+    normalized = prenormalize or draft or pipeline == PIPELINE_COMPOSITOR
+    frame_size = (DRAFT_WIDTH, DRAFT_HEIGHT) if draft else (FRAME_WIDTH, FRAME_HEIGHT)
+    if renditions and (pipeline != PIPELINE_CONCAT or segments > 1 or incremental):
+        raise ValueError('Renditions are encoded in a single concat pass, without segments')
+    if stream and (pipeline != PIPELINE_CONCAT or segments > 1 or incremental or renditions):
+        raise ValueError('Progressive output is written by a single concat pass, without segments or renditions')
+    render_metrics.context.update(images=images_count, audio_length=audio_length)
+
+    logger.info(f'Audio length: {audio_length}, Images count: {images_count}, Pipeline: {pipeline}, '
+                f'Encode profile: {settings}')
+
+    partial_outputs = [output_mp4_path, *(rendition['output'] for rendition in renditions or [])]
+    if stream:
+        stream_path = progressive.stream_target(output_mp4_path, stream)
+        partial_outputs.append(os.path.dirname(stream_path) if stream == progressive.STREAM_HLS else stream_path)
+    with render_control.removed_on_cancel(partial_outputs), \
+            tempfile.TemporaryDirectory(prefix='slideshow_') as work_dir, \
+            ThreadPoolExecutor(max_workers=1) as audio_executor:
+        # a filtergraph opens every image at once, so they share the memory budget instead of each having its own
+        if pipeline == PIPELINE_FILTERGRAPH:
+            image_budget_mb = max(1, min(image_budget_mb, memory_budget_mb // images_count))
+        # sources past the budget are decoded reduced into copies just large enough for the frame, so neither
+        # ffmpeg nor a normalize worker ever holds a 100 MP image
+        with render_metrics.stage('ingest'):
+            images_path_arr = ingest.ingest_images(
+                indexed_images, work_dir, *frame_size, image_budget_mb, memory_budget_mb,
+                workers=workers or threads, frame_cache=FrameCache(enabled=frame_cache), control=control
+            )
+        # the index knows what each source really is, reduced copies are sniffed
+        image_formats = [image.format if path == image.path else None
+                         for image, path in zip(indexed_images, images_path_arr)]
+        if pipeline == PIPELINE_FILTERGRAPH:
+            render_filtergraph(images_path_arr, audio_path, output_mp4_path, audio_length, settings, progress_callback,
+                               event_callback, threads, control, render_metrics)
+        else:
+            # the audio is transcoded (or found in the cache) while the video encodes, then muxed with stream copy
+            audio_future = audio.prepare_audio(audio_source, audio_mode, audio_executor, control)
+            source_hashes = None
+            if incremental:
+                source_hashes = content_hashes
+                segments = max(segments, math.ceil(images_count / INCREMENTAL_SEGMENT_SLIDES))
+            if normalized:
+                progress_callback(0, 'normalization')
+                with render_metrics.stage('normalization'):
+                    images_path_arr = prenormalize_images(
+                        images_path_arr, work_dir, *frame_size,
+                        workers=min(workers or threads or os.cpu_count() or 1,
+                                    ingest.worker_limit(indexed_images, image_budget_mb, memory_budget_mb)),
+                        progress_callback=progress_callback, frame_cache=FrameCache(enabled=frame_cache),
+                        content_hashes=content_hashes, draft=draft,
+                        control=control
+                    )
+                progress_callback(0, 'creation')
+            # the still and segmented paths write their concat lists right before each encode, so their graph
+            # construction is part of the encode stage
+            if pipeline == PIPELINE_COMPOSITOR:
+                motion = compositor.Motion(
+                    transition, compositor.transition_frames(transition_duration, settings['fps']), ken_burns
+                )
+                with render_metrics.stage('encode'):
+                    render_compositor(
+                        images_path_arr, audio_future, output_mp4_path, audio_length, settings, motion,
+                        progress_callback, event_callback=event_callback, workers=workers, threads=threads,
+                        control=control
+                    )
+            elif renditions:
+                # the main output is the first rendition, at the full frame size and the chosen encode settings
+                with render_metrics.stage('encode'):
+                    render_renditions(
+                        images_path_arr, [{'output': output_mp4_path}, *renditions], audio_future, audio_length,
+                        work_dir, normalized=normalized, settings=settings, progress_callback=progress_callback,
+                        event_callback=event_callback, threads=threads, control=control, image_formats=image_formats
+                    )
+            elif segments > 1:
+                with render_metrics.stage('encode'):
+                    render_segmented(
+                        images_path_arr, audio_future, output_mp4_path, audio_length, segments, work_dir,
+                        normalized=normalized, settings=settings, progress_callback=progress_callback,
+                        source_hashes=source_hashes, event_callback=event_callback, threads=threads,
+                        control=control, image_formats=image_formats
+                    )
+            else:
+                stream_output = progressive.stream_output(output_mp4_path, stream, fragment_s) if stream else None
+                render_single(
+                    images_path_arr, audio_future, output_mp4_path, audio_length, work_dir, normalized, settings,
+                    frame_counted, progress_callback, event_callback=event_callback, threads=threads,
+                    stream=stream_output, control=control, image_formats=image_formats, metrics=render_metrics
+                )
+
+    # ffmpeg's last progress time is that of the last packet, the movie header holds the length of the output
+    slideshow_length = progressive.movie_duration(output_mp4_path)
+    if slideshow_length is None:
+        logger.warning(f'{output_mp4_path} has no movie header duration, probing it')
+        with render_metrics.stage('final_probe'):
+            slideshow_length = float(ffmpeg.probe(output_mp4_path)['format']['duration'])
+    logger.info(f'Created slideshow length: {slideshow_length}')
+    # an output may end a little before the audio it was timed by, the progress still ends at 100%
+    update_progress(max(slideshow_length, audio_length), audio_length, progress_callback)
 
+    render_metrics.context.update(slideshow_length=slideshow_length)
+    return render_metrics.publish(metrics_file)
 
 if __name__ == "__main__":
     my_images_f = '/Users/betty/PythonProjects/image_resize/photos'
@@ -0,0 +1,100 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Optional
+
+from PIL import Image, ImageOps
+
+import render_control
+from frame_cache import FrameCache, file_digest
+from image_index import EXIF_ORIENTATION
+from ingest import TRANSPOSED_ORIENTATIONS, open_source, reduce_image
+
+logger = logging.getLogger(__name__)
+
+FRAME_EXT = '.jpg'
+FRAME_QUALITY = 95
+DRAFT_VARIANT = 'draft'
+
+
+def reduce_for_draft(image: Image.Image, width: int, height: int) -> Image.Image:
+    # decodes JPEGs at a DCT scale and box-reduces everything else, never below the frame it has to fill
+    if image.getexif().get(EXIF_ORIENTATION) in TRANSPOSED_ORIENTATIONS:
+        width, height = height, width
+    image.draft('RGB', (width, height))
+    return reduce_image(image, min(image.width // width, image.height // height))
+
+
+def normalize_image(source_path: str, target_path: str, width: int, height: int, color: str = 'black',
+                    draft: bool = False) -> str:
+    # the ingest already let this source through, Pillow's own pixel limit would reject what it reduced
+    with open_source(source_path) as image:
+        if draft:
+            image = reduce_for_draft(image, width, height)
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        frame = ImageOps.pad(image, (width, height), method=Image.Resampling.BICUBIC, color=color)
+    frame.save(target_path, quality=FRAME_QUALITY)
+    return target_path
+
+
+def normalize_cached(source_path: str, target_path: str, width: int, height: int, color: str,
+                     frame_cache: Optional[FrameCache], content_hash: Optional[str] = None,
+                     draft: bool = False) -> tuple[str, bool]:
+    if not frame_cache or not frame_cache.enabled:
+        return normalize_image(source_path, target_path, width, height, color, draft), False
+
+    key = frame_cache.make_key(content_hash or file_digest(source_path), width, height, color, FRAME_EXT,
+                               DRAFT_VARIANT if draft else '')
+    if cached_path := frame_cache.lookup(key, FRAME_EXT):
+        return cached_path, True
+    entry_path = frame_cache.new_entry_path(FRAME_EXT)
+    try:
+        normalize_image(source_path, entry_path, width, height, color, draft)
+    except Exception:
+        os.remove(entry_path)
+        raise
+    return frame_cache.store(key, FRAME_EXT, entry_path), False
+
+
+def frame_path(work_dir: str, index: int) -> str:
+    return os.path.join(work_dir, f'frame_{index:06d}{FRAME_EXT}')
+
+
+def prenormalize_images(images_path_arr: list[str], work_dir: str, width: int, height: int,
+                        color: str = 'black', workers: Optional[int] = None,
+                        progress_callback: Optional[Callable] = None,
+                        frame_cache: Optional[FrameCache] = None,
+                        content_hashes: Optional[list[str]] = None, draft: bool = False,
+                        control: Optional[render_control.RenderControl] = None) -> list[str]:
+    workers = workers or os.cpu_count() or 1
+    control = control or render_control.RenderControl()
+    logger.info(f'Normalizing {len(images_path_arr)} images to {width}x{height} with {workers} workers')
+
+    frames_path_arr = [frame_path(work_dir, index) for index in range(len(images_path_arr))]
+    content_hashes = content_hashes or [None] * len(images_path_arr)
+    with ProcessPoolExecutor(max_workers=workers, initializer=render_control.lower_priority,
+                             initargs=(control.niceness,)) as executor:
+        futures = {
+            executor.submit(
+                normalize_cached, source_path, target_path, width, height, color, frame_cache, content_hash, draft
+            ): index
+            for index, (source_path, target_path, content_hash)
+            in enumerate(zip(images_path_arr, frames_path_arr, content_hashes))
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            if control.cancelled.is_set():
+                # the images being normalized finish, the queued ones never start
+                executor.shutdown(wait=False, cancel_futures=True)
+                control.check()
+            frames_path_arr[futures[future]], hit = future.result()
+            if frame_cache:
+                frame_cache.record(hit)
+            if progress_callback:
+                progress_callback(done * 100 // len(futures))
+
+    if frame_cache and frame_cache.enabled:
+        logger.info(f'Frame cache hits: {frame_cache.hits}, misses: {frame_cache.misses}')
+        frame_cache.evict(keep=set(frames_path_arr))
+    return frames_path_arr
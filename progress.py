@@ -0,0 +1,162 @@
+import contextlib
+import logging
+import math
+import socket
+import threading
+import time
+from typing import Callable, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+ACCEPT_POLL_INTERVAL = 0.5
+EVENT_INTERVAL = 0.25
+
+
+class ProgressEvent(NamedTuple):
+    percent: int
+    out_time: float
+    frame: Optional[int]
+    fps: Optional[float]
+    speed: Optional[float]
+    bitrate_kbps: Optional[float]
+    total_size: Optional[int]
+    eta: Optional[float]
+    ended: bool
+    source: Optional[str] = None
+    # fragments of a progressive output that are complete and playable
+    fragments: Optional[int] = None
+
+
+def parse_number(value: Optional[str], suffix: str = '') -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return float(value.strip().removesuffix(suffix))
+    except ValueError:
+        return None
+
+
+def calculate_progress(done: float, total: float) -> int:
+    return min(100, math.ceil((done / total)*100)) if total > 0 else 0
+
+
+def make_event(values: dict, ended: bool, final_duration: float, source: Optional[str] = None) -> ProgressEvent:
+    # out_time_ms carries microseconds, the name is a historical ffmpeg quirk
+    out_time = (parse_number(values.get('out_time_us')) or parse_number(values.get('out_time_ms')) or 0) / 1000000
+    speed = parse_number(values.get('speed'), 'x')
+    frame = parse_number(values.get('frame'))
+    total_size = parse_number(values.get('total_size'))
+    eta = max(0.0, (final_duration - out_time) / speed) if speed else None
+    return ProgressEvent(
+        percent=100 if ended else calculate_progress(out_time, final_duration),
+        out_time=out_time,
+        frame=int(frame) if frame is not None else None,
+        fps=parse_number(values.get('fps')),
+        speed=speed,
+        bitrate_kbps=parse_number(values.get('bitrate'), 'kbits/s'),
+        total_size=int(total_size) if total_size is not None else None,
+        eta=0.0 if ended else eta,
+        ended=ended,
+        source=source,
+    )
+
+
+class ProgressThrottle:
+    def __init__(self, final_duration: float, progress_callback: Callable,
+                 event_callback: Optional[Callable] = None, interval: float = EVENT_INTERVAL):
+        self.final_duration = final_duration
+        self.progress_callback = progress_callback
+        self.event_callback = event_callback
+        self.interval = interval
+        self.last_percent = None
+        self.last_event_time = 0.0
+
+    def dispatch(self, event: ProgressEvent):
+        if event.percent != self.last_percent:
+            self.last_percent = event.percent
+            update_progress(event.out_time, self.final_duration, self.progress_callback)
+        now = time.monotonic()
+        if self.event_callback and (event.ended or now - self.last_event_time >= self.interval):
+            self.last_event_time = now
+            self.event_callback(event)
+
+
+def accept_connection(sock: socket.socket, stop_event: threading.Event) -> Optional[socket.socket]:
+    # ffmpeg may take a long time to open its inputs, so keep waiting until the encode itself is over
+    sock.settimeout(ACCEPT_POLL_INTERVAL)
+    while True:
+        try:
+            connection, _ = sock.accept()
+        except socket.timeout:
+            if stop_event.is_set():
+                return None
+            continue
+        connection.settimeout(None)
+        return connection
+
+
+def progress_parser(sock: socket.socket, final_duration: float, progress_callback: Callable,
+                    progress_state: Optional[dict] = None, event_callback: Optional[Callable] = None,
+                    stop_event: Optional[threading.Event] = None, source: Optional[str] = None):
+    connection = accept_connection(sock, stop_event or threading.Event())
+    if connection is None:
+        logger.error('ffmpeg finished without connecting to the progress listener')
+        return
+
+    throttle = ProgressThrottle(final_duration, progress_callback, event_callback)
+    # values ffmpeg cannot report yet come as N/A, the last known ones are kept instead
+    latest = dict()
+    with connection, connection.makefile('rb') as stream:
+        for bin_line in stream:
+            key, _, value = bin_line.decode(errors='replace').strip().partition('=')
+            if key != 'progress':
+                if value != 'N/A':
+                    latest[key] = value
+                continue
+            event = make_event(latest, value == 'end', final_duration, source)
+            if progress_state is not None:
+                progress_state['last_event'] = event
+            throttle.dispatch(event)
+
+
+@contextlib.contextmanager
+def get_progress_listener(final_duration: float, progress_callback: Callable, progress_state: Optional[dict] = None,
+                          event_callback: Optional[Callable] = None, source: Optional[str] = None):
+    sock = type("Closable", (object,), {"close": lambda self: "closed"})
+    listener = type("Joinable", (object,), {"join": lambda self: "joined"})
+    stop_event = threading.Event()
+
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('localhost', 0))
+        listen_on = '{}:{:d}'.format(*sock.getsockname())
+        sock.listen(1)
+        listener = threading.Thread(
+            target=progress_parser,
+            args=(sock, final_duration, progress_callback, progress_state, event_callback, stop_event, source)
+        )
+        listener.start()
+        yield listen_on
+    finally:
+        stop_event.set()
+        with contextlib.suppress(Exception):
+            listener.join()
+        with contextlib.suppress(Exception):
+            sock.close()
+
+
+def default_progress_callback(value: int, label: Optional[str]=None):
+    if label:
+        logger.debug(f'START REPORTING ON {label}')
+    for _ in range(value):
+        print('+', end = '')
+    for _ in range(value, 100):
+        print('-', end = '')
+    print()
+
+
+def update_progress(done: float, total: float, progress_callback: Callable) -> int:
+    calculated_progress = calculate_progress(done, total)
+    logger.debug(f'CALCULATION IS DONE for {calculated_progress}%: {done} of {total}')
+    progress_callback(calculated_progress)
+    return calculated_progress
@@ -0,0 +1,227 @@
+import logging
+import os
+import re
+import shutil
+import struct
+import threading
+from typing import Callable, NamedTuple, Optional
+
+import ffmpeg
+
+import render_control
+
+logger = logging.getLogger(__name__)
+
+STREAM_FMP4 = 'fmp4'
+STREAM_HLS = 'hls'
+STREAM_FORMATS = (STREAM_FMP4, STREAM_HLS)
+FRAGMENT_SECONDS = 2.0
+POLL_INTERVAL = 0.25
+HLS_PLAYLIST = 'playlist.m3u8'
+HLS_INIT = 'init.mp4'
+HLS_FRAGMENT_PATTERN = 'fragment_%05d.m4s'
+HLS_FRAGMENT = re.compile(r'^fragment_\d{5,}\.m4s$')
+BOX_HEADER = struct.Struct('>I4s')
+LARGE_BOX_SIZE = struct.Struct('>Q')
+# timescale and duration of the movie header, after its version, flags and creation and modification times
+MVHD_V0 = struct.Struct('>4x8xII')
+MVHD_V1 = struct.Struct('>4x16xIQ')
+EXTINF = re.compile(r'^#EXTINF:([0-9.]+)', re.MULTILINE)
+
+
+class StreamOutput(NamedTuple):
+    format: str
+    target: str
+    fragment_s: float = FRAGMENT_SECONDS
+
+
+def stream_target(output_mp4_path: str, stream_format: str) -> str:
+    # the playable copy grows next to the output, the output itself only appears once it is complete
+    base = os.path.splitext(output_mp4_path)[0]
+    if stream_format == STREAM_HLS:
+        return os.path.join(f'{base}.hls', HLS_PLAYLIST)
+    return f'{base}.live.mp4'
+
+
+def is_hls_output(name: str) -> bool:
+    return name in (HLS_PLAYLIST, HLS_INIT) or bool(HLS_FRAGMENT.match(name))
+
+
+def prepare_target(target: str, stream_format: str):
+    if stream_format == STREAM_HLS:
+        hls_dir = os.path.dirname(target)
+        if os.path.lexists(hls_dir):
+            # only a folder holding nothing but an earlier stream is replaced
+            if not os.path.isdir(hls_dir) or os.path.islink(hls_dir) or \
+                    not all(is_hls_output(name) for name in os.listdir(hls_dir)):
+                raise FileExistsError(f'{hls_dir} is not the stream of an earlier render, not replacing it')
+            # fragments of an earlier render would be listed by nothing but still take space
+            shutil.rmtree(hls_dir)
+        os.makedirs(hls_dir)
+    elif os.path.exists(target):
+        os.remove(target)
+
+
+def stream_output(output_mp4_path: str, stream_format: str, fragment_s: float = FRAGMENT_SECONDS) -> StreamOutput:
+    if stream_format not in STREAM_FORMATS:
+        raise ValueError(f'Unknown stream format {stream_format}, expected one of {", ".join(STREAM_FORMATS)}')
+    stream = StreamOutput(stream_format, stream_target(output_mp4_path, stream_format), fragment_s)
+    prepare_target(stream.target, stream.format)
+    return stream
+
+
+def stream_output_args(stream: StreamOutput) -> dict:
+    # a fragment can only start on a key frame, x264 still puts its own key frames on the slide changes
+    args = {'force_key_frames': f'expr:gte(t,n_forced*{stream.fragment_s})', 'c:a': 'copy'}
+    if stream.format == STREAM_HLS:
+        return {
+            **args, 'f': 'hls', 'hls_time': stream.fragment_s, 'hls_playlist_type': 'event',
+            'hls_segment_type': 'fmp4', 'hls_fmp4_init_filename': HLS_INIT,
+            'hls_segment_filename': os.path.join(os.path.dirname(stream.target), HLS_FRAGMENT_PATTERN),
+        }
+    return {**args, 'f': 'mp4', 'movflags': 'frag_keyframe+empty_moov+default_base_moof',
+            'frag_duration': int(stream.fragment_s * 1000000)}
+
+
+def hls_fragments(playlist_path: str) -> list[float]:
+    # a fragment is only listed once it has been written completely
+    try:
+        with open(playlist_path, encoding='utf-8') as f:
+            return [float(duration) for duration in EXTINF.findall(f.read())]
+    except FileNotFoundError:
+        return []
+
+
+class Fmp4Scanner:
+    # walks the top level boxes of the growing file, a fragment is complete once the mdat after its moof is
+    def __init__(self, path: str):
+        self.path = path
+        self.offset = 0
+        self.fragments = 0
+        self.in_fragment = False
+
+    def scan(self) -> int:
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return self.fragments
+        with f:
+            file_size = os.fstat(f.fileno()).st_size
+            while self.offset + BOX_HEADER.size <= file_size:
+                f.seek(self.offset)
+                header = f.read(BOX_HEADER.size + LARGE_BOX_SIZE.size)
+                size, box_type = BOX_HEADER.unpack_from(header)
+                if size == 1:
+                    if len(header) < BOX_HEADER.size + LARGE_BOX_SIZE.size:
+                        break
+                    size = LARGE_BOX_SIZE.unpack_from(header, BOX_HEADER.size)[0]
+                if size < BOX_HEADER.size or self.offset + size > file_size:
+                    break
+                if box_type == b'moof':
+                    self.in_fragment = True
+                elif box_type == b'mdat' and self.in_fragment:
+                    self.in_fragment = False
+                    self.fragments += 1
+                self.offset += size
+        return self.fragments
+
+
+class FragmentMonitor:
+    # reports every finished fragment as a progress event carrying the fragment count
+    def __init__(self, stream: StreamOutput, progress_state: dict, event_callback: Optional[Callable] = None):
+        self.target = stream.target
+        self.stream_format = stream.format
+        self.progress_state = progress_state
+        self.event_callback = event_callback
+        self.scanner = Fmp4Scanner(stream.target)
+        self.fragments = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop_event.set()
+        self.thread.join()
+        # the last fragments are flushed when ffmpeg exits
+        self.poll()
+
+    def count(self) -> int:
+        if self.stream_format == STREAM_HLS:
+            return len(hls_fragments(self.target))
+        return self.scanner.scan()
+
+    def poll(self):
+        fragments = self.count()
+        if fragments == self.fragments:
+            return
+        self.fragments = fragments
+        logger.debug(f'{fragments} fragments of {self.target} are playable')
+        last_event = self.progress_state.get('last_event')
+        if self.event_callback and last_event is not None:
+            self.event_callback(last_event._replace(fragments=fragments, source=os.path.basename(self.target)))
+
+    def run(self):
+        while not self.stop_event.wait(POLL_INTERVAL):
+            self.poll()
+
+
+def remove_remuxed(stream: StreamOutput):
+    # the fragmented copy was only there to be played during the render, the HLS folder can still be served
+    if stream.format == STREAM_FMP4:
+        os.remove(stream.target)
+
+
+def remux_faststart(target: str, output_mp4_path: str, control: Optional[render_control.RenderControl] = None):
+    # the fragments already hold the encoded stream, a copy with the index moved to the front is all that is left
+    render_control.run(ffmpeg.output(
+        ffmpeg.input(target), output_mp4_path, c='copy', movflags='+faststart'
+    ).overwrite_output(), control)
+
+
+def find_box(f, start: int, end: int, wanted: bytes) -> Optional[tuple[int, int]]:
+    # the payload range of the first box of that type between start and end
+    offset = start
+    while offset + BOX_HEADER.size <= end:
+        f.seek(offset)
+        header = f.read(BOX_HEADER.size + LARGE_BOX_SIZE.size)
+        if len(header) < BOX_HEADER.size:
+            return None
+        size, box_type = BOX_HEADER.unpack_from(header)
+        header_size = BOX_HEADER.size
+        if size == 1:
+            if len(header) < BOX_HEADER.size + LARGE_BOX_SIZE.size:
+                return None
+            size = LARGE_BOX_SIZE.unpack_from(header, BOX_HEADER.size)[0]
+            header_size += LARGE_BOX_SIZE.size
+        elif size == 0:
+            size = end - offset
+        if size < header_size or offset + size > end:
+            return None
+        if box_type == wanted:
+            return offset + header_size, offset + size
+        offset += size
+    return None
+
+
+def movie_duration(mp4_path: str) -> Optional[float]:
+    # the length of the longest track as players show it, read from the movie header instead of probing the file
+    try:
+        f = open(mp4_path, 'rb')
+    except FileNotFoundError:
+        return None
+    with f:
+        moov = find_box(f, 0, os.fstat(f.fileno()).st_size, b'moov')
+        mvhd = find_box(f, *moov, b'mvhd') if moov else None
+        if not mvhd:
+            return None
+        f.seek(mvhd[0])
+        payload = f.read(min(mvhd[1] - mvhd[0], MVHD_V1.size))
+        header = MVHD_V1 if payload[:1] == b'\x01' else MVHD_V0
+        if len(payload) < header.size:
+            return None
+        timescale, duration = header.unpack_from(payload)
+    # a fragmented file leaves the duration to its fragments
+    return duration / timescale if timescale and duration else None
@@ -0,0 +1,146 @@
+import contextlib
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# ffmpeg gets this long to stop on SIGTERM before it is killed
+TERMINATE_GRACE_S = 0.5
+MAX_NICENESS = 19
+
+
+class RenderCancelled(Exception):
+    pass
+
+
+def lower_priority(niceness: int):
+    # runs in the child before it starts, so every thread ffmpeg or a pool worker creates inherits the priority
+    if niceness and hasattr(os, 'nice'):
+        os.nice(niceness)
+
+
+class RenderControl:
+    # every process a render starts goes through its control, which can stop them all and caps what they use
+    def __init__(self, niceness: int = 0, filter_threads: Optional[int] = None):
+        self.niceness = niceness
+        self.filter_threads = filter_threads
+        self.cancelled = threading.Event()
+        self.processes = set()
+        self.lock = threading.Lock()
+
+    def set_limits(self, niceness: Optional[int] = None, filter_threads: Optional[int] = None):
+        if niceness is not None:
+            self.niceness = niceness
+        if filter_threads is not None:
+            self.filter_threads = filter_threads
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise RenderCancelled()
+
+    def cancel(self):
+        logger.info('Cancelling the render')
+        with self.lock:
+            self.cancelled.set()
+            processes = list(self.processes)
+        for process in processes:
+            process.terminate()
+        # the caller, usually the GUI, does not wait for the processes to go
+        threading.Thread(target=self.reap, args=(processes,), daemon=True).start()
+
+    @staticmethod
+    def reap(processes: list[subprocess.Popen]):
+        # one grace period for all of them, concurrent segment encoders stop together
+        deadline = time.monotonic() + TERMINATE_GRACE_S
+        for process in processes:
+            try:
+                process.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def ffmpeg_args(self, stream_spec) -> list[str]:
+        import ffmpeg
+
+        args = ffmpeg.compile(stream_spec)
+        if self.filter_threads:
+            # global options go before the first input
+            args[1:1] = ['-filter_threads', str(self.filter_threads),
+                         '-filter_complex_threads', str(self.filter_threads)]
+        return args
+
+    def lower_process_priority(self, process: subprocess.Popen):
+        # set from outside right after the spawn, preexec_fn is not safe in the threaded GUI, batch and daemon
+        if not self.niceness or not hasattr(os, 'setpriority'):
+            return
+        try:
+            niceness = os.getpriority(os.PRIO_PROCESS, 0) + self.niceness
+            os.setpriority(os.PRIO_PROCESS, process.pid, min(niceness, MAX_NICENESS))
+        except (ProcessLookupError, PermissionError) as e:
+            logger.debug(f'Could not lower the priority of process {process.pid}: {e}')
+
+    def popen(self, args: list[str], **kwargs) -> subprocess.Popen:
+        # registered under the lock, so a cancel either sees the process or stops it from starting
+        with self.lock:
+            self.check()
+            process = subprocess.Popen(args, **kwargs)
+            self.processes.add(process)
+        self.lower_process_priority(process)
+        return process
+
+    def release(self, process: subprocess.Popen):
+        with self.lock:
+            self.processes.discard(process)
+
+    def run_async(self, stream_spec, pipe_stdin: bool = False, pipe_stderr: bool = False) -> subprocess.Popen:
+        return self.popen(self.ffmpeg_args(stream_spec), stdin=subprocess.PIPE if pipe_stdin else subprocess.DEVNULL,
+                          stderr=subprocess.PIPE if pipe_stderr else None)
+
+    def run(self, stream_spec):
+        import ffmpeg
+
+        # stands in for stream_spec.run(quiet=True), raising ffmpeg.Error the same way
+        process = self.popen(self.ffmpeg_args(stream_spec), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        try:
+            out, err = process.communicate()
+        finally:
+            self.release(process)
+        self.check()
+        if process.returncode:
+            raise ffmpeg.Error('ffmpeg', out, err)
+
+
+def run(stream_spec, control: Optional[RenderControl] = None):
+    (control or RenderControl()).run(stream_spec)
+
+
+def path_state(path: str) -> Optional[tuple]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+@contextlib.contextmanager
+def removed_on_cancel(paths: list[str]):
+    # removes what a cancelled render has written, the outputs of an earlier render it never touched are kept
+    states = {path: path_state(path) for path in paths}
+    try:
+        yield
+    except RenderCancelled:
+        for path, state in states.items():
+            if path_state(path) in (None, state):
+                continue
+            logger.info(f'Removing the partial output {path}')
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+        raise
@@ -0,0 +1,480 @@
+import argparse
+import collections
+import contextlib
+import hmac
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import secrets
+import signal
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+from urllib.error import HTTPError
+
+import slideshow_batch
+from progress import ProgressEvent
+from talelle_setup import TALELLE_DIR
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+PRIORITY_NORMAL = 0
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_RENDERED = slideshow_batch.STATUS_RENDERED
+STATUS_FAILED = slideshow_batch.STATUS_FAILED
+STATUS_CANCELLED = 'cancelled'
+FINAL_STATUSES = (STATUS_RENDERED, STATUS_FAILED, STATUS_CANCELLED)
+WORKER_POLL_INTERVAL = 0.5
+# a cancelled worker gets this long to stop ffmpeg and remove its partial outputs before its group is killed
+WORKER_CANCEL_GRACE_S = 10.0
+# a late follower only needs the recent progress, older messages are dropped
+MAX_JOB_EVENTS = 1000
+# a finished job is forgotten this long after a client has seen how it ended, or after this long unseen
+READ_JOB_RETENTION_S = 60
+FINISHED_JOB_RETENTION_S = 3600
+# a new secret every time the daemon starts, readable only by the user who started it
+TOKEN_PATH = os.path.join(TALELLE_DIR, 'render_daemon.token')
+
+
+def cancel_when_set(terminated: threading.Event, control):
+    terminated.wait()
+    control.cancel()
+
+
+def render_worker(job: slideshow_batch.RenderJob, threads: int, messages):
+    import placement
+    import render_control
+
+    # the worker leads its own process group, so a worker that does not stop can be killed with its ffmpeg processes
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    # SIGTERM cancels the render, which stops ffmpeg and removes the work dir and the partial outputs on its way out.
+    # The handler runs between two bytecodes of the render, which may hold the control's lock, so it only sets a flag
+    # and a thread of its own does the cancelling
+    control = render_control.RenderControl()
+    terminated = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: terminated.set())
+    threading.Thread(target=cancel_when_set, args=(terminated, control), daemon=True).start()
+    try:
+        report = placement.create_slideshow(
+            job.images_dir, job.audio_path, job.output_path,
+            lambda value, label=None: messages.put({'type': 'progress', 'value': value, 'label': label}),
+            event_callback=lambda event: messages.put({'type': 'event', **event._asdict()}),
+            # the daemon's thread cap comes last, a job cannot raise it with threads of its own
+            control=control, **{**(job.options or {}), 'threads': threads}
+        )
+        messages.put({'type': 'done', 'metrics': report})
+    except render_control.RenderCancelled:
+        messages.put({'type': 'cancelled'})
+    except Exception as e:
+        logger.exception(f'Rendering {job.output_path} failed')
+        messages.put({'type': 'failed', 'error': slideshow_batch.describe_error(e)})
+
+
+def worker_context():
+    # the fork server imports the engine once, every job then starts from a warm interpreter
+    # without forking the daemon's own threads
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['placement'])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+class DaemonJob:
+    def __init__(self, job_id: int, job: slideshow_batch.RenderJob, priority: int):
+        self.job_id = job_id
+        self.job = job
+        self.priority = priority
+        self.status = STATUS_QUEUED
+        self.progress = 0
+        self.label = None
+        self.error = None
+        self.metrics = None
+        self.process = None
+        self.cancelled = False
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self.read_at = None
+        self.events = collections.deque(maxlen=MAX_JOB_EVENTS)
+        # counts every message ever published, the deque only holds the last of them
+        self.published = 0
+        self.changed = threading.Condition()
+
+    def publish(self, message: dict):
+        with self.changed:
+            if message['type'] == 'progress':
+                self.progress = message['value']
+                self.label = message['label'] or self.label
+            self.events.append(message)
+            self.published += 1
+            self.changed.notify_all()
+
+    def finish(self, status: str, error: Optional[str] = None, metrics: Optional[dict] = None):
+        with self.changed:
+            self.status, self.error, self.metrics = status, error, metrics
+            self.finished_at = time.monotonic()
+            self.events.append({'type': 'status', **self.state()})
+            self.published += 1
+            self.changed.notify_all()
+
+    def state(self) -> dict:
+        return {
+            'id': self.job_id, 'status': self.status, 'priority': self.priority, 'progress': self.progress,
+            'label': self.label, 'output': self.job.output_path, 'error': self.error, 'metrics': self.metrics,
+        }
+
+    def report(self) -> dict:
+        # what a client is told, once it has seen the final state the job may be forgotten
+        state = self.state()
+        if state['status'] in FINAL_STATUSES:
+            self.read_at = time.monotonic()
+        return state
+
+    def expired(self, now: float) -> bool:
+        if self.finished_at is None:
+            return False
+        if self.read_at is not None and now - self.read_at > READ_JOB_RETENTION_S:
+            return True
+        return now - self.finished_at > FINISHED_JOB_RETENTION_S
+
+    def follow(self):
+        # yields the buffered messages of the job and every new one until it has finished
+        index = 0
+        while True:
+            with self.changed:
+                while index >= self.published and self.status not in FINAL_STATUSES:
+                    self.changed.wait()
+                first_buffered = self.published - len(self.events)
+                messages = list(self.events)[max(index, first_buffered) - first_buffered:]
+                index = self.published
+                finished = self.status in FINAL_STATUSES
+            yield from messages
+            if finished and index == self.published:
+                self.read_at = time.monotonic()
+                return
+
+
+class RenderDaemon:
+    def __init__(self, max_jobs: Optional[int] = None, threads: Optional[int] = None,
+                 job_memory_mb: float = slideshow_batch.JOB_MEMORY_MB):
+        self.concurrency, self.threads = slideshow_batch.plan_concurrency(
+            os.cpu_count() or 1, max_jobs, threads, job_memory_mb
+        )
+        self.context = worker_context()
+        self.jobs = dict()
+        self.lock = threading.Lock()
+        self.queue = queue.PriorityQueue()
+        self.job_ids = itertools.count(1)
+        self.runners = [
+            threading.Thread(target=self.run_jobs, name=f'render-{index}', daemon=True)
+            for index in range(self.concurrency)
+        ]
+        for runner in self.runners:
+            runner.start()
+        logger.info(f'Render daemon runs {self.concurrency} jobs at a time with {self.threads} threads each')
+
+    def expire_jobs(self):
+        now = time.monotonic()
+        with self.lock:
+            for job_id in [job_id for job_id, daemon_job in self.jobs.items() if daemon_job.expired(now)]:
+                del self.jobs[job_id]
+
+    def submit(self, job: slideshow_batch.RenderJob, priority: int = PRIORITY_NORMAL) -> DaemonJob:
+        self.expire_jobs()
+        with self.lock:
+            daemon_job = DaemonJob(next(self.job_ids), job, priority)
+            self.jobs[daemon_job.job_id] = daemon_job
+        # higher priorities first, first come first served within a priority
+        self.queue.put((-priority, daemon_job.job_id))
+        logger.info(f'Job {daemon_job.job_id} queued with priority {priority}: {job.output_path}')
+        return daemon_job
+
+    def cancel(self, job_id: int) -> Optional[DaemonJob]:
+        daemon_job = self.jobs.get(job_id)
+        if daemon_job is None:
+            return None
+        with daemon_job.changed:
+            if daemon_job.status in FINAL_STATUSES:
+                return daemon_job
+            daemon_job.cancelled = True
+            process = daemon_job.process
+        if process is None:
+            # the runner drops it when it comes out of the queue
+            daemon_job.finish(STATUS_CANCELLED)
+        else:
+            self.stop_worker(daemon_job, process)
+        logger.info(f'Job {job_id} cancelled')
+        return daemon_job
+
+    @staticmethod
+    def stop_worker(daemon_job: DaemonJob, process):
+        if process.pid is None:
+            return
+        process.terminate()
+
+        def kill_when_stuck():
+            # the job finishes once its worker has exited, whatever the worker did with the SIGTERM
+            with daemon_job.changed:
+                if daemon_job.changed.wait_for(lambda: daemon_job.status in FINAL_STATUSES, WORKER_CANCEL_GRACE_S):
+                    return
+            logger.warning(f'Job {daemon_job.job_id} did not stop, killing its processes')
+            try:
+                if hasattr(os, 'killpg'):
+                    os.killpg(process.pid, signal.SIGKILL)
+                    return
+            except ProcessLookupError:
+                # the worker has not made its process group yet
+                pass
+            process.kill()
+
+        threading.Thread(target=kill_when_stuck, daemon=True).start()
+
+    def run_jobs(self):
+        while True:
+            _, job_id = self.queue.get()
+            # a job cancelled in the queue may have expired already
+            daemon_job = self.jobs.get(job_id)
+            if daemon_job is None:
+                continue
+            with daemon_job.changed:
+                if daemon_job.cancelled:
+                    continue
+                daemon_job.status = STATUS_RUNNING
+                messages = self.context.Queue()
+                daemon_job.process = self.context.Process(
+                    target=render_worker, args=(daemon_job.job, self.threads, messages)
+                )
+                daemon_job.process.start()
+            self.watch(daemon_job, messages)
+
+    def watch(self, daemon_job: DaemonJob, messages):
+        process = daemon_job.process
+        while True:
+            try:
+                message = messages.get(timeout=WORKER_POLL_INTERVAL)
+            except queue.Empty:
+                if process.is_alive():
+                    continue
+                # the worker is gone without a final message: it was cancelled or crashed
+                process.join()
+                message = {'type': 'failed', 'error': f'render worker exited with code {process.exitcode}'}
+            if message['type'] not in ('done', 'failed', 'cancelled'):
+                daemon_job.publish(message)
+                continue
+            process.join()
+            if daemon_job.cancelled:
+                daemon_job.finish(STATUS_CANCELLED)
+            elif message['type'] == 'done':
+                daemon_job.finish(STATUS_RENDERED, metrics=message['metrics'])
+            else:
+                daemon_job.finish(STATUS_FAILED, message['error'])
+            return
+
+
+def write_token(token_path: str) -> str:
+    token = secrets.token_urlsafe(32)
+    os.makedirs(os.path.dirname(token_path), exist_ok=True)
+    fd = os.open(token_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        # an older file keeps its permissions on open, so they are set again
+        if hasattr(os, 'fchmod'):
+            os.fchmod(f.fileno(), 0o600)
+        f.write(token)
+    return token
+
+
+def read_token(token_path: str = TOKEN_PATH) -> Optional[str]:
+    try:
+        with open(token_path, encoding='utf-8') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def parse_job(body: dict) -> slideshow_batch.RenderJob:
+    options = body.get('options', {})
+    if 'project' in body:
+        return slideshow_batch.project_job(body['project'], body.get('imagesFolder', 'images'), options)
+    return slideshow_batch.RenderJob(body['images'], body['audio'], body['output'], options)
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    # POST /jobs submits, GET /jobs lists, GET /jobs/<id> reports, DELETE /jobs/<id> cancels and
+    # GET /jobs/<id>/events streams the job's messages as JSON lines until it has finished
+    daemon: RenderDaemon = None
+    token: str = None
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def send_json(self, payload, status: int = 200):
+        body = json.dumps(payload, default=str).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def authorized(self) -> bool:
+        # any local process and any web page can reach the port, only the owner of the token file may use it
+        expected = f'Bearer {self.token}'
+        if hmac.compare_digest(self.headers.get('Authorization', '').encode(), expected.encode()):
+            return True
+        self.send_json({'error': 'unauthorized'}, 401)
+        return False
+
+    def job_from_path(self) -> tuple[Optional[DaemonJob], list[str]]:
+        parts = self.path.strip('/').split('/')
+        if len(parts) < 2 or parts[0] != 'jobs' or not parts[1].isdigit():
+            return None, parts
+        return self.daemon.jobs.get(int(parts[1])), parts
+
+    def do_POST(self):
+        if not self.authorized():
+            return
+        if self.path.rstrip('/') != '/jobs':
+            return self.send_json({'error': 'not found'}, 404)
+        # a cross-site form can only send text/plain or form bodies
+        if self.headers.get_content_type() != 'application/json':
+            return self.send_json({'error': 'jobs must be sent as application/json'}, 415)
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            daemon_job = self.daemon.submit(parse_job(body), int(body.get('priority', PRIORITY_NORMAL)))
+        except (ValueError, KeyError, TypeError) as e:
+            return self.send_json({'error': f'bad job: {e}'}, 400)
+        self.send_json(daemon_job.state(), 201)
+
+    def do_GET(self):
+        if not self.authorized():
+            return
+        if self.path.rstrip('/') == '/jobs':
+            self.daemon.expire_jobs()
+            return self.send_json([daemon_job.state() for daemon_job in list(self.daemon.jobs.values())])
+        daemon_job, parts = self.job_from_path()
+        if daemon_job is None:
+            return self.send_json({'error': 'not found'}, 404)
+        if parts[2:] == ['events']:
+            return self.stream_events(daemon_job)
+        self.send_json(daemon_job.report())
+
+    def do_DELETE(self):
+        if not self.authorized():
+            return
+        daemon_job, _ = self.job_from_path()
+        if daemon_job is None or self.daemon.cancel(daemon_job.job_id) is None:
+            return self.send_json({'error': 'not found'}, 404)
+        self.send_json(daemon_job.report())
+
+    def stream_events(self, daemon_job: DaemonJob):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        try:
+            for message in daemon_job.follow():
+                self.wfile.write(json.dumps(message, default=str).encode() + b'\n')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug(f'Events client of job {daemon_job.job_id} went away')
+
+
+def serve(port: int = DEFAULT_PORT, max_jobs: Optional[int] = None, threads: Optional[int] = None,
+          job_memory_mb: float = slideshow_batch.JOB_MEMORY_MB, token_path: str = TOKEN_PATH):
+    handler = type('Handler', (RenderRequestHandler,), {
+        'daemon': RenderDaemon(max_jobs, threads, job_memory_mb), 'token': write_token(token_path),
+    })
+    # only local clients, the jobs name paths on this machine
+    with ThreadingHTTPServer(('127.0.0.1', port), handler) as server:
+        logger.info(f'Render daemon listening on http://127.0.0.1:{port}, its token is in {token_path}')
+        try:
+            server.serve_forever()
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(token_path)
+
+
+def rejection_message(error: HTTPError) -> str:
+    # the daemon explains a refused request in the error field of its reply
+    try:
+        return json.loads(error.read())['error']
+    except (ValueError, KeyError, TypeError, OSError):
+        return str(error)
+
+
+class RenderClient:
+    def __init__(self, url: str = f'http://127.0.0.1:{DEFAULT_PORT}', token: Optional[str] = None,
+                 token_path: str = TOKEN_PATH):
+        self.url = url.rstrip('/')
+        self.token = token or read_token(token_path)
+
+    def headers(self) -> dict:
+        return {'Authorization': f'Bearer {self.token}'} if self.token else {}
+
+    def request(self, method: str, path: str, payload: Optional[dict] = None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(f'{self.url}{path}', data=data, method=method,
+                                         headers={'Content-Type': 'application/json', **self.headers()})
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)
+
+    def submit(self, images_dir: str, audio_path: str, output_path: str, priority: int = PRIORITY_NORMAL,
+               **options) -> int:
+        return self.request('POST', '/jobs', {
+            'images': os.path.abspath(images_dir), 'audio': os.path.abspath(audio_path),
+            'output': os.path.abspath(output_path), 'priority': priority, 'options': options,
+        })['id']
+
+    def status(self, job_id: int) -> dict:
+        return self.request('GET', f'/jobs/{job_id}')
+
+    def cancel(self, job_id: int) -> dict:
+        return self.request('DELETE', f'/jobs/{job_id}')
+
+    def follow(self, job_id: int, progress_callback: Callable,
+               event_callback: Optional[Callable] = None) -> dict:
+        # replays the job through the callbacks create_slideshow would have called, returns the final state
+        request = urllib.request.Request(f'{self.url}/jobs/{job_id}/events', headers=self.headers())
+        with urllib.request.urlopen(request) as response:
+            for line in response:
+                message = json.loads(line)
+                if message['type'] == 'progress':
+                    progress_callback(message['value'], message['label'])
+                elif message['type'] == 'event' and event_callback:
+                    event_callback(ProgressEvent(**{field: message[field] for field in ProgressEvent._fields}))
+                elif message['type'] == 'status':
+                    return message
+        return self.status(job_id)
+
+    def render(self, images_dir: str, audio_path: str, output_path: str, progress_callback: Callable,
+               event_callback: Optional[Callable] = None, priority: int = PRIORITY_NORMAL, **options) -> dict:
+        state = self.follow(self.submit(images_dir, audio_path, output_path, priority, **options),
+                            progress_callback, event_callback)
+        if state['status'] != STATUS_RENDERED:
+            raise RuntimeError(f"Render of {output_path} {state['status']}: {state['error']}")
+        return state['metrics']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve slideshow renders to local clients from a shared pool')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--jobs', type=int, default=None, help='most renders at a time, by default fits cores and RAM')
+    parser.add_argument('--threads', type=int, default=None, help='threads per render')
+    parser.add_argument('--job-memory-mb', type=float, default=slideshow_batch.JOB_MEMORY_MB)
+    parser.add_argument('--token-file', default=TOKEN_PATH, help='where the token clients must send is written')
+    parser.add_argument('--log-level', default='INFO')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    serve(args.port, args.jobs, args.threads, args.job_memory_mb, args.token_file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path(output_mp4_path: str) -> str:
+    return f'{output_mp4_path}.manifest.json'
+
+
+def segments_dir(output_mp4_path: str) -> str:
+    return f'{os.path.splitext(output_mp4_path)[0]}.segments'
+
+
+def segment_fingerprint(source_hashes: list[str], frame_counts: list[int], encoder_settings: dict) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([MANIFEST_VERSION, encoder_settings], sort_keys=True).encode())
+    for source_hash, frames in zip(source_hashes, frame_counts):
+        digest.update(f'{source_hash}:{frames};'.encode())
+    return digest.hexdigest()
+
+
+def segment_file_name(fingerprint: str) -> str:
+    return f'segment_{fingerprint}.mp4'
+
+
+def load_manifest(output_mp4_path: str) -> dict:
+    try:
+        with open(manifest_path(output_mp4_path), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return manifest if manifest.get('version') == MANIFEST_VERSION else {}
+
+
+def save_manifest(output_mp4_path: str, manifest: dict):
+    path = manifest_path(output_mp4_path)
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'version': MANIFEST_VERSION, **manifest}, f, indent=2)
+    os.replace(f'{path}.tmp', path)
+
+
+def timeline_changed(manifest: dict, images_count: int, audio_length: float) -> bool:
+    return manifest.get('images_count') != images_count or manifest.get('audio_length') != audio_length
+
+
+def reusable_segments(output_mp4_path: str, fingerprints: list[str]) -> set[str]:
+    segment_dir = segments_dir(output_mp4_path)
+    return {
+        fingerprint for fingerprint in fingerprints
+        if os.path.isfile(os.path.join(segment_dir, segment_file_name(fingerprint)))
+    }
+
+
+def remove_stale_segments(output_mp4_path: str, fingerprints: list[str]):
+    segment_dir = segments_dir(output_mp4_path)
+    keep = {segment_file_name(fingerprint) for fingerprint in fingerprints}
+    for filename in os.listdir(segment_dir):
+        if filename not in keep:
+            logger.debug(f'removing stale segment {filename}')
+            os.remove(os.path.join(segment_dir, filename))
@@ -0,0 +1,240 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+# the engine is imported by the functions that render, the GUI reads projects and jobs from here on its own thread
+logger = logging.getLogger(__name__)
+
+DEFAULT_IMAGES_FOLDER = 'images'
+# a generous estimate of the peak memory of one 1080p render, --job-memory-mb overrides it
+JOB_MEMORY_MB = 1024
+STATUS_RENDERED = 'rendered'
+STATUS_SKIPPED = 'skipped'
+STATUS_FAILED = 'failed'
+
+
+class RenderJob(NamedTuple):
+    images_dir: str
+    audio_path: str
+    output_path: str
+    options: Optional[dict] = None
+
+
+def project_files(proj_path: str, images_folder: str = DEFAULT_IMAGES_FOLDER) -> tuple[str, str, str]:
+    # a project keeps its images in a sub folder and is named after its parent: <parent>/<name>/<parent>_<name>.mp4
+    proj_path = os.path.normpath(proj_path)
+    proj_name = os.path.basename(proj_path)
+    proj_parent_name = os.path.basename(os.path.dirname(proj_path))
+    file_path = os.path.join(proj_path, f'{proj_parent_name}_{proj_name}')
+    return os.path.join(proj_path, images_folder), f'{file_path}.mp3', f'{file_path}.mp4'
+
+
+def project_job(proj_path: str, images_folder: str = DEFAULT_IMAGES_FOLDER, options: Optional[dict] = None):
+    return RenderJob(*project_files(proj_path, images_folder), options or {})
+
+
+def load_manifest(manifest_path: str, images_folder: str = DEFAULT_IMAGES_FOLDER) -> list[RenderJob]:
+    # {"options": {...}, "jobs": [{"project": ...} or {"images": ..., "audio": ..., "output": ...}, ...]}
+    # relative paths are resolved against the manifest folder, job options override the shared ones
+    with open(manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    shared_options = manifest.get('options', {})
+
+    jobs = []
+    for entry in manifest['jobs']:
+        options = {**shared_options, **entry.get('options', {})}
+        if 'project' in entry:
+            jobs.append(project_job(os.path.join(base_dir, entry['project']),
+                                    entry.get('imagesFolder', images_folder), options))
+        else:
+            jobs.append(RenderJob(*(os.path.join(base_dir, entry[key]) for key in ('images', 'audio', 'output')),
+                                  options))
+    return jobs
+
+
+def newest_input_mtime(job: RenderJob) -> float:
+    # the folder mtime changes when an image is added, removed or renamed
+    mtimes = [os.stat(job.audio_path).st_mtime, os.stat(job.images_dir).st_mtime]
+    mtimes.extend(entry.stat().st_mtime for entry in os.scandir(job.images_dir) if entry.is_file())
+    return max(mtimes)
+
+
+def options_path(output_path: str) -> str:
+    return f'{output_path}.options'
+
+
+def options_digest(options: Optional[dict]) -> str:
+    return hashlib.blake2b(json.dumps(options or {}, sort_keys=True, default=str).encode(), digest_size=16).hexdigest()
+
+
+def record_options(job: RenderJob):
+    # kept next to the output, so a render with other options is not taken for up to date
+    with open(options_path(job.output_path), 'w', encoding='utf-8') as f:
+        f.write(options_digest(job.options))
+
+
+def rendered_options(output_path: str) -> Optional[str]:
+    try:
+        with open(options_path(output_path), encoding='utf-8') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def is_up_to_date(job: RenderJob) -> bool:
+    return (os.path.exists(job.output_path) and os.stat(job.output_path).st_mtime >= newest_input_mtime(job)
+            and rendered_options(job.output_path) == options_digest(job.options))
+
+
+def total_memory_mb() -> Optional[float]:
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def plan_concurrency(jobs_count: int, max_jobs: Optional[int] = None, threads: Optional[int] = None,
+                     job_memory_mb: float = JOB_MEMORY_MB) -> tuple[int, int]:
+    # returns (concurrent renders, threads per render) so that renders x threads fits the cores
+    # and renders x job memory fits the RAM
+    cores = os.cpu_count() or 1
+    limits = [jobs_count, max_jobs or cores, cores // threads if threads else cores]
+    memory_mb = total_memory_mb()
+    if memory_mb:
+        limits.append(int(memory_mb // job_memory_mb))
+    concurrency = max(1, min(limits))
+    return concurrency, threads or max(1, cores // concurrency)
+
+
+class JobProgress:
+    def __init__(self, name: str, step: int = 10):
+        self.name = name
+        self.step = step
+        self.reported = -step
+
+    def __call__(self, value: int, label: Optional[str] = None):
+        if label:
+            logger.info(f'{self.name}: {label}')
+        elif value >= self.reported + self.step or value == 100:
+            self.reported = value
+            logger.info(f'{self.name}: {value}%')
+
+
+def describe_error(error: Exception) -> str:
+    import ffmpeg
+
+    # ffmpeg's own reason is the last line of its stderr
+    lines = error.stderr.decode(errors='replace').strip().splitlines() if isinstance(error, ffmpeg.Error) else []
+    return lines[-1] if lines else f'{type(error).__name__}: {error}'
+
+
+def run_job(job: RenderJob, threads: int, force: bool = False, daemon_url: Optional[str] = None) -> dict:
+    result = {'output': job.output_path}
+    if not force and os.path.isdir(job.images_dir) and os.path.isfile(job.audio_path) and is_up_to_date(job):
+        logger.info(f'{job.output_path} is up to date')
+        return {**result, 'status': STATUS_SKIPPED}
+
+    start_time = time.perf_counter()
+    try:
+        if daemon_url:
+            # the daemon sizes the renders to the shared pool
+            import render_daemon
+
+            report = render_daemon.RenderClient(daemon_url).render(
+                job.images_dir, job.audio_path, job.output_path, JobProgress(os.path.basename(job.output_path)),
+                **(job.options or {})
+            )
+        else:
+            import placement
+
+            report = placement.create_slideshow(job.images_dir, job.audio_path, job.output_path,
+                                                JobProgress(os.path.basename(job.output_path)),
+                                                **{'threads': threads, **(job.options or {})})
+    except Exception as e:
+        logger.exception(f'Rendering {job.output_path} failed')
+        return {**result, 'status': STATUS_FAILED, 'error': describe_error(e),
+                'wall_s': round(time.perf_counter() - start_time, 3)}
+    record_options(job)
+    return {**result, 'status': STATUS_RENDERED, 'wall_s': round(time.perf_counter() - start_time, 3),
+            'slideshow_length': report['slideshow_length'], 'metrics': report}
+
+
+def run_batch(jobs: list[RenderJob], max_jobs: Optional[int] = None, threads: Optional[int] = None,
+              job_memory_mb: float = JOB_MEMORY_MB, force: bool = False,
+              daemon_url: Optional[str] = None) -> list[dict]:
+    if daemon_url:
+        # every job in flight holds a thread following it, the daemon runs no more renders at once than the cores
+        concurrency, job_threads = min(len(jobs), max_jobs or os.cpu_count() or 1), None
+        logger.info(f'Submitting {len(jobs)} jobs to the render daemon at {daemon_url}')
+    else:
+        concurrency, job_threads = plan_concurrency(len(jobs), max_jobs, threads, job_memory_mb)
+        logger.info(f'Rendering {len(jobs)} jobs, {concurrency} at a time with {job_threads} threads each')
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        return list(executor.map(lambda job: run_job(job, job_threads, force, daemon_url), jobs))
+
+
+def summary(results: list[dict], wall_time: float) -> dict:
+    return {
+        'jobs': len(results),
+        **{status: sum(result['status'] == status for result in results)
+           for status in (STATUS_RENDERED, STATUS_SKIPPED, STATUS_FAILED)},
+        'wall_s': round(wall_time, 3),
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render slideshows without the GUI')
+    parser.add_argument('projects', nargs='*', help='project folders laid out like the GUI expects them')
+    parser.add_argument('--manifest', help='JSON file listing many jobs')
+    parser.add_argument('--images', help='images folder of a single job')
+    parser.add_argument('--audio', help='audio file of a single job')
+    parser.add_argument('--output', help='output file of a single job')
+    parser.add_argument('--images-folder', default=DEFAULT_IMAGES_FOLDER, help='images sub folder of a project')
+    parser.add_argument('--options', default='{}', help='JSON render options passed to create_slideshow')
+    parser.add_argument('--jobs', type=int, default=None, help='most renders at a time, by default fits cores and RAM')
+    parser.add_argument('--threads', type=int, default=None, help='threads per render')
+    parser.add_argument('--job-memory-mb', type=float, default=JOB_MEMORY_MB)
+    parser.add_argument('--force', action='store_true', help='render outputs that are up to date too')
+    parser.add_argument('--daemon', metavar='URL', help='submit the jobs to a render daemon instead')
+    parser.add_argument('--report', help='write the summary report to this JSON file')
+    parser.add_argument('--log-level', default='INFO')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    options = json.loads(args.options)
+    jobs = [project_job(project, args.images_folder, options) for project in args.projects]
+    if args.manifest:
+        jobs.extend(load_manifest(args.manifest, args.images_folder))
+    if args.images or args.audio or args.output:
+        if not (args.images and args.audio and args.output):
+            parser.error('--images, --audio and --output go together')
+        jobs.append(RenderJob(args.images, args.audio, args.output, options))
+    if not jobs:
+        parser.error('nothing to render, give project folders, --manifest or --images/--audio/--output')
+
+    start_time = time.perf_counter()
+    results = run_batch(jobs, args.jobs, args.threads, args.job_memory_mb, args.force, args.daemon)
+    report = summary(results, time.perf_counter() - start_time)
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, default=str)
+    for result in results:
+        print(f"{result['status']:>9} {result.get('wall_s', '-'):>9} {result['output']}"
+              f"{'  ' + result['error'] if 'error' in result else ''}")
+    print(f"{report['rendered']} rendered, {report['skipped']} skipped, {report['failed']} failed "
+          f"in {report['wall_s']} s")
+    sys.exit(1 if report['failed'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+import errno
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# the modules place their caches under the home when they are imported, the tests must not touch the user's ones
+TEST_HOME = tempfile.mkdtemp(prefix='slideshow_tests_')
+os.environ['HOME'] = TEST_HOME
+os.environ['USERPROFILE'] = TEST_HOME
+
+requires_ffmpeg = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='ffmpeg is not installed')
+
+
+def cross_device_replace(real_replace, cache_dir: str):
+    # renaming into the cache works only from inside it, like a work dir on another file system
+    def replace(source, target):
+        if os.path.commonpath([os.path.abspath(source), cache_dir]) != cache_dir:
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+        real_replace(source, target)
+    return replace
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(TEST_HOME, ignore_errors=True)
@@ -0,0 +1,52 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import ffmpeg
+import pytest
+
+import audio
+from conftest import requires_ffmpeg
+from frame_cache import file_digest
+
+
+@pytest.fixture
+def audio_cache(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'audio_cache')
+    monkeypatch.setattr(audio, 'AUDIO_CACHE_DIR', cache_dir)
+    return cache_dir
+
+
+@requires_ffmpeg
+def test_concurrent_transcodes_of_one_soundtrack(tmp_path, audio_cache):
+    audio_path = str(tmp_path / 'song.wav')
+    ffmpeg.input('sine=frequency=440:duration=2', f='lavfi').output(audio_path).run(quiet=True)
+    source = audio.AudioSource(audio_path, 2.0, 'pcm_s16le', file_digest(audio_path))
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        aac_paths = list(executor.map(lambda _: audio.transcode_aac(source), range(4)))
+    assert len(set(aac_paths)) == 1
+    assert os.listdir(audio_cache) == [os.path.basename(aac_paths[0])]
+    stderr = ffmpeg.input(aac_paths[0]).output('-', f='null').run(capture_stderr=True)[1].decode()
+    assert 'Audio: aac' in stderr
+
+
+def test_copy_mode_keeps_an_mp4_codec(tmp_path, audio_cache):
+    source = audio.AudioSource(str(tmp_path / 'song.m4a'), 2.0, 'aac', 'hash')
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert audio.prepare_audio(source, audio.AUDIO_COPY, executor).result() == source.path
+    assert not os.path.exists(audio_cache)
+
+
+def test_eviction_spares_the_kept_transcode(audio_cache):
+    os.makedirs(audio_cache)
+    paths = []
+    for index in range(3):
+        paths.append(os.path.join(audio_cache, f'{index}{audio.TRANSCODE_EXT}'))
+        with open(paths[-1], 'wb') as f:
+            f.write(b'x' * 100)
+        os.utime(paths[-1], (index, index))
+    partial_path = os.path.join(audio_cache, f'3.tmp{audio.PARTIAL_SUFFIX}')
+    open(partial_path, 'wb').close()
+
+    audio.evict_audio_cache(keep=paths[0], max_bytes=150)
+    assert sorted(os.listdir(audio_cache)) == sorted(os.path.basename(path) for path in (paths[0], partial_path))
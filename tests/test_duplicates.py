@@ -0,0 +1,78 @@
+import os
+import struct
+import zlib
+
+import numpy as np
+from PIL import Image
+
+import duplicates
+import image_index
+from duplicates import DuplicateCluster
+
+
+def indexed(name: str) -> image_index.IndexedImage:
+    return image_index.IndexedImage(f'/images/{name}', 0, 0, True, 'JPEG', 640, 480, None, None, None)
+
+
+def test_near_pairs_within_threshold():
+    hashes = np.array([0b0000, 0b0011, 0b1111_0000, 0b0111], dtype=np.uint64)
+    assert sorted(duplicates.near_pairs(hashes, 2)) == [(0, 1), (1, 3)]
+
+
+def test_chain_of_small_differences_is_not_one_cluster():
+    # 0~1 and 1~2 are near, 0 and 2 are not: complete linkage keeps 2 apart
+    assert duplicates.cluster_pairs(3, [(0, 1), (1, 2)]) == [[0, 1]]
+
+
+def test_clusters_of_mutual_neighbours():
+    pairs = [(0, 1), (0, 2), (1, 2), (3, 5)]
+    assert duplicates.cluster_pairs(6, pairs) == [[0, 1, 2], [3, 5]]
+
+
+def test_best_shot_takes_the_place_of_the_first():
+    images = [indexed(name) for name in ('a', 'b', 'c', 'd', 'e')]
+    clusters = [DuplicateCluster(images[3].path, [images[1].path, images[3].path])]
+    kept = duplicates.drop_duplicates(images, clusters)
+    assert [image.path for image in kept] == [images[0].path, images[3].path, images[2].path, images[4].path]
+
+
+def test_every_image_is_kept_at_most_once():
+    images = [indexed(name) for name in ('a', 'b', 'c', 'd')]
+    clusters = [DuplicateCluster(images[0].path, [images[0].path, images[2].path]),
+                DuplicateCluster(images[3].path, [images[1].path, images[3].path])]
+    kept = duplicates.drop_duplicates(images, clusters)
+    assert [image.path for image in kept] == [images[0].path, images[3].path]
+
+
+def png_header(width: int, height: int) -> bytes:
+    # a PNG of which only the header is there, enough for Pillow to refuse it by its size
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    chunk = b'IHDR' + header
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', len(header)) + chunk + struct.pack('>I', zlib.crc32(chunk))
+
+
+def test_table_popcount_matches_bitwise_count(monkeypatch):
+    values = np.random.default_rng(0).integers(0, 1 << 63, size=(4, 50), dtype=np.int64).view(np.uint64)
+    expected = [[bin(int(value)).count('1') for value in row] for row in values]
+    assert duplicates.popcount(values).tolist() == expected
+    monkeypatch.delattr(duplicates.np, 'bitwise_count', raising=False)
+    assert duplicates.popcount(values).tolist() == expected
+
+
+def test_unreadable_images_are_kept_out_of_clusters(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_index, 'IMAGE_INDEX_DIR', str(tmp_path / 'image_index'))
+    images_dir = tmp_path / 'images'
+    images_dir.mkdir()
+    photo = Image.effect_mandelbrot((320, 240), (-2, -1.2, 1, 1.2), 100).convert('RGB')
+    photo.save(images_dir / 'a.jpg', quality=95)
+    photo.save(images_dir / 'b.jpg', quality=80)
+    # HEIC goes to the render through ffmpeg, Pillow has no decoder for it
+    (images_dir / 'c.heic').write_bytes(b'\x00\x00\x00\x18ftypheic\x00\x00\x00\x00mif1heic' + bytes(64))
+    (images_dir / 'd.png').write_bytes(png_header(70000, 70000))
+    images = [image_index.IndexedImage(str(images_dir / name), 0, 0, True, None, 320, 240, None, None, name)
+              for name in ('a.jpg', 'c.heic', 'b.jpg', 'd.png')]
+
+    clusters = duplicates.find_duplicates(str(images_dir), images)
+    assert [sorted(cluster.paths) for cluster in clusters] == [[images[0].path, images[2].path]]
+    kept = duplicates.drop_duplicates(images, clusters)
+    assert [os.path.basename(image.path) for image in kept] == ['a.jpg', 'c.heic', 'd.png']
@@ -0,0 +1,92 @@
+import os
+import time
+
+from PIL import Image
+
+import frame_cache
+import prenormalize
+import thumbnails
+from conftest import cross_device_replace
+from frame_cache import FrameCache
+
+
+def test_make_key_covers_every_setting():
+    base = FrameCache.make_key('abc', 1920, 1080, 'black', '.jpg')
+    assert base == FrameCache.make_key('abc', 1920, 1080, 'black', '.jpg')
+    others = [
+        FrameCache.make_key('abd', 1920, 1080, 'black', '.jpg'),
+        FrameCache.make_key('abc', 1280, 720, 'black', '.jpg'),
+        FrameCache.make_key('abc', 1920, 1080, 'white', '.jpg'),
+        FrameCache.make_key('abc', 1920, 1080, 'black', '.png'),
+        FrameCache.make_key('abc', 1920, 1080, 'black', '.jpg', 'draft'),
+    ]
+    assert len({base, *others}) == len(others) + 1
+
+
+def test_store_then_lookup(tmp_path):
+    cache = FrameCache(str(tmp_path / 'cache'))
+    key = FrameCache.make_key('abc', 64, 36, 'black', '.jpg')
+    assert cache.lookup(key, '.jpg') is None
+    entry_path = cache.new_entry_path('.jpg')
+    with open(entry_path, 'wb') as f:
+        f.write(b'frame')
+    stored = cache.store(key, '.jpg', entry_path)
+    assert cache.lookup(key, '.jpg') == stored
+    assert not os.path.exists(entry_path)
+
+
+def test_disabled_cache_never_hits(tmp_path):
+    cache = FrameCache(str(tmp_path / 'cache'), enabled=False)
+    key = FrameCache.make_key('abc', 64, 36, 'black', '.jpg')
+    cache.store(key, '.jpg', cache.new_entry_path('.jpg'))
+    assert cache.lookup(key, '.jpg') is None
+
+
+def test_evict_spares_kept_and_recent_entries(tmp_path):
+    cache = FrameCache(str(tmp_path / 'cache'), max_bytes=0)
+    paths = []
+    for index in range(3):
+        entry_path = cache.new_entry_path('.jpg')
+        with open(entry_path, 'wb') as f:
+            f.write(b'x' * 100)
+        paths.append(cache.store(FrameCache.make_key(str(index), 64, 36, 'black', '.jpg'), '.jpg', entry_path))
+    old = time.time() - frame_cache.RECENT_USE_S - 60
+    for path in paths[:2]:
+        os.utime(path, (old, old))
+
+    assert cache.evict(keep={paths[0]}) == 1
+    assert os.path.exists(paths[0])
+    assert not os.path.exists(paths[1])
+    assert os.path.exists(paths[2])
+
+
+def test_thumbnails_are_spared_only_briefly(tmp_path, monkeypatch):
+    monkeypatch.setattr(thumbnails, 'THUMBNAIL_CACHE_DIR', str(tmp_path / 'thumbnails'))
+    monkeypatch.setattr(thumbnails, 'THUMBNAIL_CACHE_MAX_BYTES', 0)
+    cache = thumbnails.thumbnail_cache()
+    entry_path = cache.new_entry_path('.jpg')
+    with open(entry_path, 'wb') as f:
+        f.write(b'x' * 100)
+    path = cache.store(FrameCache.make_key('abc', 128, 128, 'black', '.jpg'), '.jpg', entry_path)
+    # well inside the window of the normalized frames
+    an_hour_ago = time.time() - 3600
+    os.utime(path, (an_hour_ago, an_hour_ago))
+
+    assert cache.evict() == 1
+    assert not os.path.exists(path)
+
+
+def test_normalized_frame_stored_across_devices(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    monkeypatch.setattr(frame_cache.os, 'replace', cross_device_replace(os.replace, cache_dir))
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+    source_path = str(tmp_path / 'source.png')
+    Image.new('RGB', (120, 80), 'red').save(source_path)
+    cache = FrameCache(cache_dir)
+
+    path, hit = prenormalize.normalize_cached(source_path, str(work_dir / 'frame.jpg'), 64, 36, 'black', cache)
+    assert not hit
+    assert os.path.commonpath([path, cache_dir]) == cache_dir
+    assert prenormalize.normalize_cached(source_path, str(work_dir / 'frame.jpg'), 64, 36, 'black', cache) == (
+        path, True)
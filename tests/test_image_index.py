@@ -0,0 +1,63 @@
+import os
+
+from PIL import Image
+
+import image_index
+from frame_cache import file_digest
+
+
+def indexed(name: str, captured_at=None) -> image_index.IndexedImage:
+    return image_index.IndexedImage(f'/images/{name}', 0, 0, True, 'JPEG', 64, 48, None, captured_at, None)
+
+
+def test_scan_reads_sizes_and_flags_invalid_files(tmp_path):
+    images_dir = tmp_path / 'images'
+    images_dir.mkdir()
+    Image.new('RGB', (64, 48), 'red').save(images_dir / 'b.png')
+    (images_dir / 'notes.txt').write_text('not an image')
+
+    with image_index.ImageIndex(str(images_dir), str(tmp_path / 'index.sqlite3')) as index:
+        by_name = {os.path.basename(image.path): image for image in index.scan()}
+    assert (by_name['b.png'].format, by_name['b.png'].width, by_name['b.png'].height) == ('PNG', 64, 48)
+    assert by_name['b.png'].content_hash == file_digest(str(images_dir / 'b.png'))
+    assert not by_name['notes.txt'].valid
+
+
+def test_rescan_keeps_unchanged_rows(tmp_path):
+    images_dir = tmp_path / 'images'
+    images_dir.mkdir()
+    Image.new('RGB', (64, 48), 'red').save(images_dir / 'a.png')
+    db_path = str(tmp_path / 'index.sqlite3')
+    with image_index.ImageIndex(str(images_dir), db_path) as index:
+        first_hash = index.scan()[0].content_hash
+
+    Image.new('RGB', (64, 48), 'green').save(images_dir / 'b.png')
+    with image_index.ImageIndex(str(images_dir), db_path) as index:
+        images = {os.path.basename(image.path): image for image in index.scan()}
+    assert images['a.png'].content_hash == first_hash
+    assert images['b.png'].content_hash == file_digest(str(images_dir / 'b.png'))
+
+
+def test_images_sort_by_natural_name_or_capture_time():
+    images = [indexed('b.jpg'), indexed('a10.jpg', '2024:01:02 10:00:00'), indexed('a9.jpg'),
+              indexed('c.jpg', '2023:12:31 08:00:00')]
+    by_name = image_index.sort_images(images)
+    assert [os.path.basename(image.path) for image in by_name] == ['a9.jpg', 'a10.jpg', 'b.jpg', 'c.jpg']
+    by_time = image_index.sort_images(images, image_index.ORDER_CAPTURE_TIME)
+    assert [os.path.basename(image.path) for image in by_time] == ['c.jpg', 'a10.jpg', 'a9.jpg', 'b.jpg']
+
+
+def test_header_scan_leaves_hashing_for_later(tmp_path):
+    images_dir = tmp_path / 'images'
+    images_dir.mkdir()
+    Image.new('RGB', (64, 48), 'red').save(images_dir / 'a.png')
+    (images_dir / 'notes.txt').write_text('not an image')
+
+    with image_index.ImageIndex(str(images_dir), str(tmp_path / 'index.sqlite3')) as index:
+        images = index.scan(hash_contents=False)
+        assert [image.content_hash for image in images] == [None, None]
+        assert {image.width for image in images} == {64, None}
+        index.hash_contents()
+        by_name = {os.path.basename(image.path): image for image in index.images()}
+    assert by_name['a.png'].content_hash == file_digest(str(images_dir / 'a.png'))
+    assert by_name['notes.txt'].content_hash is None
@@ -0,0 +1,123 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import frame_cache
+import image_index
+import ingest
+import render_control
+from conftest import cross_device_replace
+from frame_cache import FrameCache
+
+
+def gradient(size: tuple[int, int], mode: str = 'RGB') -> Image.Image:
+    width, height = size
+    x, y = np.meshgrid(np.arange(width), np.arange(height))
+    pixels = np.stack([x * 255 // width, y * 255 // height, (x + y) % 256], axis=-1).astype(np.uint8)
+    return Image.fromarray(pixels, 'RGB').convert(mode)
+
+
+def indexed(path: str, width: int, height: int) -> image_index.IndexedImage:
+    return image_index.IndexedImage(path, 0, 0, True, None, width, height, None, None, None)
+
+
+def test_reservation_larger_than_the_budget_runs_alone():
+    budget = ingest.MemoryBudget(100)
+    with budget.reserve(1000):
+        assert budget.available == 0
+    assert budget.available == 100
+
+
+def test_reservations_wait_for_each_other():
+    budget = ingest.MemoryBudget(100)
+    entered = threading.Event()
+
+    def reserve_rest():
+        with budget.reserve(60):
+            entered.set()
+
+    with budget.reserve(60):
+        waiter = threading.Thread(target=reserve_rest)
+        waiter.start()
+        assert not entered.wait(0.2)
+    waiter.join(5)
+    assert entered.is_set()
+    assert budget.available == 100
+
+
+def test_worker_limit_follows_the_largest_decode():
+    images = [indexed('a', 4000, 3000), indexed('b', 1000, 1000), indexed('c', None, None)]
+    assert ingest.worker_limit(images, image_budget_mb=256, memory_budget_mb=1024) == 1024 * ingest.MB // (
+        4000 * 3000 * ingest.BYTES_PER_PIXEL)
+    # sources above the per-image budget are reduced before a worker decodes them
+    assert ingest.worker_limit([indexed('a', 20000, 20000)], image_budget_mb=256, memory_budget_mb=1024) == 4
+    assert ingest.worker_limit([], image_budget_mb=256, memory_budget_mb=1024) == 1024
+
+
+def test_reduction_keeps_the_shown_size():
+    # a 4:3 source is shown 1440x1080 inside a 1080p frame
+    assert ingest.reduction_factor(8000, 6000, 1920, 1080) == 5
+    assert ingest.reduction_factor(8000, 6000, 1920, 1080) * 1080 <= 6000
+    assert ingest.reduction_factor(1000, 800, 1920, 1080) == 1
+
+
+@pytest.mark.parametrize('extension, mode', [('.bmp', 'RGB'), ('.ppm', 'RGB'), ('.tif', 'RGBA'), ('.pgm', 'L')])
+def test_banded_reduction_matches_a_full_decode(tmp_path, monkeypatch, extension, mode):
+    # small bands, so the source is read in many of them, BMP stores its rows bottom-up
+    monkeypatch.setattr(ingest, 'BAND_BYTES', 4096)
+    source_path = str(tmp_path / f'source{extension}')
+    gradient((203, 157), mode).save(source_path)
+
+    with ingest.open_source(source_path) as image:
+        layout = ingest.raw_layout(image)
+        assert layout is not None
+        banded = ingest.reduce_in_bands(source_path, image, layout, 3)
+        full = ingest.reduce_image(image, 3)
+    assert banded.size == full.size == (68, 53)
+    assert banded.tobytes() == full.tobytes()
+
+
+def test_reduced_source_is_upright(tmp_path):
+    source_path = str(tmp_path / 'rotated.jpg')
+    exif = Image.Exif()
+    exif[image_index.EXIF_ORIENTATION] = 6
+    gradient((800, 400)).save(source_path, exif=exif)
+    assert ingest.open_reduced(source_path, 100, 200).size == (100, 200)
+
+
+def test_only_oversized_sources_are_reduced(tmp_path):
+    small_path, large_path = str(tmp_path / 'small.png'), str(tmp_path / 'large.png')
+    gradient((100, 100)).save(small_path)
+    gradient((1200, 900)).save(large_path)
+    images = [indexed(small_path, 100, 100), indexed(large_path, 1200, 900)]
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+
+    paths = ingest.ingest_images(images, str(work_dir), 300, 200, image_budget_mb=1, memory_budget_mb=8)
+    assert paths[0] == small_path
+    assert paths[1] == ingest.proxy_path(str(work_dir), 1)
+    with Image.open(paths[1]) as proxy:
+        assert proxy.size == (300, 225)
+
+
+def test_budgets_must_be_positive(tmp_path):
+    with pytest.raises(ValueError):
+        ingest.ingest_images([], str(tmp_path), 300, 200, image_budget_mb=0)
+
+
+def test_proxy_stored_across_devices(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    monkeypatch.setattr(frame_cache.os, 'replace', cross_device_replace(frame_cache.os.replace, cache_dir))
+    source_path = str(tmp_path / 'source.png')
+    gradient((400, 300)).save(source_path)
+    cache = FrameCache(cache_dir)
+
+    path, hit = ingest.proxy_cached(indexed(source_path, 400, 300), str(tmp_path / 'proxy.jpg'), 100, 75,
+                                    ingest.MemoryBudget(ingest.MB), cache, render_control.RenderControl())
+    assert not hit
+    assert os.path.commonpath([path, cache_dir]) == cache_dir
+    with Image.open(path) as proxy:
+        assert proxy.size == (100, 75)
@@ -0,0 +1,11 @@
+import metrics
+
+
+def test_stage_memory_is_named_as_the_peak_so_far():
+    render_metrics = metrics.RenderMetrics(output='show.mp4')
+    with render_metrics.stage('encode'):
+        pass
+    report = render_metrics.report()
+    assert {'peak_rss_so_far_mb', 'children_peak_rss_so_far_mb'} <= report['stages'][0].keys()
+    assert 'peak_rss_mb' not in report['stages'][0]
+    assert {'peak_rss_mb', 'children_peak_rss_mb'} <= report['total'].keys()
@@ -0,0 +1,122 @@
+import os
+
+import ffmpeg
+import pytest
+from PIL import Image
+
+import encode_profiles
+import image_index
+import image_scan
+import placement
+from conftest import requires_ffmpeg
+
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_index, 'IMAGE_INDEX_DIR', str(tmp_path / 'image_index'))
+
+
+def make_tone(audio_path: str, duration: float):
+    ffmpeg.input(f'sine=frequency=440:duration={duration}', f='lavfi').output(audio_path).run(quiet=True)
+
+
+def slide_channels(video_path: str) -> list[int]:
+    # the strongest color channel of each run of frames, every slide is one solid color
+    pixels, _ = ffmpeg.input(video_path).output('pipe:', f='rawvideo', pix_fmt='rgb24', s='4x2').run(
+        capture_stdout=True, quiet=True)
+    frames = [pixels[start:start + 24] for start in range(0, len(pixels), 24)]
+    channels = [max(range(3), key=lambda channel: sum(frame[channel::3])) for frame in frames]
+    return [channel for index, channel in enumerate(channels) if not index or channel != channels[index - 1]]
+
+
+def test_format_is_read_from_the_content(tmp_path):
+    misnamed_path = str(tmp_path / 'photo.jpg')
+    Image.new('RGB', (32, 32), 'red').save(misnamed_path, 'WEBP')
+    assert placement.image_format_key(misnamed_path) == 'WEBP'
+    assert placement.image_format_key(misnamed_path, 'mpo') == 'JPEG'
+    # an unreadable file falls back to its name
+    assert placement.image_format_key(str(tmp_path / 'missing.png')) == 'image/png'
+
+
+def test_images_of_one_format_are_not_converted(tmp_path):
+    images_path_arr = []
+    for index in range(3):
+        images_path_arr.append(str(tmp_path / f'{index}.jpg'))
+        Image.new('RGB', (32, 32), 'red').save(images_path_arr[-1], 'JPEG')
+    assert placement.unify_image_formats(images_path_arr, str(tmp_path)) == images_path_arr
+
+
+@requires_ffmpeg
+def test_misnamed_image_is_converted_to_the_dominant_format(tmp_path):
+    images_path_arr = []
+    for index, image_format in enumerate(('JPEG', 'WEBP', 'JPEG')):
+        images_path_arr.append(str(tmp_path / f'{index}.jpg'))
+        Image.new('RGB', (32, 32), 'red').save(images_path_arr[-1], image_format)
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+
+    unified = placement.unify_image_formats(images_path_arr, str(work_dir))
+    assert unified[0] == images_path_arr[0] and unified[2] == images_path_arr[2]
+    assert os.path.dirname(unified[1]) == str(work_dir)
+    with open(unified[1], 'rb') as f:
+        assert image_scan.sniff_format(f.read(image_scan.HEADER_SIZE)) == 'JPEG'
+
+
+def test_slide_frames_add_up_to_the_timeline():
+    frame_counts = placement.slide_frame_counts(7, 10 / 7, 25)
+    assert sum(frame_counts) == 250
+    assert max(frame_counts) - min(frame_counts) <= 1
+
+
+def test_segments_cover_every_slide_once():
+    assert placement.split_segments(10, 3) == [(0, 3), (3, 6), (6, 10)]
+    assert placement.split_segments(2, 5) == [(0, 1), (1, 2)]
+
+
+def test_empty_folder_is_rejected(tmp_path, index_dir):
+    images_dir = tmp_path / 'images'
+    images_dir.mkdir()
+    (images_dir / 'notes.txt').write_text('not an image')
+    with pytest.raises(ValueError, match='No images'):
+        placement.create_slideshow(str(images_dir), str(tmp_path / 'song.mp3'), str(tmp_path / 'show.mp4'),
+                                   progress_callback=lambda *args: None)
+    assert not os.path.exists(tmp_path / 'show.mp4')
+
+
+@requires_ffmpeg
+def test_slideshow_with_a_misnamed_image(tmp_path, index_dir, monkeypatch):
+    monkeypatch.setattr(placement.audio, 'AUDIO_CACHE_DIR', str(tmp_path / 'audio_cache'))
+    images_dir = tmp_path / 'images'
+    images_dir.mkdir()
+    for index, image_format in enumerate(('JPEG', 'WEBP', 'JPEG')):
+        Image.new('RGB', (320, 240), ('red', 'green', 'blue')[index]).save(images_dir / f'{index}.jpg', image_format)
+    audio_path = str(tmp_path / 'song.wav')
+    make_tone(audio_path, 1.5)
+    output_path = str(tmp_path / 'show.mp4')
+
+    placement.create_slideshow(str(images_dir), audio_path, output_path, progress_callback=lambda *args: None,
+                               encode_profile=encode_profiles.PROFILE_FAST, frame_cache=False)
+    # a slide the concat demuxer cannot decode is missing from the video
+    assert slide_channels(output_path) == [0, 1, 2]
+
+
+@requires_ffmpeg
+@pytest.mark.parametrize('options', [
+    {}, {'encode_profile': encode_profiles.PROFILE_FAST},
+    {'encode_profile': encode_profiles.PROFILE_FAST, 'segments': 3},
+    {'encode_profile': encode_profiles.PROFILE_FAST, 'stream': 'fmp4'},
+])
+def test_reported_length_is_the_length_of_the_output(tmp_path, index_dir, monkeypatch, options):
+    monkeypatch.setattr(placement.audio, 'AUDIO_CACHE_DIR', str(tmp_path / 'audio_cache'))
+    images_dir = tmp_path / 'images'
+    images_dir.mkdir()
+    for index, color in enumerate(('red', 'green', 'blue', 'white')):
+        Image.new('RGB', (320, 240), color).save(images_dir / f'{index}.jpg')
+    audio_path = str(tmp_path / 'song.wav')
+    make_tone(audio_path, 3.3)
+    output_path = str(tmp_path / 'show.mp4')
+
+    report = placement.create_slideshow(str(images_dir), audio_path, output_path, progress_callback=lambda *args: None,
+                                        frame_cache=False, **options)
+    assert report['slideshow_length'] == pytest.approx(float(ffmpeg.probe(output_path)['format']['duration']),
+                                                       abs=0.01)
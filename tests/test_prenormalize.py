@@ -0,0 +1,55 @@
+import os
+
+from PIL import Image
+
+import image_index
+import prenormalize
+
+
+def test_frame_is_padded_to_the_output_size(tmp_path):
+    source_path = str(tmp_path / 'portrait.png')
+    Image.new('RGB', (300, 600), 'red').save(source_path)
+    target_path = prenormalize.normalize_image(source_path, str(tmp_path / 'frame.jpg'), 320, 180)
+    with Image.open(target_path) as frame:
+        assert frame.size == (320, 180)
+        assert frame.getpixel((160, 90))[0] > 200
+        assert frame.getpixel((5, 90)) == (0, 0, 0)
+
+
+def test_frame_is_upright(tmp_path):
+    source_path = str(tmp_path / 'rotated.jpg')
+    exif = Image.Exif()
+    exif[image_index.EXIF_ORIENTATION] = 6
+    Image.new('RGB', (600, 300), 'red').save(source_path, exif=exif)
+    target_path = prenormalize.normalize_image(source_path, str(tmp_path / 'frame.jpg'), 180, 320)
+    with Image.open(target_path) as frame:
+        # upright the source is 300x600, it fills the height of the frame with a 10 px border on each side
+        assert frame.getpixel((90, 2))[0] > 200
+        assert frame.getpixel((2, 160)) == (0, 0, 0)
+
+
+def test_source_above_pillows_pixel_limit_is_normalized(tmp_path, monkeypatch):
+    source_path = str(tmp_path / 'large.png')
+    Image.new('RGB', (300, 600), 'red').save(source_path)
+    # Pillow refuses to open an image of more than twice its limit, the 320x180 frame is within it
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 60000)
+    target_path = prenormalize.normalize_image(source_path, str(tmp_path / 'frame.jpg'), 320, 180)
+    assert Image.MAX_IMAGE_PIXELS == 60000
+    with Image.open(target_path) as frame:
+        assert frame.size == (320, 180)
+
+
+def test_frames_keep_the_slide_order(tmp_path):
+    images_path_arr = []
+    for index, color in enumerate(('red', 'green', 'blue')):
+        images_path_arr.append(str(tmp_path / f'{index}.png'))
+        Image.new('RGB', (64, 48), color).save(images_path_arr[-1])
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+
+    frames_path_arr = prenormalize.prenormalize_images(images_path_arr, str(work_dir), 64, 48, workers=2)
+    assert frames_path_arr == [prenormalize.frame_path(str(work_dir), index) for index in range(3)]
+    for frame_path, channel in zip(frames_path_arr, range(3)):
+        with Image.open(frame_path) as frame:
+            assert max(range(3), key=frame.getpixel((32, 24)).__getitem__) == channel
+    assert all(os.path.isfile(frame_path) for frame_path in frames_path_arr)
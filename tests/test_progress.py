@@ -0,0 +1,58 @@
+import socket
+import threading
+
+import progress
+
+
+def feed(lines: list[str], final_duration: float) -> tuple[list[int], list[progress.ProgressEvent], dict]:
+    percents, events, state = [], [], {}
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('localhost', 0))
+        sock.listen(1)
+        parser = threading.Thread(target=progress.progress_parser,
+                                  args=(sock, final_duration, percents.append, state, events.append))
+        parser.start()
+        with socket.create_connection(sock.getsockname()) as client:
+            client.sendall(''.join(f'{line}\n' for line in lines).encode())
+        parser.join()
+    return percents, events, state
+
+
+def test_make_event_reads_ffmpeg_values():
+    event = progress.make_event({'out_time_us': '5000000', 'frame': '125', 'fps': '50.0', 'speed': '2.5x',
+                                 'bitrate': '1200.5kbits/s', 'total_size': '1048576'}, False, 20.0)
+    assert event.percent == 25
+    assert event.out_time == 5.0
+    assert event.frame == 125
+    assert event.speed == 2.5
+    assert event.bitrate_kbps == 1200.5
+    assert event.total_size == 1048576
+    assert event.eta == 6.0
+    assert not event.ended
+
+
+def test_make_event_falls_back_to_out_time_ms():
+    # ffmpeg versions without out_time_us put the microseconds into out_time_ms
+    assert progress.make_event({'out_time_ms': '2000000'}, False, 4.0).out_time == 2.0
+
+
+def test_unknown_values_are_empty():
+    event = progress.make_event({'speed': 'N/A', 'bitrate': ''}, False, 0.0)
+    assert event.percent == 0
+    assert event.speed is None
+    assert event.bitrate_kbps is None
+    assert event.eta is None
+
+
+def test_parser_keeps_last_known_values_and_ends_at_100():
+    lines = [
+        'frame=50', 'out_time_us=2000000', 'speed=1.0x', 'progress=continue',
+        'frame=100', 'out_time_us=N/A', 'speed=N/A', 'progress=continue',
+        'out_time_us=10000000', 'progress=end',
+    ]
+    percents, events, state = feed(lines, 10.0)
+    assert percents == [20, 100]
+    assert events[0].frame == 50
+    assert events[-1].ended and events[-1].percent == 100 and events[-1].eta == 0.0
+    assert state['last_event'].frame == 100
+    assert state['last_event'].speed == 1.0
@@ -0,0 +1,29 @@
+import io
+import json
+import threading
+from urllib.error import HTTPError
+
+import render_daemon
+from render_control import RenderControl
+
+
+def test_terminate_while_the_control_is_locked_cancels_once_it_is_free():
+    control = RenderControl()
+    terminated = threading.Event()
+    canceller = threading.Thread(target=render_daemon.cancel_when_set, args=(terminated, control), daemon=True)
+    canceller.start()
+    with control.lock:
+        # what the SIGTERM handler does, it returns at once even though the render holds the lock
+        terminated.set()
+        canceller.join(0.2)
+        assert not control.cancelled.is_set()
+    canceller.join(5)
+    assert control.cancelled.is_set()
+
+
+def test_rejection_message_reads_the_error_of_the_reply():
+    body = io.BytesIO(json.dumps({'error': 'bad job: audio'}).encode())
+    assert render_daemon.rejection_message(HTTPError('http://daemon/jobs', 400, 'Bad Request', {}, body)) == (
+        'bad job: audio')
+    unexplained = HTTPError('http://daemon/jobs', 401, 'Unauthorized', {}, io.BytesIO(b'denied'))
+    assert render_daemon.rejection_message(unexplained) == str(unexplained)
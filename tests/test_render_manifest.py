@@ -0,0 +1,45 @@
+import os
+
+import render_manifest
+
+SETTINGS = {'codec': 'libx264', 'crf': 23}
+
+
+def test_fingerprint_depends_on_sources_frames_and_settings():
+    base = render_manifest.segment_fingerprint(['a', 'b'], [25, 25], SETTINGS)
+    assert base == render_manifest.segment_fingerprint(['a', 'b'], [25, 25], dict(reversed(SETTINGS.items())))
+    assert base != render_manifest.segment_fingerprint(['a', 'c'], [25, 25], SETTINGS)
+    assert base != render_manifest.segment_fingerprint(['a', 'b'], [25, 26], SETTINGS)
+    assert base != render_manifest.segment_fingerprint(['a', 'b'], [25, 25], {**SETTINGS, 'crf': 20})
+
+
+def test_manifest_round_trip(tmp_path):
+    output_path = str(tmp_path / 'show.mp4')
+    assert render_manifest.load_manifest(output_path) == {}
+    render_manifest.save_manifest(output_path, {'images_count': 3, 'audio_length': 9.5})
+    manifest = render_manifest.load_manifest(output_path)
+    assert manifest['images_count'] == 3
+    assert not render_manifest.timeline_changed(manifest, 3, 9.5)
+    assert render_manifest.timeline_changed(manifest, 4, 9.5)
+    assert render_manifest.timeline_changed(manifest, 3, 10.0)
+
+
+def test_manifest_of_another_version_is_ignored(tmp_path):
+    output_path = str(tmp_path / 'show.mp4')
+    with open(render_manifest.manifest_path(output_path), 'w', encoding='utf-8') as f:
+        f.write('{"version": 0, "images_count": 3}')
+    assert render_manifest.load_manifest(output_path) == {}
+
+
+def test_only_rendered_segments_are_reused(tmp_path):
+    output_path = str(tmp_path / 'show.mp4')
+    segment_dir = render_manifest.segments_dir(output_path)
+    os.makedirs(segment_dir)
+    kept, stale, missing = (render_manifest.segment_fingerprint([name], [25], SETTINGS) for name in 'abc')
+    for fingerprint in (kept, stale):
+        with open(os.path.join(segment_dir, render_manifest.segment_file_name(fingerprint)), 'wb') as f:
+            f.write(b'segment')
+
+    assert render_manifest.reusable_segments(output_path, [kept, missing]) == {kept}
+    render_manifest.remove_stale_segments(output_path, [kept, missing])
+    assert os.listdir(segment_dir) == [render_manifest.segment_file_name(kept)]
@@ -0,0 +1,95 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import slideshow_batch
+from slideshow_batch import RenderJob
+
+
+@pytest.fixture
+def machine(monkeypatch):
+    def configure(cores: int, memory_mb):
+        monkeypatch.setattr(slideshow_batch.os, 'cpu_count', lambda: cores)
+        monkeypatch.setattr(slideshow_batch, 'total_memory_mb', lambda: memory_mb)
+    return configure
+
+
+def test_concurrency_fits_the_cores(machine):
+    machine(8, None)
+    assert slideshow_batch.plan_concurrency(20) == (8, 1)
+    assert slideshow_batch.plan_concurrency(2) == (2, 4)
+    assert slideshow_batch.plan_concurrency(20, max_jobs=3) == (3, 2)
+    assert slideshow_batch.plan_concurrency(20, threads=4) == (2, 4)
+
+
+def test_concurrency_fits_the_memory(machine):
+    machine(16, 3 * slideshow_batch.JOB_MEMORY_MB + 100)
+    assert slideshow_batch.plan_concurrency(20) == (3, 5)
+    assert slideshow_batch.plan_concurrency(20, job_memory_mb=512) == (6, 2)
+
+
+def test_concurrency_never_drops_below_one(machine):
+    machine(1, 100)
+    assert slideshow_batch.plan_concurrency(5, threads=4) == (1, 4)
+    assert slideshow_batch.plan_concurrency(0) == (1, 1)
+
+
+def test_manifest_options_override_the_shared_ones(tmp_path):
+    manifest_path = tmp_path / 'batch.json'
+    manifest_path.write_text(json.dumps({
+        'options': {'encode_profile': 'fast', 'crf': 23},
+        'jobs': [
+            {'project': 'albums/summer', 'options': {'crf': 18}},
+            {'images': 'pics', 'audio': 'song.mp3', 'output': 'out.mp4'},
+        ],
+    }), encoding='utf-8')
+    project, explicit = slideshow_batch.load_manifest(str(manifest_path))
+    assert project.output_path == str(tmp_path / 'albums' / 'summer' / 'albums_summer.mp4')
+    assert project.images_dir == str(tmp_path / 'albums' / 'summer' / 'images')
+    assert project.options == {'encode_profile': 'fast', 'crf': 18}
+    assert explicit == RenderJob(str(tmp_path / 'pics'), str(tmp_path / 'song.mp3'), str(tmp_path / 'out.mp4'),
+                                 {'encode_profile': 'fast', 'crf': 23})
+
+
+def test_option_digest_ignores_key_order():
+    assert slideshow_batch.options_digest({'a': 1, 'b': 2}) == slideshow_batch.options_digest({'b': 2, 'a': 1})
+    assert slideshow_batch.options_digest(None) == slideshow_batch.options_digest({})
+    assert slideshow_batch.options_digest({'a': 1}) != slideshow_batch.options_digest({'a': 2})
+
+
+def test_output_is_up_to_date_only_with_the_same_options(tmp_path):
+    images_dir = tmp_path / 'images'
+    images_dir.mkdir()
+    (images_dir / '1.jpg').write_bytes(b'jpeg')
+    audio_path = tmp_path / 'song.mp3'
+    audio_path.write_bytes(b'mp3')
+    output_path = tmp_path / 'show.mp4'
+    job = RenderJob(str(images_dir), str(audio_path), str(output_path), {'crf': 20})
+    assert not slideshow_batch.is_up_to_date(job)
+
+    output_path.write_bytes(b'mp4')
+    later = time.time() + 10
+    os.utime(output_path, (later, later))
+    # an output rendered before its options were recorded is rendered again
+    assert not slideshow_batch.is_up_to_date(job)
+    slideshow_batch.record_options(job)
+    assert slideshow_batch.is_up_to_date(job)
+    assert not slideshow_batch.is_up_to_date(job._replace(options={'crf': 18}))
+
+    newer = later + 10
+    os.utime(audio_path, (newer, newer))
+    assert not slideshow_batch.is_up_to_date(job)
+
+
+def test_reading_projects_leaves_the_engine_unloaded():
+    # the GUI picks projects and starts watches with these on its own thread
+    loaded = subprocess.run(
+        [sys.executable, '-c', 'import sys, slideshow_batch, watch; '
+                               'print(*sorted({"ffmpeg", "numpy", "placement", "PIL"} & set(sys.modules)))'],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), capture_output=True, text=True, check=True
+    ).stdout.split()
+    assert loaded == []
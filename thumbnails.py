@@ -0,0 +1,55 @@
+import hashlib
+import logging
+import os
+
+from frame_cache import FrameCache
+from talelle_setup import TALELLE_DIR
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_CACHE_DIR = os.path.join(TALELLE_DIR, 'thumbnails')
+THUMBNAIL_CACHE_MAX_BYTES = 256 * 1024 ** 2
+# no render lists thumbnails, only one just made and not yet shown needs sparing, so browsing many folders
+# cannot grow the cache past its cap for hours
+THUMBNAIL_RECENT_USE_S = 60
+THUMBNAIL_SIZE = 128
+THUMBNAIL_EXT = '.jpg'
+THUMBNAIL_QUALITY = 85
+
+
+def thumbnail_cache() -> FrameCache:
+    return FrameCache(THUMBNAIL_CACHE_DIR, THUMBNAIL_CACHE_MAX_BYTES, recent_use_s=THUMBNAIL_RECENT_USE_S)
+
+
+def thumbnail_key(content_hash: str, mtime_ns: int, size: int) -> str:
+    return hashlib.blake2b(f'{content_hash}:{mtime_ns}:{size}'.encode(), digest_size=20).hexdigest()
+
+
+def make_thumbnail(source_path: str, target_path: str, size: int = THUMBNAIL_SIZE) -> str:
+    # the GUI imports this module at startup, Pillow is only loaded once a thumbnail is actually made
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as image:
+        # a JPEG is decoded straight at a fraction of its size, most of a large photo is never read into memory
+        image.draft('RGB', (size, size))
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.thumbnail((size, size), Image.Resampling.BICUBIC)
+    image.save(target_path, quality=THUMBNAIL_QUALITY)
+    return target_path
+
+
+def cached_thumbnail(source_path: str, content_hash: str, mtime_ns: int, cache: FrameCache,
+                     size: int = THUMBNAIL_SIZE) -> str:
+    key = thumbnail_key(content_hash, mtime_ns, size)
+    if cached_path := cache.lookup(key, THUMBNAIL_EXT):
+        return cached_path
+
+    target_path = cache.new_entry_path(THUMBNAIL_EXT)
+    try:
+        make_thumbnail(source_path, target_path, size)
+    except Exception:
+        os.remove(target_path)
+        raise
+    return cache.store(key, THUMBNAIL_EXT, target_path)
@@ -0,0 +1,263 @@
+import argparse
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from typing import Callable, Optional
+
+import render_control
+import slideshow_batch
+
+logger = logging.getLogger(__name__)
+
+# quiet time after the last change before a render starts, a bulk copy keeps pushing it back
+DEBOUNCE_S = 2.0
+# a copy that never pauses still renders this long after its first change
+MAX_DELAY_S = 30.0
+POLL_INTERVAL_S = 1.0
+# re-renders keep the unchanged segments and the normalized frames of earlier renders
+WATCH_OPTIONS = {'incremental': True, 'prenormalize': True}
+
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_IGNORED = 0x8000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def input_fingerprint(job: slideshow_batch.RenderJob) -> str:
+    # names, sizes and mtimes of the inputs only, a render is worth starting whenever one of them changes
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        stat = os.stat(job.audio_path)
+        digest.update(f'{stat.st_size}:{stat.st_mtime_ns};'.encode())
+    except FileNotFoundError:
+        digest.update(b'missing;')
+    try:
+        entries = sorted(os.scandir(job.images_dir), key=lambda entry: entry.name)
+    except FileNotFoundError:
+        entries = []
+    for entry in entries:
+        if entry.is_file():
+            stat = entry.stat()
+            digest.update(f'{entry.name}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+    return digest.hexdigest()
+
+
+class PollingWatcher:
+    # compares the fingerprint every interval, works on every platform and on network shares
+    def __init__(self, job: slideshow_batch.RenderJob, interval: float = POLL_INTERVAL_S):
+        self.job = job
+        self.interval = interval
+        self.fingerprint = input_fingerprint(job)
+
+    def wait(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            fingerprint = input_fingerprint(self.job)
+            if fingerprint != self.fingerprint:
+                self.fingerprint = fingerprint
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    # the images folder and the folder of the audio file, which editors usually replace instead of rewriting
+    def __init__(self, job: slideshow_batch.RenderJob):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.add_watch = libc.inotify_add_watch
+        self.add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.images_dir = job.images_dir
+        self.audio_name = os.fsencode(os.path.basename(job.audio_path))
+        try:
+            self.audio_wd = self.watch(os.path.dirname(os.path.abspath(job.audio_path)))
+            self.images_wd = self.watch(job.images_dir)
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def watch(self, path: str) -> int:
+        wd = self.add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f'inotify_add_watch failed for {path}')
+        return wd
+
+    def rewatch_images(self) -> bool:
+        # the images folder was removed or replaced, its new copy is watched once it shows up
+        try:
+            self.images_wd = self.watch(self.images_dir)
+        except OSError:
+            return False
+        return True
+
+    def relevant(self, wd: int, name: bytes) -> bool:
+        # the output is written next to the audio file, only the audio file itself counts there
+        return wd == self.images_wd or (wd == self.audio_wd and name == self.audio_name)
+
+    def wait(self, timeout: float) -> bool:
+        if self.images_wd < 0 and self.rewatch_images():
+            return True
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        changed = False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, name_length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + name_length].rstrip(b'\0')
+                offset += name_length
+                changed = changed or self.relevant(wd, name)
+                if wd == self.images_wd and mask & IN_IGNORED:
+                    self.images_wd = -1
+
+    def close(self):
+        os.close(self.fd)
+
+
+def make_watcher(job: slideshow_batch.RenderJob, polling: bool = False):
+    if not polling:
+        try:
+            return InotifyWatcher(job)
+        except (OSError, AttributeError, TypeError) as e:
+            # no inotify outside Linux, or the watch limit is reached
+            logger.info(f'inotify is not available, polling instead: {e}')
+    return PollingWatcher(job)
+
+
+class ProjectWatcher:
+    def __init__(self, job: slideshow_batch.RenderJob, render: Callable[[slideshow_batch.RenderJob], None],
+                 debounce_s: float = DEBOUNCE_S, max_delay_s: float = MAX_DELAY_S, polling: bool = False,
+                 status_callback: Optional[Callable[[str], None]] = None):
+        self.job = job._replace(options={**WATCH_OPTIONS, **(job.options or {})})
+        self.render = render
+        self.debounce_s = debounce_s
+        self.max_delay_s = max_delay_s
+        self.polling = polling
+        self.status_callback = status_callback or (lambda status: None)
+        self.stop_event = threading.Event()
+        self.rendered_fingerprint = None
+
+    def stop(self):
+        self.stop_event.set()
+
+    def settle(self, watcher) -> bool:
+        # waits until the inputs have been quiet for the debounce time, so a burst of changes becomes one render
+        first_change = time.monotonic()
+        while not self.stop_event.is_set():
+            if time.monotonic() - first_change >= self.max_delay_s:
+                return True
+            if not watcher.wait(self.debounce_s):
+                return True
+        return False
+
+    def render_if_changed(self):
+        fingerprint = input_fingerprint(self.job)
+        if fingerprint == self.rendered_fingerprint:
+            logger.debug('inputs changed back, nothing to render')
+            return
+        if not os.path.isdir(self.job.images_dir) or not os.path.isfile(self.job.audio_path):
+            logger.info('waiting for the images folder and the audio file')
+            return
+        self.status_callback('creation')
+        try:
+            self.render(self.job)
+            self.rendered_fingerprint = fingerprint
+            slideshow_batch.record_options(self.job)
+        except render_control.RenderCancelled:
+            logger.info(f'Rendering {self.job.output_path} was cancelled')
+        except Exception:
+            # a half copied image can fail a render, the next change tries again
+            logger.exception(f'Rendering {self.job.output_path} failed')
+        self.status_callback('watching')
+
+    def run(self, render_first: bool = True):
+        watcher = make_watcher(self.job, self.polling)
+        logger.info(f'Watching {self.job.images_dir} and {self.job.audio_path} with {type(watcher).__name__}')
+        try:
+            if render_first and not (os.path.isdir(self.job.images_dir) and os.path.isfile(self.job.audio_path)
+                                     and slideshow_batch.is_up_to_date(self.job)):
+                self.render_if_changed()
+            else:
+                self.rendered_fingerprint = input_fingerprint(self.job)
+            self.status_callback('watching')
+            while not self.stop_event.is_set():
+                # the wait is short so that stop() is noticed quickly
+                if watcher.wait(min(self.debounce_s, 1.0)) and self.settle(watcher):
+                    # changes made during the render are picked up by the next wait
+                    self.render_if_changed()
+        finally:
+            watcher.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render a slideshow again whenever its images or audio change')
+    parser.add_argument('project', nargs='?', help='project folder laid out like the GUI expects it')
+    parser.add_argument('--images', help='images folder')
+    parser.add_argument('--audio', help='audio file')
+    parser.add_argument('--output', help='output file')
+    parser.add_argument('--images-folder', default=slideshow_batch.DEFAULT_IMAGES_FOLDER)
+    parser.add_argument('--options', default='{}', help='JSON render options passed to create_slideshow')
+    parser.add_argument('--threads', type=int, default=None, help='threads per render')
+    parser.add_argument('--debounce', type=float, default=DEBOUNCE_S, help='quiet seconds before a render')
+    parser.add_argument('--max-delay', type=float, default=MAX_DELAY_S, help='most seconds a render waits')
+    parser.add_argument('--poll', action='store_true', help='poll the inputs instead of using inotify')
+    parser.add_argument('--daemon', metavar='URL', help='submit the renders to a render daemon')
+    parser.add_argument('--log-level', default='INFO')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    options = json.loads(args.options)
+    if args.project:
+        job = slideshow_batch.project_job(args.project, args.images_folder, options)
+    elif args.images and args.audio and args.output:
+        job = slideshow_batch.RenderJob(args.images, args.audio, args.output, options)
+    else:
+        parser.error('give a project folder or --images, --audio and --output')
+
+    def render(watched_job: slideshow_batch.RenderJob):
+        result = slideshow_batch.run_job(watched_job, args.threads, force=True, daemon_url=args.daemon)
+        if result['status'] == slideshow_batch.STATUS_FAILED:
+            raise RuntimeError(result['error'])
+        logger.info(f"Rendered {watched_job.output_path} in {result['wall_s']} s")
+
+    watcher = ProjectWatcher(job, render, args.debounce, args.max_delay, args.poll)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()